@@ -46,6 +46,22 @@ ENCODER_NAME = CONFIG['face-recognition']['encoder']
 LABELS_PATH = '../' + CONFIG['face-recognition']['labels']
 EMBEDDINGS_PATH = '../' + CONFIG['face-recognition']['embeddings']
 INDEX_PATH = '../' + CONFIG['face-recognition']['index']
+BATCH_PIXELS = CONFIG['face-recognition'].get('batch-pixels', 18000000)
+FACE_BATCH_SIZE = CONFIG['face-recognition'].get('face-batch-size', 64)
+DETECTION_WIDTH = CONFIG['face-recognition'].get('detection-width')
+TRACK_INTERVAL = CONFIG['face-recognition'].get('track-interval', 0)
+CACHE_SIZE = CONFIG['face-recognition'].get('cache-size', 0)
+CACHE_PATH = CONFIG['face-recognition'].get('cache-path')
+CACHE_PATH = '../' + CACHE_PATH if CACHE_PATH else None
+DUPLICATE_THRESHOLD = CONFIG['face-recognition'].get('duplicate-threshold', 0)
+ALGORITHM = CONFIG['face-recognition']['algorithm']
+PROTOTYPES = CONFIG['face-recognition'].get('prototypes', 0)
+PROTOTYPE_DISTANCE = CONFIG['face-recognition'].get('prototype-distance', 0.1)
+INDEX_PARAMS = CONFIG['face-recognition'].get('index-params')
+QUERY_PARAMS = CONFIG['face-recognition'].get('query-params')
+ENCODER_BACKEND = CONFIG['face-recognition'].get('encoder-backend', 'tensorflow')
+PREFILTER = CONFIG['face-recognition'].get('prefilter')
+PREFILTER_WIDTH = CONFIG['face-recognition'].get('prefilter-width', 160)
 
 app = Flask(__name__)
 CORS(app, resources={r"/*": {"origins": "*"}})
@@ -67,7 +83,22 @@ api = FlaskApi(
     ENCODER_NAME,
     LABELS_PATH,
     EMBEDDINGS_PATH,
-    INDEX_PATH
+    INDEX_PATH,
+    BATCH_PIXELS,
+    FACE_BATCH_SIZE,
+    DETECTION_WIDTH,
+    TRACK_INTERVAL,
+    CACHE_SIZE,
+    CACHE_PATH,
+    DUPLICATE_THRESHOLD,
+    ALGORITHM,
+    PROTOTYPES,
+    PROTOTYPE_DISTANCE,
+    INDEX_PARAMS,
+    QUERY_PARAMS,
+    ENCODER_BACKEND,
+    PREFILTER,
+    PREFILTER_WIDTH
 )
 
 
@@ -4,7 +4,7 @@ from src.knowledge_graph.graph import Graph
 from src.data.youtube import download_youtube_video
 from src.models.approximate_k_nearest_neighbors import ApproximateKNearestNeighbors
 from src.models.face_recognition import FaceRecognition
-from src.postprocessing.graph_postprocessing import extract_scenes
+from src.postprocessing.graph_postprocessing import SceneExtractor
 
 
 class FlaskApi(object):
@@ -35,12 +35,37 @@ class FlaskApi(object):
                  encoder_name='Facenet',
                  labels_path='../data/embeddings/labels_facenet.pickle',
                  embeddings_path='../data/embeddings/embeddings_facenet.pickle',
-                 index_path='../data/embeddings/index.bin'):
+                 index_path='../data/embeddings/index.bin',
+                 batch_pixels=18000000,
+                 face_batch_size=64,
+                 detection_width=None,
+                 track_interval=0,
+                 cache_size=0,
+                 cache_path=None,
+                 duplicate_threshold=0,
+                 algorithm='appr',
+                 prototypes=0,
+                 prototype_distance=0.1,
+                 index_params=None,
+                 query_params=None,
+                 encoder_backend='tensorflow',
+                 prefilter=None,
+                 prefilter_width=160):
         """ Instantiate ApproximateKNearestNeighbors， FaceRecognition and Graph """
         self.recognizer_model = ApproximateKNearestNeighbors(distance_threshold=distance_threshold,
-                                                             index_path=index_path)
+                                                             index_path=index_path, background_build=True,
+                                                             index_params=index_params, query_params=query_params,
+                                                             backend={'appr': 'nmslib', '1nn': 'exact'}.get(
+                                                                 algorithm, algorithm))
         self.face_recognition = FaceRecognition(thumbnail_list, thumbnails_path, img_width,
-                                                encoder_name, labels_path, embeddings_path)
+                                                encoder_name, labels_path, embeddings_path, batch_pixels,
+                                                face_batch_size, detection_width, track_interval, cache_size,
+                                                cache_path, duplicate_threshold, prototypes=prototypes,
+                                                prototype_distance=prototype_distance, encoder_backend=encoder_backend,
+                                                prefilter=prefilter, prefilter_width=prefilter_width)
+        # an outdated index is built in the background, requests are answered by a brute force search meanwhile
+        labels, embeddings = self.face_recognition.get_gallery()
+        self.recognizer_model.fit(embeddings, labels)
         self.graph = Graph(storage_type, memory_path, virtuoso_url, virtuoso_graph, virtuoso_username,
                            virtuoso_password, dbpedia_csv, wikidata_csv)
 
@@ -69,19 +94,35 @@ class FlaskApi(object):
 
         path_to_video = download_youtube_video(f'https://www.youtube.com/watch?v={identifier}', tempfile.gettempdir())
 
-        recognized_entities, frame_wise_entities, timestamps = self.face_recognition.recognize_video(path_to_video,
-                                                                                                     self.recognizer_model,
-                                                                                                     by)
+        extractor = SceneExtractor(frame_threshold)
+        for timestamp, entities, _ in self.face_recognition.iter_recognitions(path_to_video, self.recognizer_model,
+                                                                              by=by):
+            for scene in extractor.update(entities, timestamp):
+                result.append(self.insert_scene(identifier, scene))
+        for scene in extractor.finish():
+            result.append(self.insert_scene(identifier, scene))
 
         self.graph.insert_video(identifier, os.path.split(path_to_video)[1])
-        scenes = extract_scenes(frame_wise_entities, timestamps, frame_threshold)
-        for scene in scenes:
-            result.append([scene.names[0].tolist(), str(scene.start[0]).split('.')[0],
-                           str(scene.end[0]).split('.')[0]])  # accurate to second
-            self.graph.insert_scene(scene.names[0], identifier, scene.start[0], scene.end[0])
 
         return result
 
+    def insert_scene(self, identifier, scene):
+        """
+        insert a scene of a video to KG
+
+        Parameters
+        ----------
+        identifier: youtube video id
+        scene: Scene
+
+        Returns
+        ----------
+        result: [entity, start, end]
+        """
+        self.graph.insert_scene(scene.names[0], identifier, scene.start[0], scene.end[0])
+        return [scene.names[0].tolist(), str(scene.start[0]).split('.')[0],
+                str(scene.end[0]).split('.')[0]]  # accurate to second
+
     def get_videos_by_sparql(self, query, filters):
         return self.graph.get_videos_with_filters(query, filters)
 
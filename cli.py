@@ -1,4 +1,5 @@
 import argparse
+import functools
 import logging
 from src.hunter import Hunter
 from src.utils.utils import get_config
@@ -78,10 +79,114 @@ def _run_detection(args):
         args.thumbnails (str): Location where the thumbnails are saved.
         args.ratio (float): Parameter specifying how many random thumbnails that are not in the dataset should be learned.
         args.scene_extraction (int): The threshold for the scene extraction postprocessing. Should be 0 for no postprocessing.
+        args.img_width (int): Width to which the images are scaled if no detection_width is given.
+        args.detection_width (int): Width of the proxy images the faces are detected on, the faces are then aligned at
+            the original resolution.
+        args.prefilter (str): Cheap detector that rejects frames without faces before the face detection.
     """
     from src.models.evaluation import evaluate_on_dataset
 
-    evaluate_on_dataset(args.path, args.thumbnails, ratio=args.ratio, scene_extraction=args.scene_extraction)
+    evaluate_on_dataset(args.path, args.thumbnails, ratio=args.ratio, scene_extraction=args.scene_extraction,
+                        img_width=args.img_width, detection_width=args.detection_width, prefilter=args.prefilter)
+
+
+def _evaluate_prefilter(args):
+    """ Report the rejection rate of a prefilter and the face frames it misses on a downloaded dataset.
+
+    Args:
+        args.path (str): Path to the generated information.csv for a downloaded dataset.
+        args.prefilter (str): The cheap detector, 'haar' or 'ssd'.
+        args.img_width (int): Width to which the frames are scaled.
+        args.max_samples (int): Maximum number of samples per video.
+    """
+    from src.models.evaluation import evaluate_prefilter_on_dataset
+
+    LOGGER.info(evaluate_prefilter_on_dataset(args.path, args.prefilter, args.img_width, args.max_samples))
+
+
+def _build_gallery(args):
+    """ Create the embeddings of the thumbnails in the configuration in batches.
+
+    Args:
+        args.threads (int): Number of threads decoding the thumbnails.
+        args.processes (int): Number of worker processes.
+        args.batch_size (int): Maximum number of thumbnails detected in one batch.
+        args.update (bool): Only embed new and changed thumbnails and drop removed thumbnails.
+    """
+    from src.models.face_recognition import FaceRecognition
+
+    face_recognition = FaceRecognition(
+        thumbnails_path=CONFIG['face-recognition'].get('thumbnails'),
+        img_width=CONFIG['face-recognition']['img-width'],
+        encoder_name=CONFIG['face-recognition']['encoder'],
+        labels_path=CONFIG['face-recognition'].get('labels'),
+        embeddings_path=CONFIG['face-recognition'].get('embeddings'),
+        batch_pixels=CONFIG['face-recognition'].get('batch-pixels', 18000000),
+        face_batch_size=CONFIG['face-recognition'].get('face-batch-size', 64),
+        detection_width=CONFIG['face-recognition'].get('detection-width'),
+        load_gallery=False,
+        prototypes=CONFIG['face-recognition'].get('prototypes', 0),
+        prototype_distance=CONFIG['face-recognition'].get('prototype-distance', 0.1),
+        encoder_backend=CONFIG['face-recognition'].get('encoder-backend', 'tensorflow')
+    )
+    if args.update:
+        face_recognition.labels, face_recognition.embeddings = face_recognition.load_embeddings(create=False)
+        changed = face_recognition.update_embeddings(args.threads, args.processes, args.batch_size)
+    else:
+        face_recognition.create_embeddings(args.threads, args.processes, args.batch_size)
+        changed = True
+
+    # the index of the approximate nearest neighbors has to match the embeddings
+    recognizer_model = Hunter._get_recognizer_model(CONFIG['face-recognition']['algorithm'],
+                                                    CONFIG['face-recognition']['method'],
+                                                    CONFIG['face-recognition']['space'],
+                                                    index_path=CONFIG['face-recognition'].get('index'),
+                                                    index_params=CONFIG['face-recognition'].get('index-params'),
+                                                    query_params=CONFIG['face-recognition'].get('query-params'))
+    if changed and recognizer_model is not None and recognizer_model.index_path:
+        labels, embeddings = face_recognition.get_gallery()
+        recognizer_model.rebuild(embeddings, labels)
+
+
+def _compact_gallery(args):
+    """ Reports how much compacting every entity to prototypes shrinks the gallery and changes the accuracy.
+
+    Args:
+        args.prototypes (int): Maximum number of prototypes per entity.
+        args.distance (float): Cosine distance below which embeddings of an entity are near-duplicates.
+    """
+    from src.models.embedding_store import EmbeddingStore
+    from src.models.gallery_compaction import evaluate_compaction
+
+    labels, embeddings = EmbeddingStore(os.path.splitext(CONFIG['face-recognition']['embeddings'])[0]).load()
+    algorithm = CONFIG['face-recognition']['algorithm']
+    LOGGER.info(evaluate_compaction(labels, embeddings, args.prototypes, args.distance,
+                                    CONFIG['face-recognition']['distance-threshold'],
+                                    None if algorithm == '1nn' else 'nmslib' if algorithm == 'appr' else algorithm))
+
+
+def _tune_hnsw(args):
+    """ Sweeps the parameters of the HNSW index and writes the fastest configuration that reaches the recall.
+
+    Args:
+        args.path (str): Path to pickled embeddings or the base path of an embedding store. Uses the embedding store
+            of the configuration if None.
+        args.queries (int): Maximum number of held out queries.
+        args.recall (float): The minimum recall@1 against the exact search.
+        args.output (str): Path to the YAML file the configuration is written to.
+        args.summary (str): Optional path of a csv-file to which the results of all combinations are written.
+    """
+    from src.models.hnsw_tuning import load_gallery_embeddings, sweep_hnsw, select_hnsw_config, write_hnsw_config
+
+    path = args.path or os.path.splitext(CONFIG['face-recognition']['embeddings'])[0]
+    results = sweep_hnsw(load_gallery_embeddings(path), ms=args.m, ef_constructions=args.ef_construction,
+                         ef_searches=args.ef_search, queries=args.queries,
+                         space=CONFIG['face-recognition']['space'])
+    if args.summary:
+        results.to_csv(args.summary, index=False)
+    best = select_hnsw_config(results, args.recall)
+    write_hnsw_config(best, args.output)
+    LOGGER.info(f'Selected {best}, the configuration is written to {args.output}')
 
 
 def _fine_tune_threshold(args):
@@ -97,55 +202,124 @@ def _fine_tune_threshold(args):
     tune_distance_threshold(args.path, args.samples, args.model)
 
 
-def _link(args):
-    """ Recognize entities in a video from YouTube and add the information to a knowledge graph.
+def _benchmark(args):
+    """ Run a runtime benchmark of a processing step.
 
     Args:
-        args.url (str): Location of the video on YouTube.
+        args.target (str): The step to benchmark. Should be 'sampling' for the frame sampling strategies, 'backends'
+            for the vector search backends, 'quantization' for the compressed gallery, 'encoders' for the encoder
+            backends or 'startup' for the imports of the CLI.
+        args.path (str): Optional video, embedding store or directory of faces to run the benchmark on. Synthetic
+            data is used if not given. For 'startup', the command whose startup is measured, e.g.
+            'cli.py search --help'.
+    """
+    from src.preprocessing.frame_sampling import benchmark_sampling
+    from src.models.vector_search import benchmark_backends, benchmark_quantization
+    from src.models.onnx_encoder import benchmark_encoders
+    from src.utils.utils import benchmark_startup
+
+    options = {
+        'sampling': benchmark_sampling,
+        'backends': benchmark_backends,
+        'quantization': benchmark_quantization,
+        'encoders': functools.partial(benchmark_encoders, encoder_name=CONFIG['face-recognition']['encoder']),
+        'startup': benchmark_startup
+    }
+    LOGGER.info(options[args.target](args.path))
+
+
+def _get_hunter(url: str = None):
+    """ Creates a Hunter with the models of the configuration.
+
+    Args:
+        url (str): Location of the video on YouTube.
+
+    Returns:
+        hunter (Hunter): The fitted Hunter.
     """
     from src.hunter import Hunter
-    hunter = Hunter(args.url).fit(
+    return Hunter(url).fit(
         None,
         CONFIG['face-recognition'].get('thumbnails'),
         CONFIG['face-recognition']['img-width'],
         CONFIG['face-recognition']['encoder'],
         CONFIG['face-recognition'].get('labels'),
-        CONFIG['face-recognition'].get('embeddings')
+        CONFIG['face-recognition'].get('embeddings'),
+        CONFIG['face-recognition'].get('batch-pixels', 18000000),
+        CONFIG['face-recognition'].get('face-batch-size', 64),
+        CONFIG['face-recognition'].get('detection-width'),
+        CONFIG['face-recognition'].get('track-interval', 0),
+        CONFIG['face-recognition'].get('cache-size', 0),
+        CONFIG['face-recognition'].get('cache-path'),
+        CONFIG['face-recognition'].get('duplicate-threshold', 0),
+        CONFIG['face-recognition'].get('prototypes', 0),
+        CONFIG['face-recognition'].get('prototype-distance', 0.1),
+        CONFIG['face-recognition'].get('encoder-backend', 'tensorflow'),
+        CONFIG['face-recognition'].get('prefilter'),
+        CONFIG['face-recognition'].get('prefilter-width', 160)
     )
+
+
+def _get_link_arguments() -> dict:
+    """ Reads the arguments for linking videos from the configuration.
+
+    Returns:
+        arguments (dict): Keyword arguments for Hunter.link and Hunter.link_batch.
+    """
+    arguments = {'algorithm': CONFIG['face-recognition']['algorithm'],
+                 'method': CONFIG['face-recognition']['method'],
+                 'space': CONFIG['face-recognition']['space'],
+                 'distance_threshold': CONFIG['face-recognition']['distance-threshold'],
+                 'index_path': CONFIG['face-recognition'].get('index'),
+                 'k': CONFIG['face-recognition']['k'],
+                 'recognize_by': CONFIG['face-recognition']['by'],
+                 'dbpedia_csv': CONFIG['face-recognition'].get('dbpedia'),
+                 'wikidata_csv': CONFIG['face-recognition'].get('wikidata'),
+                 'postprocessing_threshold': CONFIG['face-recognition']['postprocessing-threshold'],
+                 'processes': CONFIG['face-recognition'].get('processes', 1),
+                 'checkpoint_dir': CONFIG['face-recognition'].get('checkpoints'),
+                 'index_params': CONFIG['face-recognition'].get('index-params'),
+                 'query_params': CONFIG['face-recognition'].get('query-params')}
     if 'virtuoso' in CONFIG:
-        newly_created = hunter.link(storage_type='virtuoso',
-                                    algorithm=CONFIG['face-recognition']['algorithm'],
-                                    method=CONFIG['face-recognition']['method'],
-                                    space=CONFIG['face-recognition']['space'],
-                                    distance_threshold=CONFIG['face-recognition']['distance-threshold'],
-                                    index_path=CONFIG['face-recognition'].get('index'),
-                                    k=CONFIG['face-recognition']['k'],
-                                    recognize_by=CONFIG['face-recognition']['by'],
-                                    virtuoso_url=CONFIG['virtuoso']['sparql-auth'],
-                                    virtuoso_graph=CONFIG['virtuoso']['graph'],
-                                    virtuoso_username=CONFIG['virtuoso']['user'],
-                                    virtuoso_password=CONFIG['virtuoso']['password'],
-                                    dbpedia_csv=CONFIG['face-recognition'].get('dbpedia'),
-                                    wikidata_csv=CONFIG['face-recognition'].get('wikidata'),
-                                    postprocessing_threshold=CONFIG['face-recognition']['postprocessing-threshold'])
+        arguments.update({'storage_type': 'virtuoso',
+                          'virtuoso_url': CONFIG['virtuoso']['sparql-auth'],
+                          'virtuoso_graph': CONFIG['virtuoso']['graph'],
+                          'virtuoso_username': CONFIG['virtuoso']['user'],
+                          'virtuoso_password': CONFIG['virtuoso']['password']})
     else:
-        newly_created = hunter.link('memory',
-                                    algorithm=CONFIG['face-recognition']['algorithm'],
-                                    method=CONFIG['face-recognition']['method'],
-                                    space=CONFIG['face-recognition']['space'],
-                                    distance_threshold=CONFIG['face-recognition']['distance-threshold'],
-                                    index_path=CONFIG['face-recognition'].get('index'),
-                                    k=CONFIG['face-recognition']['k'],
-                                    recognize_by=CONFIG['face-recognition']['by'],
-                                    memory_path=CONFIG['memory']['path'],
-                                    dbpedia_csv=CONFIG['face-recognition'].get('dbpedia'),
-                                    wikidata_csv=CONFIG['face-recognition'].get('wikidata'))
+        arguments.update({'storage_type': 'memory',
+                          'memory_path': CONFIG['memory']['path']})
+    return arguments
+
+
+def _link(args):
+    """ Recognize entities in a video from YouTube and add the information to a knowledge graph.
+
+    Args:
+        args.url (str): Location of the video on YouTube.
+    """
+    newly_created = _get_hunter(args.url).link(**_get_link_arguments())
     if newly_created:
         LOGGER.info(f'Linked {args.url} successfully')
     else:
         LOGGER.info(f'Video {args.url} already exists in the knowledge graph')
 
 
+def _link_batch(args):
+    """ Recognize entities in many videos and add the information to a knowledge graph.
+
+    Args:
+        args.path (str): Location of a text-file containing line-wise URLs of youtube videos or paths to local videos.
+        args.summary (str): Location of the csv-file to which the timing summary is written.
+        args.downloads (int): Number of videos that are downloaded ahead of the recognition.
+    """
+    from src.data.youtube import read_video_list
+
+    summary = _get_hunter().link_batch(read_video_list(args.path), args.summary, args.downloads,
+                                       **_get_link_arguments())
+    LOGGER.info(summary)
+
+
 def _get_parser():
     """ Sets up a command line interface.
 
@@ -190,8 +364,60 @@ def _get_parser():
     run_detection.add_argument('--ratio', help='Ratio of entities in the dataset and not', type=float, default=1.0)
     run_detection.add_argument('--scene_extraction', help='Threshold for scene postprocessing. Should be 0 for no '
                                                           'postprocessing', type=int, default=0)
+    run_detection.add_argument('--img_width', help='Width to which the frames are scaled if no detection_width is '
+                                                   'given', type=int, default=500)
+    run_detection.add_argument('--detection_width', help='Width of the proxy frames for the face detection, the faces '
+                                                         'are aligned at the original resolution. Same as img_width if '
+                                                         'not given', type=int, default=None)
+    run_detection.add_argument('--prefilter', help='Cheap detector that rejects frames without faces, haar or ssd. '
+                                                   'Every frame is detected if not given', type=str, default=None)
     run_detection.set_defaults(action=_run_detection)
 
+    # Parser to evaluate the prefilter of the face detection
+    evaluate_prefilter = subparsers.add_parser('evaluate_prefilter', aliases=['evaluate-prefilter'],
+                                               help='Report the rejection rate and missed faces of a prefilter')
+    evaluate_prefilter.add_argument('--path', help='Path to the dataset', type=str,
+                                    default='data/datasets/ytcelebrity')
+    evaluate_prefilter.add_argument('--prefilter', help='Options are haar and ssd', type=str, default='haar')
+    evaluate_prefilter.add_argument('--img_width', help='Width to which the frames are scaled', type=int, default=500)
+    evaluate_prefilter.add_argument('--max_samples', help='Maximum number of samples per video', type=int,
+                                    default=100)
+    evaluate_prefilter.set_defaults(action=_evaluate_prefilter)
+
+    # Parser to create the embeddings of the thumbnails
+    build_gallery = subparsers.add_parser('build_gallery', aliases=['build-gallery'],
+                                          help='Create the embeddings of the thumbnails in batches')
+    build_gallery.add_argument('--threads', help='Number of threads decoding the thumbnails', type=int, default=8)
+    build_gallery.add_argument('--processes', help='Number of worker processes', type=int, default=1)
+    build_gallery.add_argument('--batch_size', help='Maximum number of thumbnails detected in one batch', type=int,
+                               default=32)
+    build_gallery.add_argument('--update', help='Only embed new and changed thumbnails', action='store_true')
+    build_gallery.set_defaults(action=_build_gallery)
+
+    # Parser to evaluate the compaction of the gallery
+    compact_gallery = subparsers.add_parser('compact_gallery', aliases=['compact-gallery'],
+                                            help='Report the size and accuracy of the gallery compacted to prototypes')
+    compact_gallery.add_argument('--prototypes', help='Maximum number of prototypes per entity', type=int, default=3)
+    compact_gallery.add_argument('--distance', help='Cosine distance of near-duplicate embeddings', type=float,
+                                 default=0.1)
+    compact_gallery.set_defaults(action=_compact_gallery)
+
+    # Parser to tune the HNSW index
+    tune_hnsw = subparsers.add_parser('tune_hnsw', aliases=['tune-hnsw'],
+                                      help='Sweep M, efConstruction and efSearch of the HNSW index')
+    tune_hnsw.add_argument('--path', help='Path to pickled embeddings or an embedding store', type=str, default=None)
+    tune_hnsw.add_argument('--m', help='Values of M', type=int, nargs='+', default=[8, 16, 32])
+    tune_hnsw.add_argument('--ef_construction', help='Values of efConstruction', type=int, nargs='+',
+                           default=[100, 200, 400])
+    tune_hnsw.add_argument('--ef_search', help='Values of efSearch', type=int, nargs='+', default=[10, 20, 40, 80, 160])
+    tune_hnsw.add_argument('--queries', help='Maximum number of held out queries', type=int, default=1000)
+    tune_hnsw.add_argument('--recall', help='Minimum recall@1 against the exact search', type=float, default=0.99)
+    tune_hnsw.add_argument('--output', help='Path of the YAML file with the selected configuration', type=str,
+                           default='data/hnsw_config.yaml')
+    tune_hnsw.add_argument('--summary', help='Path of a csv-file with the results of all combinations', type=str,
+                           default=None)
+    tune_hnsw.set_defaults(action=_tune_hnsw)
+
     # Parser to find the optimal threshold
     run_detection = subparsers.add_parser('find_threshold',
                                           help='Evaluates distances between entity representations to obtain the '
@@ -201,6 +427,15 @@ def _get_parser():
     run_detection.add_argument('--model', help='Model used for the fine-tuning', type=str, default='Dlib')
     run_detection.set_defaults(action=_fine_tune_threshold)
 
+    # Parser to run benchmarks
+    benchmark = subparsers.add_parser('benchmark',
+                                      help='Measure the runtime of processing steps')
+    benchmark.add_argument('--target', help='The processing step to benchmark', type=str, default='sampling',
+                           choices=['sampling', 'backends', 'quantization', 'encoders', 'startup'])
+    benchmark.add_argument('--path', help='Path to a video, the base path of an embedding store or a directory of '
+                                          'faces for the benchmark', type=str, default=None)
+    benchmark.set_defaults(action=_benchmark)
+
     # Parser to link a video
     link = subparsers.add_parser('link',
                                  help='Link entities of a video to a knowledge graph')
@@ -208,6 +443,17 @@ def _get_parser():
                       type=str,
                       default='https://www.youtube.com/watch?v=elz1J86AExY')
     link.set_defaults(action=_link)
+
+    # Parser to link many videos
+    link_batch = subparsers.add_parser('link_batch', aliases=['link-batch'],
+                                       help='Link entities of many videos to a knowledge graph')
+    link_batch.add_argument('--path', help='Path to a text-file with one YouTube-link or local video per line',
+                            type=str, default='data/datasets/youtube/videos.txt')
+    link_batch.add_argument('--summary', help='Path to save the timing summary at', type=str,
+                            default='link_summary.csv')
+    link_batch.add_argument('--downloads', help='Number of videos downloaded ahead of the recognition', type=int,
+                            default=2)
+    link_batch.set_defaults(action=_link_batch)
     return parser
 
 
@@ -43,5 +43,9 @@ setup(
     description='Our package creates a knowledge graph of entities and videos on YouTube.',
     author='Team Project University of Mannheim',
     license='CC-BY-SA-4.0 License',
-    install_requires=install_requires
+    install_requires=install_requires,
+    extras_require={
+        'hnswlib': ['hnswlib'],
+        'faiss': ['faiss-cpu']
+    }
 )
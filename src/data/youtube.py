@@ -1,3 +1,4 @@
+import os
 from pytube import YouTube
 import logging
 from src.utils.utils import check_path_exists
@@ -17,12 +18,34 @@ def download_youtube_videos(txt_path: str = None, path: str = 'data/datasets/you
     """
     check_path_exists(path)
 
-    video_paths = []
+    return [download_youtube_video(url, path) for url in read_video_list(txt_path)]
+
+
+def read_video_list(txt_path: str) -> list:
+    """ Reads a text-file of videos
+
+    Args:
+        txt_path (str): Location of a text-file containing line-wise URLs of youtube videos or paths to local videos.
+
+    Returns:
+        videos (list): The URLs and paths without empty lines.
+    """
     with open(txt_path) as f:
-        for line in f:
-            url = line.strip()
-            video_paths.append(download_youtube_video(url, path))
-    return video_paths
+        return [line.strip() for line in f if line.strip()]
+
+
+def get_video_identifier(source: str) -> str:
+    """ Returns the identifier of a video that is used in the knowledge graph
+
+    Args:
+        source (str): YouTube-link of the video or path to a local video.
+
+    Returns:
+        identifier (str): The YouTube-id, for local files the filename without extension.
+    """
+    if '=' in source and not os.path.isfile(source):
+        return source.split('=')[1]
+    return os.path.splitext(os.path.basename(source))[0]
 
 
 def download_youtube_video(url: str, path: str = 'data/datasets/youtube') -> str:
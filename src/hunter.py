@@ -1,10 +1,17 @@
 import os
+import time
+import logging
 import tempfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
 from src.knowledge_graph.graph import Graph
-from src.data.youtube import download_youtube_video
+from src.data.youtube import download_youtube_video, get_video_identifier
 from src.models.approximate_k_nearest_neighbors import ApproximateKNearestNeighbors
 from src.models.face_recognition import FaceRecognition
-from src.postprocessing.graph_postprocessing import extract_scenes
+from src.postprocessing.graph_postprocessing import SceneExtractor
+
+LOGGER = logging.getLogger('hunter')
 
 
 class Hunter(object):
@@ -16,7 +23,7 @@ class Hunter(object):
             url (str): URL of the video on YouTube.
         """
         self.url = url
-        self.identifier = self.url.split('=')[1]
+        self.identifier = get_video_identifier(url) if url is not None else None
         self.path_to_video = None
         self.face_detection = None
 
@@ -26,7 +33,19 @@ class Hunter(object):
             img_width=500,
             encoder_name: str ='Dlib',
             labels_path='data/embeddings/labels.pickle',
-            embeddings_path='data/embeddings/embeddings.pickle'
+            embeddings_path='data/embeddings/embeddings.pickle',
+            batch_pixels: int = 18000000,
+            face_batch_size: int = 64,
+            detection_width: int = None,
+            track_interval: int = 0,
+            cache_size: int = 0,
+            cache_path: str = None,
+            duplicate_threshold: float = 0,
+            prototypes: int = 0,
+            prototype_distance: float = 0.1,
+            encoder_backend: str = 'tensorflow',
+            prefilter: str = None,
+            prefilter_width: int = 160
             ):
         """ Creates the embeddings for a dictionary of thumbnails.
 
@@ -37,6 +56,23 @@ class Hunter(object):
             encoder_name (str): Specifies the method to create embeddings of faces in an image.
             labels_path (str): Path where the label-information should be saved.
             embeddings_path (str): Path where the embeddings should be saved.
+            batch_pixels (int): Maximum number of pixels of the frames that are detected in one batch.
+            face_batch_size (int): Maximum number of faces that are aligned and encoded in one batch.
+            detection_width (int): Width of the proxy images the faces are detected on. The faces of videos are then
+                aligned at the original resolution. Uses img_width if None.
+            track_interval (int): Number of samples a tracked face reuses its embedding. Tracking is off if 0.
+            cache_size (int): Number of face embeddings kept in the embedding cache. The cache is off if 0.
+            cache_path (str): Path to the sqlite database that persists the embedding cache.
+            duplicate_threshold (float): Mean absolute difference below which a sample repeats the recognitions of
+                the last processed sample. Every sample is processed if 0.
+            prototypes (int): Maximum number of prototypes per entity that faces are matched against. Matches
+                against every thumbnail embedding if 0.
+            prototype_distance (float): Cosine distance below which thumbnail embeddings of an entity are
+                near-duplicates.
+            encoder_backend (str): Runs the encoder with 'tensorflow', 'onnx' or 'onnx-int8'.
+            prefilter (str): Cheap detector, 'haar' or 'ssd', that rejects frames without faces before the face
+                detection. Every frame is detected if None.
+            prefilter_width (int): Width of the proxy images the 'haar' prefilter runs on.
 
         Returns:
             self
@@ -47,7 +83,19 @@ class Hunter(object):
             img_width,
             encoder_name,
             labels_path,
-            embeddings_path
+            embeddings_path,
+            batch_pixels,
+            face_batch_size,
+            detection_width,
+            track_interval,
+            cache_size,
+            cache_path,
+            duplicate_threshold,
+            prototypes=prototypes,
+            prototype_distance=prototype_distance,
+            encoder_backend=encoder_backend,
+            prefilter=prefilter,
+            prefilter_width=prefilter_width
         )
         return self
 
@@ -58,35 +106,73 @@ class Hunter(object):
                   distance_threshold=0.4,
                   index_path='data/embeddings/index.bin',
                   k=1,
-                  recognize_by: str = 'second'
+                  recognize_by: str = 'second',
+                  processes: int = 1,
+                  checkpoint_dir: str = None,
+                  index_params: dict = None,
+                  query_params: dict = None
                   ) -> list:
         """ Get a list of entities that could be recognized in the video.
 
         Args:
-            algorithm (str): Algorithm to use for the similarity-calculation. Should be '1nn' for 1-Nearest Neighbors with euclidean distance, 'appr' for approximate k-Nearest Neighbors.
+            algorithm (str): Algorithm to use for the similarity-calculation. Should be '1nn' for 1-Nearest Neighbors with euclidean distance, 'appr' or 'nmslib' for approximate k-Nearest Neighbors with NMSLIB, 'hnswlib' or 'faiss' for approximate k-Nearest Neighbors with these libraries, 'exact' for exact k-Nearest Neighbors or 'int8' for k-Nearest Neighbors on a compressed gallery.
             distance_threshold (float): The threshold above which faces are recognized as being similar.
             method (str): Type of graph to use for the k-nearest neighbor approximation. See https://github.com/nmslib/nmslib/blob/master/manual/methods.md for available options. Only necessary if algorithm = 'appr'.
             space (str): Similarity measure to use in the space. Only necessary if algorithm = 'appr'.
             index_path (str): Path to an existing nmslib-index. Only necessary if algorithm = 'appr'.
             k (int): The number of k-nearest neighbors to consider for the detection. Only necessary if algorithm = 'appr'.
             recognize_by (str): Recognize by 'second' or 'frame'.
+            processes (int): Number of worker processes that recognize time ranges of the video in parallel.
+            checkpoint_dir (str): Directory to checkpoint partial results in, so that a restarted job can resume.
+            index_params (dict): Parameters to create the NMSLIB index, e.g. M and efConstruction.
+            query_params (dict): Parameters of the NMSLIB queries, e.g. efSearch.
 
         Returns:
             entities (list): Entities found in the video.
         """
-        if algorithm == 'appr':
-            detector = ApproximateKNearestNeighbors(method,
-                                                    space,
-                                                    distance_threshold,
-                                                    index_path,
-                                                    k)
-        elif algorithm == '1nn':
-            detector = None
-        else:
-            raise Exception('Unknown Predictor')
+        detector = self._get_recognizer_model(algorithm, method, space, distance_threshold, index_path, k,
+                                              index_params, query_params)
 
         self.path_to_video = download_youtube_video(self.url, tempfile.gettempdir())
-        return self.face_detection.recognize_video(self.path_to_video, detector, distance_threshold, recognize_by)
+        return self.face_detection.recognize_video(self.path_to_video, detector, distance_threshold, recognize_by,
+                                                   processes=processes, checkpoint_dir=checkpoint_dir)
+
+    @staticmethod
+    def _get_recognizer_model(algorithm='appr',
+                              method='hnsw',
+                              space='cosinesimil',
+                              distance_threshold=0.4,
+                              index_path='data/embeddings/index.bin',
+                              k=1,
+                              index_params=None,
+                              query_params=None):
+        """ Creates the model to compare face embeddings with the thumbnails.
+
+        Args:
+            algorithm (str): Algorithm to use for the similarity-calculation. Should be '1nn' for 1-Nearest Neighbors with euclidean distance, 'appr' or 'nmslib' for approximate k-Nearest Neighbors with NMSLIB, 'hnswlib' or 'faiss' for approximate k-Nearest Neighbors with these libraries, 'exact' for exact k-Nearest Neighbors or 'int8' for k-Nearest Neighbors on a compressed gallery.
+            method (str): Type of graph to use for the k-nearest neighbor approximation.
+            space (str): Similarity measure to use in the space.
+            distance_threshold (float): The threshold above which faces are recognized as being similar.
+            index_path (str): Path to an existing nmslib-index.
+            k (int): The number of k-nearest neighbors to consider for the detection.
+            index_params (dict): Parameters to create the NMSLIB index. Uses M 15 and efConstruction 100 if None.
+            query_params (dict): Parameters of the NMSLIB queries, e.g. efSearch.
+
+        Returns:
+            detector (ApproximateKNearestNeighbors): The model or None for 1-Nearest Neighbors.
+        """
+        if algorithm in ['appr', 'nmslib', 'hnswlib', 'faiss', 'exact', 'int8']:
+            return ApproximateKNearestNeighbors(method,
+                                                space,
+                                                distance_threshold,
+                                                index_path,
+                                                k,
+                                                index_params=index_params,
+                                                backend='nmslib' if algorithm == 'appr' else algorithm,
+                                                query_params=query_params)
+        elif algorithm == '1nn':
+            return None
+        raise Exception('Unknown Predictor')
 
     def link(self,
              storage_type: str = 'memory',
@@ -104,11 +190,15 @@ class Hunter(object):
              virtuoso_password: str = None,
              dbpedia_csv: str = 'data/thumbnails/dbpedia_thumbnails/Thumbnails_links.csv',
              wikidata_csv: str = 'data/thumbnails/wikidata_thumbnails/Thumbnails_links.csv',
-             postprocessing_threshold: int = 3):
+             postprocessing_threshold: int = 3,
+             processes: int = 1,
+             checkpoint_dir: str = None,
+             index_params: dict = None,
+             query_params: dict = None):
         """ Recognize entities in a video and add corresponding links to the knowledge graph.
 
         Args:
-            algorithm (str): Algorithm to use for the similarity-calculation. Should be '1nn' for 1-Nearest Neighbors with euclidean distance, 'appr' for approximate k-Nearest Neighbors.
+            algorithm (str): Algorithm to use for the similarity-calculation. Should be '1nn' for 1-Nearest Neighbors with euclidean distance, 'appr' or 'nmslib' for approximate k-Nearest Neighbors with NMSLIB, 'hnswlib' or 'faiss' for approximate k-Nearest Neighbors with these libraries, 'exact' for exact k-Nearest Neighbors or 'int8' for k-Nearest Neighbors on a compressed gallery.
             distance_threshold (float): The threshold above which faces are recognized as being similar.
             method (str): Type of graph to use for the k-nearest neighbor approximation. See https://github.com/nmslib/nmslib/blob/master/manual/methods.md for available options. Only necessary if algorithm = 'appr'.
             space (str): Similarity measure to use in the space. Only necessary if algorithm = 'appr'.
@@ -125,6 +215,10 @@ class Hunter(object):
             dbpedia_csv (str): Path of the normalized DBpedia-thumbnail-information.
             wikidata_csv (str): Path of the normalized Wikidata-thumbnail-information.
             postprocessing_threshold (int): Number of similar/not similar consecutive frames to start/end a scene.
+            processes (int): Number of worker processes that recognize time ranges of the video in parallel.
+            checkpoint_dir (str): Directory to checkpoint partial results in, so that a restarted job can resume.
+            index_params (dict): Parameters to create the NMSLIB index, e.g. M and efConstruction.
+            query_params (dict): Parameters of the NMSLIB queries, e.g. efSearch.
 
         Returns:
             new_links (bool): Whether the video already existed in the database or not.
@@ -139,17 +233,168 @@ class Hunter(object):
                       wikidata_csv)
 
         if not graph.video_exists(self.identifier):
-            recognized_entities, frame_wise_entities, timestamps = self.recognize(algorithm, method, space,
-                                                                                  distance_threshold, index_path, k,
-                                                                                  recognize_by)
-
-            graph.insert_video(self.identifier, os.path.split(self.path_to_video)[1])
-            scenes = extract_scenes(frame_wise_entities, timestamps, postprocessing_threshold)
-            for scene in scenes:
-                graph.insert_scene(scene.names[0], self.identifier, scene.start[0], scene.end[0])
+            detector = self._get_recognizer_model(algorithm, method, space, distance_threshold, index_path, k,
+                                                  index_params, query_params)
+            self.path_to_video = download_youtube_video(self.url, tempfile.gettempdir())
+            self._link_video(graph, detector, self.identifier, self.path_to_video, distance_threshold, recognize_by,
+                             postprocessing_threshold, processes, checkpoint_dir)
             return True
         return False
 
+    def link_batch(self,
+                   sources: list,
+                   summary_path: str = None,
+                   downloads: int = 2,
+                   storage_type: str = 'memory',
+                   algorithm='appr',
+                   method='hnsw',
+                   space='cosinesimil',
+                   distance_threshold=0.4,
+                   index_path='data/embeddings/index.bin',
+                   k=1,
+                   recognize_by: str = 'second',
+                   memory_path: str = 'models/store',
+                   virtuoso_url: str = None,
+                   virtuoso_graph: str = None,
+                   virtuoso_username: str = None,
+                   virtuoso_password: str = None,
+                   dbpedia_csv: str = 'data/thumbnails/dbpedia_thumbnails/Thumbnails_links.csv',
+                   wikidata_csv: str = 'data/thumbnails/wikidata_thumbnails/Thumbnails_links.csv',
+                   postprocessing_threshold: int = 3,
+                   processes: int = 1,
+                   checkpoint_dir: str = None,
+                   index_params: dict = None,
+                   query_params: dict = None) -> pd.DataFrame:
+        """ Links many videos while the models, the index and the knowledge graph stay loaded.
+
+        Videos from YouTube are downloaded in background threads while the previous videos are recognized.
+
+        Args:
+            sources (list): URLs of videos on YouTube or paths to local video files.
+            summary_path (str): Optional path of a csv-file to which the timing summary is written.
+            downloads (int): Number of videos that are downloaded ahead of the recognition.
+            Further arguments are described in link.
+
+        Returns:
+            summary (DataFrame): Status, number of scenes and seconds spent downloading and recognizing per video.
+        """
+        graph = Graph(storage_type,
+                      memory_path,
+                      virtuoso_url,
+                      virtuoso_graph,
+                      virtuoso_username,
+                      virtuoso_password,
+                      dbpedia_csv,
+                      wikidata_csv)
+        detector = self._get_recognizer_model(algorithm, method, space, distance_threshold, index_path, k,
+                                              index_params, query_params)
+
+        # skip videos that already exist before anything is downloaded
+        videos = []
+        summary = [None] * len(sources)
+        for position, source in enumerate(sources):
+            identifier = get_video_identifier(source)
+            if graph.video_exists(identifier) or identifier in [video[1] for video in videos]:
+                LOGGER.info(f'Video {source} already exists in the knowledge graph')
+                summary[position] = {'source': source, 'identifier': identifier, 'status': 'exists'}
+            else:
+                videos.append((source, identifier, position))
+
+        downloads = max(downloads, 1)
+        with ThreadPoolExecutor(max_workers=downloads) as executor:
+            pending = deque(executor.submit(self._fetch_video, video[0]) for video in videos[:downloads])
+
+            for i, (source, identifier, position) in enumerate(videos):
+                result = {'source': source, 'identifier': identifier}
+                download = pending.popleft()
+                if i + downloads < len(videos):
+                    pending.append(executor.submit(self._fetch_video, videos[i + downloads][0]))
+                try:
+                    path, result['download_seconds'] = download.result()
+
+                    start = time.perf_counter()
+                    result['frames'], result['scenes'] = self._link_video(graph, detector, identifier, path,
+                                                                          distance_threshold, recognize_by,
+                                                                          postprocessing_threshold, processes,
+                                                                          checkpoint_dir)
+                    result['recognition_seconds'] = time.perf_counter() - start
+                    result['status'] = 'linked'
+                    LOGGER.info(f'Linked {source} successfully in {result["recognition_seconds"]:.1f}s')
+                except Exception as e:
+                    LOGGER.error(f'Failed to link {source}: {e}')
+                    result['status'] = 'failed'
+                summary[position] = result
+
+        summary = pd.DataFrame(summary, columns=['source', 'identifier', 'status', 'frames', 'scenes',
+                                                 'download_seconds', 'recognition_seconds'])
+        if summary_path is not None:
+            summary.to_csv(summary_path, index=False)
+        return summary
+
+    @staticmethod
+    def _fetch_video(source: str):
+        """ Downloads a video from YouTube unless it is a local file.
+
+        Args:
+            source (str): URL of the video on YouTube or path to a local file.
+
+        Returns:
+            path (str): Path to the local video.
+            seconds (float): Time spent downloading.
+        """
+        if os.path.isfile(source):
+            return source, 0.0
+        start = time.perf_counter()
+        path = download_youtube_video(source, tempfile.gettempdir())
+        return path, time.perf_counter() - start
+
+    def _link_video(self,
+                    graph: Graph,
+                    detector,
+                    identifier: str,
+                    path_to_video: str,
+                    distance_threshold=0.4,
+                    recognize_by: str = 'second',
+                    postprocessing_threshold: int = 3,
+                    processes: int = 1,
+                    checkpoint_dir: str = None):
+        """ Recognizes entities in a local video and adds the scenes to the knowledge graph.
+
+        Scenes are written while the video is processed, the video itself once it is complete.
+
+        Args:
+            graph (Graph): The knowledge graph.
+            detector (ApproximateKNearestNeighbors): The model to compare face embeddings or None.
+            identifier (str): The identifier of the video.
+            path_to_video (str): Path to the local video.
+            distance_threshold (float): The threshold above which faces are recognized as being similar.
+            recognize_by (str): Recognize by 'second' or 'frame'.
+            postprocessing_threshold (int): Number of similar/not similar consecutive frames to start/end a scene.
+            processes (int): Number of worker processes that recognize time ranges of the video in parallel.
+            checkpoint_dir (str): Directory to checkpoint partial results in, so that a restarted job can resume.
+
+        Returns:
+            frames (int): Number of recognized frames.
+            scenes (int): Number of inserted scenes.
+        """
+        extractor = SceneExtractor(postprocessing_threshold)
+        frames = 0
+        scenes = 0
+        for timestamp, entities, _ in self.face_detection.iter_recognitions(path_to_video, detector,
+                                                                            distance_threshold, recognize_by,
+                                                                            processes=processes,
+                                                                            checkpoint_dir=checkpoint_dir):
+            frames += 1
+            for scene in extractor.update(entities, timestamp):
+                graph.insert_scene(scene.names[0], identifier, scene.start[0], scene.end[0])
+                scenes += 1
+        for scene in extractor.finish():
+            graph.insert_scene(scene.names[0], identifier, scene.start[0], scene.end[0])
+            scenes += 1
+
+        graph.insert_video(identifier, os.path.split(path_to_video)[1])
+        return frames, scenes
+
     @staticmethod
     def search(entity: str = None,
                storage_type: str = 'memory',
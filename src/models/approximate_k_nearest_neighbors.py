@@ -1,8 +1,11 @@
 import os
+import json
+import hashlib
+import threading
 
 import numpy as np
-import nmslib
 import logging
+from src.models.vector_search import ExactBackend, NmslibBackend, create_backend
 
 LOGGER = logging.getLogger('approximate_k_neighbors')
 
@@ -16,6 +19,14 @@ class ApproximateKNearestNeighbors(object):
         distance_threshold (float): Defines the maximum distance face embeddings can have to be detected as similar.
         index_path (str): Optional path to an existing model to load.
         k (int): The number of nearest neighbors to consider.
+        num_threads (int): Number of threads NMSLIB uses to query a batch of embeddings.
+        index_params (dict): Parameters to create the index. Defaults to M 15, indexThreadQty 4, efConstruction 100.
+        background_build (bool): Whether an index that has to be built is built in a background thread. Until it is
+            swapped in, queries are answered by an exact brute force search.
+        backend (str): The library searching the nearest neighbors: 'nmslib', 'hnswlib', 'faiss', 'exact' or 'int8'.
+        backend_params (dict): Parameters of the other backends than nmslib, e.g. M, ef_construction and ef_search of
+            hnswlib and faiss or rerank of int8.
+        query_params (dict): Parameters of the NMSLIB queries, e.g. efSearch. Uses the defaults of NMSLIB if None.
     """
 
     def __init__(self,
@@ -23,7 +34,13 @@ class ApproximateKNearestNeighbors(object):
                  space='cosinesimil',
                  distance_threshold=0.4,
                  index_path='data/embeddings/index.bin',
-                 k=1
+                 k=1,
+                 num_threads=4,
+                 index_params=None,
+                 background_build=False,
+                 backend='nmslib',
+                 backend_params=None,
+                 query_params=None
                  ):
         self.method = method
         self.space = space
@@ -32,8 +49,26 @@ class ApproximateKNearestNeighbors(object):
         self.labels = []
         self.distance_threshold = distance_threshold
         self.k = k
+        self.num_threads = num_threads
+        self.index_params = index_params if index_params is not None else {'M': 15, 'indexThreadQty': 4,
+                                                                           'efConstruction': 100}
+        self.background_build = background_build
+        self.backend = backend
+        self.backend_params = backend_params if backend_params is not None else {}
+        self.query_params = query_params
+        self.build_thread = None
+        self.labels_table = []
+        self._label_ids = None
         self.fitted = False
 
+    def __getstate__(self):
+        """ The index can not be pickled, it is loaded again when the model is used in another process """
+        state = self.__dict__.copy()
+        state['recognizer'] = None
+        state['build_thread'] = None
+        state['fitted'] = False
+        return state
+
     def fit(self, embeddings, labels):
         """ Uses embeddings to train the algorithm.
 
@@ -44,25 +79,118 @@ class ApproximateKNearestNeighbors(object):
         Returns:
             self
         """
-        self.recognizer = nmslib.init(method=self.method, space=self.space, data_type=nmslib.DataType.DENSE_VECTOR)
+        # Transform the embeddings list into numpy array for the backend
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
         self.labels = labels
+        fingerprint = self.get_fingerprint(embeddings, labels)
+
+        # The exact search has no index to save
+        if self.backend == 'exact':
+            self.recognizer = self._create_backend().fit(embeddings)
 
-        # If there exists index for nmslib, load it
-        if os.path.exists(self.index_path):
-            self.recognizer.loadIndex(self.index_path)
+        # If there exists an index that was built from the same data, load it
+        elif os.path.exists(self.index_path) and self.read_fingerprint() == fingerprint:
+            self.recognizer = self._create_backend().load(self.index_path, embeddings)
 
         # If not, create new index based on the embeddings
         else:
-            # Transform the embeddings list into numpy array for nmslib
-            embeddings = np.array(embeddings)
-            LOGGER.debug(embeddings)
-            self.recognizer.addDataPointBatch(embeddings)
-            index_time_params = {'M': 15, 'indexThreadQty': 4, 'efConstruction': 100}
-            self.recognizer.createIndex(index_time_params)
-            self.recognizer.saveIndex(self.index_path, save_data=False)
+            if os.path.exists(self.index_path):
+                LOGGER.info(f'The index {self.index_path} does not match the embeddings, it is built again')
+            if self.background_build:
+                self.recognizer = ExactBackend(self.space, self.num_threads).fit(embeddings)
+                self.build_thread = threading.Thread(target=self._build, args=(embeddings, fingerprint), daemon=True)
+                self.build_thread.start()
+            else:
+                self._build(embeddings, fingerprint)
         self.fitted = True
         return self
 
+    def _create_backend(self):
+        """ Creates the unfitted backend """
+        if self.backend == 'nmslib':
+            return NmslibBackend(self.space, self.num_threads, self.method, self.index_params, self.query_params)
+        return create_backend(self.backend, self.space, self.num_threads, **self.backend_params)
+
+    def _build(self, embeddings, fingerprint: dict):
+        """ Builds and saves the index, then swaps it in """
+        recognizer = self._create_backend().fit(embeddings)
+
+        # replace the files only when they are complete, the temporary files are unique per process and thread
+        suffix = f'{os.getpid()}.{threading.get_ident()}.tmp'
+        recognizer.save(f'{self.index_path}.{suffix}')
+        with open(f'{self.get_fingerprint_path()}.{suffix}', 'w') as f:
+            json.dump(fingerprint, f)
+        os.replace(f'{self.index_path}.{suffix}', self.index_path)
+        os.replace(f'{self.get_fingerprint_path()}.{suffix}', self.get_fingerprint_path())
+
+        self.recognizer = recognizer
+        LOGGER.info(f'Built the index {self.index_path} of {len(embeddings)} embeddings')
+
+    def wait(self):
+        """ Blocks until an index that is built in the background is swapped in
+
+        Returns:
+            self
+        """
+        if self.build_thread is not None:
+            self.build_thread.join()
+            self.build_thread = None
+        return self
+
+    def get_fingerprint(self, embeddings, labels) -> dict:
+        """ Identifies the data and the parameters an index is built from
+
+        Args:
+            embeddings (np.ndarray): The contiguous float32 embeddings.
+            labels (list): Ordered List of entities in our datasets
+
+        Returns:
+            fingerprint (dict): Hashes of the embeddings and labels, the backend, method, space and index parameters.
+        """
+        embeddings_hash = hashlib.sha1(str(embeddings.shape).encode())
+        embeddings_hash.update(embeddings.data)
+        return {'embeddings': embeddings_hash.hexdigest(),
+                'labels': hashlib.sha1(json.dumps(list(labels)).encode()).hexdigest(),
+                'method': self.method,
+                'space': self.space,
+                'index_params': self.index_params,
+                'backend': self.backend,
+                'backend_params': self.backend_params}
+
+    def get_fingerprint_path(self) -> str:
+        """ Returns the path of the fingerprint next to the index
+
+        Returns:
+            path (str): Path to the JSON fingerprint.
+        """
+        return f'{self.index_path}.json'
+
+    def read_fingerprint(self):
+        """ Reads the fingerprint of the saved index
+
+        Returns:
+            fingerprint (dict): The fingerprint or None if there is none.
+        """
+        if not os.path.exists(self.get_fingerprint_path()):
+            return None
+        with open(self.get_fingerprint_path()) as f:
+            return json.load(f)
+
+    def rebuild(self, embeddings, labels):
+        """ Replaces a saved index with a new index of the embeddings, e.g. after the gallery changed.
+
+        Args:
+            embeddings (list): The ordered embeddings of all face images.
+            labels (list): Ordered List of entities in our datasets
+
+        Returns:
+            self
+        """
+        for path in [self.index_path, self.get_fingerprint_path()]:
+            if os.path.exists(path):
+                os.remove(path)
+        return self.fit(embeddings, labels)
+
     def predict(self, embedding):
         """ Predict the entity of an embedding
 
@@ -72,17 +200,40 @@ class ApproximateKNearestNeighbors(object):
         Returns:
             entity (str): The entity with maximum probability to match the embedding
         """
-        entities = []
-        embedding = np.expand_dims(embedding, axis=0)
-        neighbors, distances = self.recognizer.knnQueryBatch(embedding, k=self.k, num_threads=4)[0]
-
-        for i in range(self.k):
-            if distances[i] < self.distance_threshold:
-                idx = neighbors[0]
-                entity = self.labels[idx]
-                entities.append(entity)
-
-        if entities:
-            return max(entities, key=entities.count)
-        else:
-            return 'unknown'
+        return self.predict_batch([embedding])[0]
+
+    def predict_batch(self, embeddings):
+        """ Predict the entities of many embeddings with one query
+
+        Every embedding is assigned the most frequent entity of its k nearest neighbors below the distance threshold.
+        Ties are won by the entity of the nearer neighbor.
+
+        Args:
+            embeddings: The embeddings to analyze
+
+        Returns:
+            entities (list): The entity with maximum probability to match each embedding or 'unknown'
+        """
+        if len(embeddings) == 0:
+            return []
+        # neighbors and distances as (n, k) arrays, missing neighbors have an infinite distance
+        neighbors, distances = self.recognizer.query_batch(np.asarray(embeddings, dtype=np.float32), self.k)
+        neighbors = np.maximum(neighbors, 0)
+
+        # vote: number of valid neighbors with the same label as each valid neighbor
+        valid = distances < self.distance_threshold
+        label_ids = self._get_label_ids()[neighbors]
+        votes = ((label_ids[:, :, None] == label_ids[:, None, :]) & valid[:, None, :]).sum(axis=2)
+        votes[~valid] = -1
+        winners = label_ids[np.arange(len(neighbors)), np.argmax(votes, axis=1)]
+
+        return [self.labels_table[winner] if any_valid else 'unknown'
+                for winner, any_valid in zip(winners.tolist(), valid.any(axis=1).tolist())]
+
+    def _get_label_ids(self):
+        """ Maps the labels to integer ids once per fit """
+        if self._label_ids is None or self._label_ids[0] is not self.labels:
+            self.labels_table, ids = np.unique(np.asarray(self.labels, dtype=object), return_inverse=True)
+            self.labels_table = self.labels_table.tolist()
+            self._label_ids = (self.labels, ids.reshape(-1))
+        return self._label_ids[1]
@@ -0,0 +1,120 @@
+import os
+import json
+import pickle
+import hashlib
+import logging
+from src.utils.utils import check_path_exists
+
+LOGGER = logging.getLogger('checkpoint')
+
+
+def get_key(config) -> str:
+    """ Returns a short hash of a configuration
+
+    Args:
+        config: JSON serializable configuration.
+
+    Returns:
+        key (str): The first 16 characters of the SHA-1 of the configuration.
+    """
+    return hashlib.sha1(json.dumps(config, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+
+class Checkpoint(object):
+    """ Stores the results of a running job so that a restarted job can resume
+
+    The file is append-only: every checkpoint adds a record with the new results and the index of the next item to
+    process. A record that was only partially written when the process died is ignored.
+
+    Args:
+        directory (str): Directory of the checkpoint files.
+        name (str): File name of the checkpoint.
+    """
+
+    def __init__(self, directory: str, name: str):
+        self.directory = directory
+        self.path = os.path.join(directory, name)
+
+    def load(self, start: int = 0):
+        """ Reads the results of previous runs
+
+        Args:
+            start (int): The index of the first item if there is no checkpoint.
+
+        Returns:
+            start (int): The index of the next item to process.
+            results (list): The results that were already computed.
+        """
+        results = []
+        if not os.path.exists(self.path):
+            return start, results
+
+        valid = 0
+        with open(self.path, 'rb') as f:
+            while True:
+                try:
+                    next_index, records = pickle.load(f)
+                except (EOFError, pickle.UnpicklingError, ValueError):
+                    break
+                start = next_index
+                results.extend(records)
+                valid = f.tell()
+
+        # cut off a record that was only partially written
+        if valid < os.path.getsize(self.path):
+            with open(self.path, 'r+b') as f:
+                f.truncate(valid)
+
+        LOGGER.info(f'Resuming from checkpoint {self.path} at {start} with {len(results)} results')
+        return start, results
+
+    def append(self, next_index: int, results: list):
+        """ Persists new results
+
+        Args:
+            next_index (int): The index of the next item to process.
+            results (list): The results since the last checkpoint.
+        """
+        check_path_exists(self.directory)
+        with open(self.path, 'ab') as f:
+            pickle.dump((next_index, results), f, protocol=pickle.HIGHEST_PROTOCOL)
+            f.flush()
+            os.fsync(f.fileno())
+        LOGGER.debug(f'Checkpoint at {next_index}')
+
+    def remove(self):
+        """ Deletes the checkpoint once the job is complete """
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class RecognitionCheckpoint(Checkpoint):
+    """ Stores the frame-wise results of a running video recognition so that a restarted job can resume
+
+    Args:
+        directory (str): Directory of the checkpoint files.
+        video_path (str): Path to the video.
+        config (dict): Parameters of the recognition. A different configuration uses a different checkpoint.
+    """
+
+    def __init__(self, directory: str, video_path: str, config: dict):
+        video_id = f'{os.path.basename(video_path)}:{os.path.getsize(video_path)}'
+        key = get_key([video_id, config])
+        super().__init__(directory, f'{os.path.splitext(os.path.basename(video_path))[0]}_{key}.ckpt')
+
+
+def get_model_params(model) -> dict:
+    """ Returns the scalar parameters of a recognizer model to identify its configuration
+
+    Args:
+        model (any model): Model trained with embeddings to predict entities.
+
+    Returns:
+        params (dict): The class name and the scalar attributes of the model.
+    """
+    if model is None:
+        return {}
+    params = {key: value for key, value in vars(model).items()
+              if isinstance(value, (str, int, float, bool)) and key != 'fitted'}
+    params['class'] = type(model).__name__
+    return params
@@ -67,14 +67,10 @@ def tune_distance_threshold(video_path='data/datasets/youtube_faces', sample_per
     embeddings_path = os.path.join(fr_dir, 'embeddings.pickle')
     labels_path = os.path.join(fr_dir, 'labels.pickle')
 
-    if os.path.exists(embeddings_path):
-        os.remove(embeddings_path)
-    if os.path.exists(labels_path):
-        os.remove(labels_path)
-
     LOGGER.info('3/7 creating thumbnails embeddings...')
     fr = FaceRecognition(thumbnails_path=thumbnails_path, encoder_name=model, labels_path=labels_path,
-                         embeddings_path=embeddings_path)
+                         embeddings_path=embeddings_path, load_gallery=False)
+    fr.create_embeddings()
 
     # 3 create train data set
     LOGGER.info('4/7 creating train data set...')
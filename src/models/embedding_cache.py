@@ -0,0 +1,175 @@
+import os
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+import numpy as np
+import cv2
+
+LOGGER = logging.getLogger('embedding-cache')
+
+
+def perceptual_hash(face: np.ndarray, hash_size: int = 16) -> str:
+    """ Computes the difference hash of an aligned face
+
+    Args:
+        face (np.ndarray): The aligned face.
+        hash_size (int): Number of compared pixels per row and column. The hash has hash_size ** 2 bits.
+
+    Returns:
+        hash (str): The hash as hex string.
+    """
+    face = np.asarray(face)
+    if face.dtype != np.uint8:
+        face = cv2.normalize(face, None, 0, 255, cv2.NORM_MINMAX).astype(np.uint8)
+    if face.ndim == 3:
+        face = cv2.cvtColor(face, cv2.COLOR_RGB2GRAY)
+    small = cv2.resize(face, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+    return np.packbits(small[:, 1:] > small[:, :-1]).tobytes().hex()
+
+
+class EmbeddingCache(object):
+    """ Least recently used cache of face embeddings with an optional persistent tier
+
+    The embeddings are keyed by the perceptual hash of the aligned face, so identical faces of re-uploaded or
+    overlapping videos are encoded once. Entries evicted from memory stay available in the sqlite database at path.
+    All methods can be called from several threads. Several processes can share the database, it is written in
+    write-ahead-log mode with one transaction per encoded batch.
+
+    Args:
+        max_size (int): Maximum number of embeddings kept in memory.
+        path (str): Path to the sqlite database of the persistent tier. Only keeps embeddings in memory if None.
+        namespace (str): Separates the embeddings of different encoders, e.g. the encoder name.
+        timeout (float): Seconds to wait for a write lock on the database that is held by another process.
+    """
+
+    def __init__(self, max_size: int = 10000, path: str = None, namespace: str = '', timeout: float = 60.0):
+        self.max_size = max_size
+        self.path = path
+        self.namespace = namespace
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.connection = None
+
+        if path is not None:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self.connection = sqlite3.connect(path, timeout=timeout, check_same_thread=False)
+            self.connection.execute('PRAGMA journal_mode=WAL')
+            self.connection.execute('CREATE TABLE IF NOT EXISTS embeddings '
+                                    '(key TEXT PRIMARY KEY, dtype TEXT, embedding BLOB)')
+            self.connection.commit()
+
+    def key(self, face: np.ndarray) -> str:
+        """ Returns the key of an aligned face
+
+        Args:
+            face (np.ndarray): The aligned face.
+
+        Returns:
+            key (str): The namespace and the perceptual hash of the face.
+        """
+        return f'{self.namespace}:{perceptual_hash(face)}'
+
+    def get(self, key: str):
+        """ Looks up an embedding in memory and then in the persistent tier
+
+        Args:
+            key (str): The key of the face.
+
+        Returns:
+            embedding (np.ndarray): The cached embedding or None.
+        """
+        with self.lock:
+            embedding = self.entries.get(key)
+            if embedding is not None:
+                self.entries.move_to_end(key)
+            elif self.connection is not None:
+                row = self.connection.execute('SELECT dtype, embedding FROM embeddings WHERE key = ?',
+                                              (key,)).fetchone()
+                if row is not None:
+                    embedding = np.frombuffer(row[1], dtype=row[0])
+                    self._remember(key, embedding)
+
+            if embedding is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return embedding
+
+    def put(self, key: str, embedding: np.ndarray):
+        """ Stores an embedding
+
+        Args:
+            key (str): The key of the face.
+            embedding (np.ndarray): The embedding of the face.
+        """
+        self.put_many([key], [embedding])
+
+    def put_many(self, keys: list, embeddings: list):
+        """ Stores embeddings with a single transaction of the persistent tier
+
+        Args:
+            keys (list): The keys of the faces.
+            embeddings (list): The embeddings of the faces.
+        """
+        embeddings = [np.asarray(embedding) for embedding in embeddings]
+        with self.lock:
+            for key, embedding in zip(keys, embeddings):
+                self._remember(key, embedding)
+            if self.connection is not None:
+                with self.connection:
+                    self.connection.executemany('INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?)',
+                                                [(key, embedding.dtype.str, embedding.tobytes())
+                                                 for key, embedding in zip(keys, embeddings)])
+
+    def _remember(self, key: str, embedding: np.ndarray):
+        """ Adds an embedding to the memory and evicts the least recently used one """
+        self.entries[key] = embedding
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def predict(self, encoder, faces: np.ndarray) -> list:
+        """ Returns the embeddings of aligned faces and only encodes the faces that are not cached
+
+        Args:
+            encoder (model): Encoder with a predict method.
+            faces (np.ndarray): Batch of aligned faces.
+
+        Returns:
+            embeddings (list): The embedding of every face.
+        """
+        keys = [self.key(face) for face in faces]
+        embeddings = [self.get(key) for key in keys]
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+
+        if missing:
+            new_embeddings = list(encoder.predict(np.asarray(faces)[missing]))
+            self.put_many([keys[i] for i in missing], new_embeddings)
+            for i, embedding in zip(missing, new_embeddings):
+                embeddings[i] = embedding
+        return embeddings
+
+    def get_statistics(self) -> dict:
+        """ Returns the hit and miss counts
+
+        Returns:
+            statistics (dict): hits, misses, hit rate and number of embeddings in memory.
+        """
+        with self.lock:
+            total = self.hits + self.misses
+            return {'hits': self.hits,
+                    'misses': self.misses,
+                    'hit_rate': self.hits / total if total else 0.0,
+                    'size': len(self.entries)}
+
+    def close(self):
+        """ Closes the persistent tier """
+        with self.lock:
+            if self.connection is not None:
+                self.connection.close()
+                self.connection = None
@@ -0,0 +1,88 @@
+import os
+import json
+import pickle
+import logging
+import numpy as np
+
+LOGGER = logging.getLogger('embedding-store')
+
+
+class EmbeddingStore(object):
+    """ Stores the gallery as a float32 matrix that is memory-mapped, an int32 label id per row and a label table
+
+    Processes that load the same store share the pages of the matrix instead of holding their own copy.
+
+    Args:
+        path (str): Base path of the files. The matrix is saved at <path>.npy, the label ids at <path>_label_ids.npy
+            and the label table at <path>_labels.json.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.embeddings_path = f'{path}.npy'
+        self.label_ids_path = f'{path}_label_ids.npy'
+        self.label_table_path = f'{path}_labels.json'
+
+    def exists(self) -> bool:
+        """ Returns whether the store was saved
+
+        Returns:
+            exists (bool): True if all files exist.
+        """
+        return all(os.path.exists(path) for path in [self.embeddings_path, self.label_ids_path,
+                                                     self.label_table_path])
+
+    def save(self, labels: list, embeddings):
+        """ Replaces the store
+
+        Args:
+            labels (list): Entity name of every embedding.
+            embeddings (list): List of face embeddings or a matrix with one embedding per row.
+        """
+        label_table = sorted(set(labels))
+        label_index = {label: i for i, label in enumerate(label_table)}
+        label_ids = np.fromiter((label_index[label] for label in labels), dtype=np.int32, count=len(labels))
+        matrix = np.asarray(embeddings, dtype=np.float32)
+        if matrix.ndim != 2:
+            matrix = matrix.reshape(len(labels), -1) if len(labels) else np.zeros((0, 0), dtype=np.float32)
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        # write every file completely before replacing the old store
+        with open(f'{self.embeddings_path}.tmp', 'wb') as f:
+            np.save(f, matrix)
+        with open(f'{self.label_ids_path}.tmp', 'wb') as f:
+            np.save(f, label_ids)
+        with open(f'{self.label_table_path}.tmp', 'w') as f:
+            json.dump(label_table, f)
+        for path in [self.embeddings_path, self.label_ids_path, self.label_table_path]:
+            os.replace(f'{path}.tmp', path)
+
+    def load(self):
+        """ Maps the store into memory
+
+        Returns:
+            labels (list): Entity name of every embedding.
+            embeddings (np.ndarray): Read-only memory-mapped float32 matrix with one embedding per row.
+        """
+        embeddings = np.load(self.embeddings_path, mmap_mode='r')
+        label_ids = np.load(self.label_ids_path)
+        with open(self.label_table_path) as f:
+            label_table = json.load(f)
+        return [label_table[i] for i in label_ids.tolist()], embeddings
+
+    def migrate(self, labels_path: str, embeddings_path: str):
+        """ Converts pickled lists of labels and embeddings to the store
+
+        Args:
+            labels_path (str): Path to the pickled labels.
+            embeddings_path (str): Path to the pickled embeddings.
+        """
+        with open(labels_path, 'rb') as f:
+            labels = pickle.load(f)
+        with open(embeddings_path, 'rb') as f:
+            embeddings = pickle.load(f)
+        self.save(labels, embeddings)
+        LOGGER.info(f'Migrated {len(labels)} embeddings from {embeddings_path} to {self.embeddings_path}')
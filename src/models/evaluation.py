@@ -1,13 +1,17 @@
 import itertools
 import os
+import time
 import logging
 import pandas as pd
 import numpy as np
 import mimetypes
 import random
 import pickle
+import cv2
 from src.models.approximate_k_nearest_neighbors import ApproximateKNearestNeighbors
-from src.models.face_recognition import FaceRecognition
+from src.models.face_recognition import FaceRecognition, CONFIG
+from src.models.face_prefilter import FacePrefilter
+from src.preprocessing.frame_sampling import FrameSampler
 from src.postprocessing.graph_postprocessing import extract_scenes
 
 LOGGER = logging.getLogger('evaluation')
@@ -18,7 +22,10 @@ def evaluate_on_dataset(path: str = 'data/datasets/ytcelebrity',
                         ratio: float = 1.0,
                         seed: int = 42,
                         single_true: bool = False,
-                        scene_extraction: int = 0):
+                        scene_extraction: int = 0,
+                        img_width: int = 500,
+                        detection_width: int = None,
+                        prefilter: str = None):
     """ Detects entities in a dataset and calculates evaluation metrics
 
     Args:
@@ -28,6 +35,11 @@ def evaluate_on_dataset(path: str = 'data/datasets/ytcelebrity',
         seed (int): Parameter to control randomness for repeatable experiments.
         single_true (bool): If the evaluation dataset only gives a single label for images with multiple entities.
         scene_extraction: (int): Whether to postprocess detections using the scene extraction algorithm. Disabled with 0.
+        img_width (int): Width to which the images are scaled if detection_width is None.
+        detection_width (int): Width of the proxy images the faces are detected on. The faces are then aligned at the
+            original resolution. Uses img_width if None.
+        prefilter (str): Cheap detector that rejects frames without faces before the face detection, 'haar' or
+            'ssd'. Every frame is detected if None.
 
     Returns:
         scores (list): The evaluation scores. [accuracy, precision, recall, f1]
@@ -51,7 +63,10 @@ def evaluate_on_dataset(path: str = 'data/datasets/ytcelebrity',
 
     # Model Training
     hunter = FaceRecognition(thumbnail_list=thumbnail_sample,
-                             thumbnails_path=os.path.join(path_thumbnails, 'thumbnails'))
+                             thumbnails_path=os.path.join(path_thumbnails, 'thumbnails'),
+                             img_width=img_width,
+                             detection_width=detection_width,
+                             prefilter=prefilter)
     recognizer_model = ApproximateKNearestNeighbors()
 
     # Check if there are still any thumbnails missing
@@ -63,6 +78,7 @@ def evaluate_on_dataset(path: str = 'data/datasets/ytcelebrity',
     scores = np.zeros(4)
     files = []
     per_file_results = []
+    start = time.perf_counter()
     for index, file in data.iterrows():
         path_to_file = os.path.join(path, file['file'])
         if mimetypes.guess_type(path_to_file)[0].startswith('video'):
@@ -86,10 +102,150 @@ def evaluate_on_dataset(path: str = 'data/datasets/ytcelebrity',
     scores = np.divide(scores, len(data))
     LOGGER.info(f'Total Accuracy: {scores[0]}, Total Precision: {scores[1]}, Total Recall: {scores[2]}, '
                 f'Total F1: {scores[3]} ')
+    LOGGER.info(f'Recognition took {time.perf_counter() - start:.1f}s with img_width {img_width} and '
+                f'detection_width {detection_width}')
+    if hunter.prefilter is not None:
+        LOGGER.info(f'Prefilter {prefilter}: {hunter.prefilter.get_statistics()}')
 
     return scores, files, per_file_results
 
 
+def evaluate_prefilter(frames, prefilter: FacePrefilter, detector, batch_size: int = 16) -> dict:
+    """ Compares the cascade of the prefilter and the landmark detector to the landmark detector alone
+
+    A frame on which the landmark detector alone finds a face, but which is rejected by the prefilter, is a missed
+    face frame. The face frame recall is the ratio of face frames that are passed on to the landmark detector.
+
+    Args:
+        frames (iterable): RGB frames of the same size.
+        prefilter (FacePrefilter): The cheap detector.
+        detector: The landmark detector with a detect(imgs, landmarks=True) method, e.g. the MTCNN of facenet-pytorch.
+        batch_size (int): Number of frames per batch.
+
+    Returns:
+        report (dict): Number of frames, rejection rate, face frame recall, milliseconds per frame of the prefilter
+            and the detector and the expected speedup of the detection.
+    """
+    counts = {'frames': 0, 'face_frames': 0, 'rejected': 0, 'missed_face_frames': 0}
+    prefilter_seconds = 0.0
+    detector_seconds = 0.0
+
+    def evaluate_batch(batch):
+        nonlocal prefilter_seconds, detector_seconds
+        start = time.perf_counter()
+        candidates = prefilter.is_candidate(batch)
+        prefilter_seconds += time.perf_counter() - start
+
+        start = time.perf_counter()
+        boxes, _, _ = detector.detect(np.stack(batch), landmarks=True)
+        detector_seconds += time.perf_counter() - start
+
+        faces = np.array([b is not None and len(b) > 0 for b in boxes], dtype=bool)
+        counts['frames'] += len(batch)
+        counts['face_frames'] += int(faces.sum())
+        counts['rejected'] += int((~candidates).sum())
+        counts['missed_face_frames'] += int((faces & ~candidates).sum())
+
+    batch = []
+    for frame in frames:
+        batch.append(frame)
+        if len(batch) == batch_size:
+            evaluate_batch(batch)
+            batch = []
+    if batch:
+        evaluate_batch(batch)
+
+    frames = max(counts['frames'], 1)
+    report = _prefilter_report(counts, prefilter_seconds / frames * 1000, detector_seconds / frames * 1000)
+    LOGGER.info(f'Prefilter {prefilter.method}: {report}')
+    return report
+
+
+def _prefilter_report(counts: dict, prefilter_ms: float, detector_ms: float) -> dict:
+    """ Adds the rejection rate, the face frame recall and the expected speedup to the counts """
+    rejection_rate = counts['rejected'] / max(counts['frames'], 1)
+    cascade_ms = prefilter_ms + (1 - rejection_rate) * detector_ms
+    return dict(counts,
+                rejection_rate=rejection_rate,
+                face_frame_recall=(1 - counts['missed_face_frames'] / counts['face_frames']
+                                   if counts['face_frames'] else 1.0),
+                prefilter_ms=prefilter_ms,
+                detector_ms=detector_ms,
+                speedup=detector_ms / cascade_ms if cascade_ms else 1.0)
+
+
+def evaluate_prefilter_on_dataset(path: str = 'data/datasets/ytcelebrity',
+                                  prefilter: str = 'haar',
+                                  img_width: int = 500,
+                                  max_samples: int = 100,
+                                  batch_size: int = 16) -> dict:
+    """ Measures the rejection rate and the missed faces of a prefilter on the frames of a dataset
+
+    The videos are sampled by second like for the face recognition and the frames are scaled to img_width.
+
+    Args:
+        path (str): The Location of the dataset.
+        prefilter (str): The cheap detector, 'haar' or 'ssd'.
+        img_width (int): Width to which the frames are scaled.
+        max_samples (int): Maximum number of samples per video.
+        batch_size (int): Number of frames per batch.
+
+    Returns:
+        report (dict): The report of evaluate_prefilter over all frames of the dataset.
+    """
+    from facenet_pytorch import MTCNN
+
+    data = pd.read_csv(os.path.join(path, 'information.csv'))
+    detector = MTCNN(keep_all=True, post_process=False, device=CONFIG['face-recognition']['device'])
+    face_prefilter = FacePrefilter(prefilter, CONFIG['face-recognition'].get('prefilter-width', 160),
+                                   prototxt=CONFIG['face-recognition'].get('ssd-prototxt'),
+                                   weights=CONFIG['face-recognition'].get('ssd-weights'))
+
+    def frames():
+        for _, file in data.iterrows():
+            path_to_file = os.path.join(path, file['file'])
+            if mimetypes.guess_type(path_to_file)[0].startswith('video'):
+                samples = (frame for _, frame in FrameSampler(path_to_file, end=max_samples))
+            else:
+                samples = [cv2.imread(path_to_file)]
+            for frame in samples:
+                frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+                if frame.shape[1] > img_width:
+                    frame = cv2.resize(frame, (img_width, int(frame.shape[0] * img_width / frame.shape[1])))
+                # frames of different size are not batched together
+                yield frame
+
+    reports = []
+    batch = []
+    for frame in frames():
+        if batch and frame.shape != batch[0].shape:
+            reports.append(evaluate_prefilter(batch, face_prefilter, detector, batch_size))
+            batch = []
+        batch.append(frame)
+    if batch:
+        reports.append(evaluate_prefilter(batch, face_prefilter, detector, batch_size))
+    report = merge_prefilter_reports(reports)
+    LOGGER.info(f'Prefilter {prefilter} on {path}: {report}')
+    return report
+
+
+def merge_prefilter_reports(reports: list) -> dict:
+    """ Combines the reports of evaluate_prefilter on parts of the frames
+
+    Args:
+        reports (list): The reports.
+
+    Returns:
+        report (dict): The report over all frames.
+    """
+    counts = {key: sum(report[key] for report in reports)
+              for key in ['frames', 'face_frames', 'rejected', 'missed_face_frames']}
+    frames = max(counts['frames'], 1)
+    prefilter_ms = sum(report['prefilter_ms'] * report['frames'] for report in reports) / frames
+    detector_ms = sum(report['detector_ms'] * report['frames'] for report in reports) / frames
+    return _prefilter_report(counts, prefilter_ms, detector_ms)
+
+
 def get_evaluation_metrics(y_pred: list = None,
                            y_true: list = None,
                            missing_entities: set = None,
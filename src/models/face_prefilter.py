@@ -0,0 +1,109 @@
+import os
+import logging
+import numpy as np
+import cv2
+
+LOGGER = logging.getLogger('face-prefilter')
+
+PREFILTERS = ['haar', 'ssd']
+
+
+class FacePrefilter(object):
+    """ Rejects frames without faces with a cheap detector before the landmark detector runs on them
+
+    The frames are scaled to a small proxy for the cheap detector, of the given width for 'haar' and of the 300x300
+    input of the network for 'ssd'. It is tuned for recall rather than precision, false positives only cost a run of
+    the landmark detector, while a missed face is lost.
+
+    'haar' runs the OpenCV Haar cascades for frontal faces and profiles (both directions) on the grayscale proxy. The
+    profiles are only searched on frames without a frontal face, so they triple the cost of frames without faces.
+    'ssd' runs the OpenCV DNN ResNet-10 SSD face detector, whose Caffe model files have to be downloaded separately.
+
+    Args:
+        method (str): 'haar' or 'ssd'.
+        width (int): Width of the proxy the cascades of 'haar' run on. Frames that are narrower are not scaled. The
+            cascades find faces of at least 24 pixels of the proxy, so smaller faces of the frames are rejected.
+            Unused by 'ssd'.
+        scale_factor (float): Ratio between the face sizes the cascades search for 'haar'.
+        min_neighbors (int): Minimum number of overlapping detections of a face for 'haar'.
+        profiles (bool): Whether 'haar' also searches for profiles.
+        confidence (float): Minimum confidence of a face for 'ssd'.
+        prototxt (str): Path to the deploy.prototxt of the SSD.
+        weights (str): Path to the res10_300x300_ssd_iter_140000.caffemodel of the SSD.
+    """
+
+    def __init__(self, method: str = 'haar', width: int = 160, scale_factor: float = 1.2, min_neighbors: int = 2,
+                 profiles: bool = True, confidence: float = 0.3, prototxt: str = None, weights: str = None):
+        if method not in PREFILTERS:
+            raise Exception(f'Unknown prefilter {method}, options are {PREFILTERS}')
+        self.method = method
+        self.width = width
+        self.scale_factor = scale_factor
+        self.min_neighbors = min_neighbors
+        self.profiles = profiles
+        self.confidence = confidence
+        self.statistics = {'frames': 0, 'rejected': 0}
+
+        if method == 'haar':
+            names = ['haarcascade_frontalface_default.xml'] + (['haarcascade_profileface.xml'] if profiles else [])
+            self.cascades = [cv2.CascadeClassifier(os.path.join(cv2.data.haarcascades, name)) for name in names]
+        else:
+            if prototxt is None or weights is None or not os.path.exists(prototxt) or not os.path.exists(weights):
+                raise Exception('The SSD prefilter requires the paths to its deploy.prototxt and caffemodel')
+            self.net = cv2.dnn.readNetFromCaffe(prototxt, weights)
+
+    def is_candidate(self, imgs: list) -> np.ndarray:
+        """ Finds the frames that may show a face
+
+        Args:
+            imgs (list): List of RGB frames of the same size.
+
+        Returns:
+            candidates (np.ndarray): Whether each frame may show a face.
+        """
+        if not imgs:
+            return np.zeros(0, dtype=bool)
+        if self.method == 'haar':
+            height, width = imgs[0].shape[:2]
+            dsize = (width, height)
+            if width > self.width:
+                dsize = (self.width, max(int(height * self.width / width), 1))
+            candidates = np.fromiter((self._detect_haar(img, dsize) for img in imgs), dtype=bool, count=len(imgs))
+        else:
+            candidates = self._detect_ssd(imgs)
+
+        self.statistics['frames'] += len(imgs)
+        self.statistics['rejected'] += int(len(imgs) - candidates.sum())
+        return candidates
+
+    def _detect_haar(self, img: np.ndarray, dsize: tuple) -> bool:
+        """ Whether any cascade finds a face on the grayscale proxy or, for profiles, on its mirror image """
+        gray = cv2.cvtColor(cv2.resize(img, dsize, interpolation=cv2.INTER_AREA), cv2.COLOR_RGB2GRAY)
+        gray = cv2.equalizeHist(gray)
+        for i, cascade in enumerate(self.cascades):
+            for proxy in ([gray] if i == 0 else [gray, cv2.flip(gray, 1)]):
+                if len(cascade.detectMultiScale(proxy, self.scale_factor, self.min_neighbors)):
+                    return True
+        return False
+
+    def _detect_ssd(self, imgs: list) -> np.ndarray:
+        """ Whether the SSD finds a face with the minimum confidence, for a batch of frames """
+        # scaled once to the input size of the SSD, which was trained on BGR images
+        proxies = [cv2.cvtColor(cv2.resize(img, (300, 300), interpolation=cv2.INTER_AREA), cv2.COLOR_RGB2BGR)
+                   for img in imgs]
+        self.net.setInput(cv2.dnn.blobFromImages(proxies, 1.0, (300, 300), (104.0, 177.0, 123.0)))
+        detections = self.net.forward()  # (1, 1, n, 7) with [image, class, confidence, x1, y1, x2, y2]
+        candidates = np.zeros(len(imgs), dtype=bool)
+        found = detections[0, 0, detections[0, 0, :, 2] >= self.confidence, 0].astype(int)
+        candidates[found] = True
+        return candidates
+
+    def get_statistics(self) -> dict:
+        """ Returns the number of checked and rejected frames and the rejection rate since the prefilter was created
+
+        Returns:
+            statistics (dict): frames, rejected and rejection_rate.
+        """
+        frames = self.statistics['frames']
+        return dict(self.statistics, rejection_rate=self.statistics['rejected'] / frames if frames else 0.0)
+
@@ -1,14 +1,22 @@
 import os
-import pickle
 import logging
+import multiprocessing
 import numpy as np
 import cv2
-from deepface import DeepFace
-from PIL import Image
-from deepface.commons import functions
-from facenet_pytorch import MTCNN
-from src.preprocessing.facial_preprocessing import face_alignment
-from src.utils.utils import image_files_in_folder, get_config
+from src.preprocessing.facial_preprocessing import batch_face_alignment
+from src.preprocessing.frame_sampling import FrameSampler
+from src.models.sharding import split_samples, merge_shards, init_worker, recognize_shard
+from src.models.checkpoint import Checkpoint, RecognitionCheckpoint, get_key, get_model_params
+from src.models.face_tracking import FaceTracker
+from src.models.embedding_cache import EmbeddingCache
+from src.models.gallery import GalleryBuilder, GalleryManifest, list_thumbnails
+from src.models.embedding_store import EmbeddingStore
+from src.models.nearest_neighbors import cosine_nearest_neighbors, normalize
+from src.models.gallery_compaction import compact_gallery
+from src.models.onnx_encoder import load_encoder
+from src.models.face_prefilter import FacePrefilter
+from src.utils.utils import get_config, get_peak_rss
+from src.utils.pipeline import Pipeline
 
 LOGGER = logging.getLogger('face-recognition')
 
@@ -30,28 +38,103 @@ class FaceRecognition(object):
                  img_width: int = 500,
                  encoder_name: str = 'ArcFace',
                  labels_path: str = 'data/embeddings/labels.pickle',
-                 embeddings_path: str = 'data/embeddings/embeddings.pickle'):
+                 embeddings_path: str = 'data/embeddings/embeddings.pickle',
+                 batch_pixels: int = 18000000,
+                 face_batch_size: int = 64,
+                 detection_width: int = None,
+                 track_interval: int = 0,
+                 cache_size: int = 0,
+                 cache_path: str = None,
+                 duplicate_threshold: float = 0,
+                 load_gallery: bool = True,
+                 match_chunk_size: int = 100000,
+                 prototypes: int = 0,
+                 prototype_distance: float = 0.1,
+                 encoder_backend: str = 'tensorflow',
+                 prefilter: str = None,
+                 prefilter_width: int = 160):
         """ create or load kg_encodings. create detector, encoder
 
         Args:
             thumbnail_list (list): For sample use.
             thumbnails_path (str): Path to thumbnail directory.
-            img_width (int): Scale the image to fixed new width.
+            img_width (int): Scale the image to fixed new width. Frames of videos keep their original resolution if
+                detection_width is set.
             encoder_name (int): Options are "VGG-Face", "Facenet", "OpenFace", "DeepFace", "DeepID", "ArcFace", "Dlib".
-            labels_path (str): Path to save and load thumbnail labels
-            embeddings_path (str): Path to save and load thumbnail embeddings
+            labels_path (str): Path to load pickled thumbnail labels from, they are migrated to the embedding store
+            embeddings_path (str): Path to load pickled thumbnail embeddings from. The embedding store is saved next
+                to it without the extension.
+            batch_pixels (int): Maximum number of pixels of the frames that are detected in one batch.
+            face_batch_size (int): Maximum number of faces that are aligned and encoded in one batch.
+            detection_width (int): Scale a proxy of the image to this width for the face detection. The faces are
+                aligned from the image at its original resolution. Detects on the image scaled to img_width if None.
+            track_interval (int): Follow faces over consecutive samples of a video and embed a tracked face only
+                every track_interval samples or when its quality improves. Embeds every face if 0.
+            cache_size (int): Number of embeddings kept in an LRU cache keyed by the perceptual hash of the aligned
+                face. Encodes every face if 0.
+            cache_path (str): Path to the sqlite database that persists the cached embeddings.
+            duplicate_threshold (float): Samples of a video whose downsampled grayscale image differs from the last
+                processed sample by less than this mean absolute difference (0-255) reuse its recognitions. Every
+                sample is processed if 0.
+            load_gallery (bool): Whether the embeddings of the thumbnails are loaded, or created if they do not exist.
+                Without them, the instance can only create embeddings, e.g. while the gallery is built.
+            match_chunk_size (int): Number of gallery embeddings that faces are compared to at once without a
+                recognizer model.
+            prototypes (int): Faces are matched against at most this many prototypes per entity, which replace
+                near-duplicate and clustered embeddings of its thumbnails. Matches against every embedding if 0.
+            prototype_distance (float): Cosine distance below which embeddings of an entity are near-duplicates.
+            encoder_backend (str): 'tensorflow' runs the encoder with Keras, 'onnx' exports it once to ONNX and runs it
+                with ONNX Runtime and 'onnx-int8' does the same with int8 weights.
+            prefilter (str): Cheap detector that rejects frames without faces before MTCNN runs on them, 'haar' or
+                'ssd'. The paths to the SSD model are read from ssd-prototxt and ssd-weights of the configuration.
+                MTCNN runs on every frame if None. Thumbnails of the gallery are never prefiltered.
+            prefilter_width (int): Width of the proxy the 'haar' prefilter runs on.
         """
         self.thumbnail_list = thumbnail_list
         self.thumbnails_path = thumbnails_path
         self.img_width = img_width
+        self.encoder_name = encoder_name
         self.labels_path = labels_path
         self.embeddings_path = embeddings_path
-        self.detector = MTCNN(keep_all=True, post_process=False, device=CONFIG['face-recognition']['device'])
-        self.encoder = DeepFace.build_model(encoder_name)
-        self.target = functions.find_input_shape(self.encoder)  # (150,150) encoder input shape
-        self.labels, self.embeddings = self.load_embeddings()  # store the 2 lists in labels.pickle encoddings.pickle
+        self.batch_pixels = batch_pixels
+        self.face_batch_size = face_batch_size
+        self.detection_width = detection_width
+        self.track_interval = track_interval
+        self.cache_size = cache_size
+        self.cache_path = cache_path
+        self.duplicate_threshold = duplicate_threshold
+        self.match_chunk_size = match_chunk_size
+        self.prototypes = prototypes
+        self.prototype_distance = prototype_distance
+        self.encoder_backend = encoder_backend
+        self.prefilter_method = prefilter
+        self.prefilter_width = prefilter_width
+        from facenet_pytorch import MTCNN  # imports torch, so it is only loaded if faces are detected
 
-    def recognize_video(self, video_path: str, recognizer_model=None, distance_threshold=0.6, by='second', show_frames: bool = False):
+        self.detector = MTCNN(keep_all=True, post_process=False, device=CONFIG['face-recognition']['device'])
+        self.prefilter = None
+        if prefilter is not None:
+            self.prefilter = FacePrefilter(prefilter, prefilter_width,
+                                           prototxt=CONFIG['face-recognition'].get('ssd-prototxt'),
+                                           weights=CONFIG['face-recognition'].get('ssd-weights'))
+        self.encoder, self.target = load_encoder(encoder_name, encoder_backend)  # (150,150) encoder input shape
+        # the embeddings of the backends differ slightly, so they are cached separately
+        cache_namespace = encoder_name if encoder_backend == 'tensorflow' else f'{encoder_name}_{encoder_backend}'
+        self.cache = EmbeddingCache(cache_size, cache_path, cache_namespace) if cache_size else None
+        self.store = EmbeddingStore(os.path.splitext(embeddings_path)[0])
+        self._normalized_gallery = None
+        self._compact_gallery = None
+        self.labels, self.embeddings = [], []
+        if load_gallery:
+            self.labels, self.embeddings = self.load_embeddings()
+        self.pipeline_statistics = {}
+        self.tracking_statistics = {}
+        self.skip_statistics = {'samples': 0, 'skipped': 0}
+        self.peak_rss = None
+
+    def recognize_video(self, video_path: str, recognizer_model=None, distance_threshold=0.6, by='second',
+                        show_frames: bool = False, sampling: str = 'auto', queue_size: int = 2, processes: int = 1,
+                        overlap: int = 0, checkpoint_dir: str = None, checkpoint_interval: int = 300):
         """ recognize faces on a frame or second level
 
         Args:
@@ -60,38 +143,247 @@ class FaceRecognition(object):
             distance_threshold (float): The threshold below which recognitions are marked as unknown.
             by (str): Recognize by 'second' or 'frame'.
             show_frames (bool): Whether each frame should be displayed to the user or not.
+            sampling (str): How frames are sampled by second. Options are 'auto', 'grab' and 'seek'.
+            queue_size (int): Maximum number of batches waiting between two pipeline stages.
+            processes (int): Number of worker processes that recognize time ranges of the video in parallel.
+            overlap (int): Number of samples before each time range that are processed again by its worker.
+            checkpoint_dir (str): Directory to checkpoint the results in. A restarted job resumes from there.
+            checkpoint_interval (int): Number of samples between two checkpoints.
 
         Returns:
             frame_faces_list (list): List of recognized entities per frame/second.
             detected_faces (list): List of identical entities.
             timestamps (float): The corresponding timestamps to the detections.
         """
+        timestamps = []
+        frame_faces_list = []
+
+        for timestamp, entities, _ in self.iter_recognitions(video_path, recognizer_model, distance_threshold, by,
+                                                             show_frames, sampling, queue_size,
+                                                             processes=processes, overlap=overlap,
+                                                             checkpoint_dir=checkpoint_dir,
+                                                             checkpoint_interval=checkpoint_interval):
+            timestamps.append(timestamp)
+            frame_faces_list.append(entities)
+
+        detected_faces = {entity for l in frame_faces_list for entity in l}
+
+        return detected_faces, frame_faces_list, timestamps
+
+    def iter_recognitions(self, video_path: str, recognizer_model=None, distance_threshold=0.6, by='second',
+                          show_frames: bool = False, sampling: str = 'auto', queue_size: int = 2, start: int = 0,
+                          end: int = None, processes: int = 1, overlap: int = 0, checkpoint_dir: str = None,
+                          checkpoint_interval: int = 300):
+        """ recognize faces on a frame or second level and yield the results while the video is processed
+
+        Decoding, detection, alignment/encoding and matching run as overlapping pipeline stages. The throughput and
+        queue depth of each stage are logged and kept in pipeline_statistics, the peak memory usage in peak_rss.
+        If track_interval is set, the embeddings that were saved by tracking faces are kept in tracking_statistics.
+        If duplicate_threshold is set, the number of skipped near-duplicate samples is kept in skip_statistics.
+        If a prefilter is set, its rejection rate is logged.
+
+        Args:
+            video_path (str): Path to the video.
+            recognizer_model (any model): Model trained with embeddings to predict entities.
+            distance_threshold (float): The threshold below which recognitions are marked as unknown.
+            by (str): Recognize by 'second' or 'frame'.
+            show_frames (bool): Whether each frame should be displayed to the user or not.
+            sampling (str): How frames are sampled by second. Options are 'auto', 'grab' and 'seek'.
+            queue_size (int): Maximum number of batches waiting between two pipeline stages.
+            start (int): Index of the first sample to recognize.
+            end (int): Index of the sample to stop at (exclusive). Recognizes until the end of the video if None.
+            processes (int): Number of worker processes that recognize time ranges of the video in parallel.
+            overlap (int): Number of samples before each time range that are processed again by its worker.
+            checkpoint_dir (str): Directory to checkpoint the results in. A restarted job resumes from there.
+            checkpoint_interval (int): Number of samples between two checkpoints.
+
+        Yields:
+            timestamp (float): The timestamp of the frame.
+            entities (list): The recognized entities in the frame.
+            boxes (list): The boxes [x, y, w, h] of the recognized faces in the same order.
+        """
         if not os.path.exists(video_path):
             LOGGER.info(f'{video_path} does not exists')
         LOGGER.debug(video_path)
 
         LOGGER.info(f'Starting face recognition on {video_path}')
 
-        video = cv2.VideoCapture(video_path)
+        if processes > 1:
+            yield from self.iter_sharded_recognitions(video_path, recognizer_model, processes, overlap,
+                                                      distance_threshold=distance_threshold, by=by, sampling=sampling,
+                                                      queue_size=queue_size, checkpoint_dir=checkpoint_dir,
+                                                      checkpoint_interval=checkpoint_interval)
+            return
+
+        checkpoint = None
+        if checkpoint_dir is not None:
+            checkpoint = RecognitionCheckpoint(checkpoint_dir, video_path, {
+                'face_recognition': self.get_params(),
+                'recognizer_model': get_model_params(recognizer_model),
+                'distance_threshold': distance_threshold,
+                'by': by,
+                'start': start,
+                'end': end
+            })
+            start, results = checkpoint.load(start)
+            yield from results
+
+        tracker = self.create_tracker()
+        pipeline = Pipeline([
+            ('detect', lambda batch: (batch[0], batch[1], self.batch_detect(batch[1]))),
+            ('encode', lambda batch: (batch[0], self.batch_encode(batch[1], batch[2], tracker),
+                                      [[face['box'] for face in frame_faces] for frame_faces in batch[2]])),
+            ('match', lambda batch: (batch[0], self.recognize_embeddings(batch[1], recognizer_model,
+                                                                         distance_threshold), batch[2]))
+        ], queue_size, item_size=lambda batch: len(batch[1]))
+
+        last = ([], [])
+        pending = []
+        try:
+            for (timestamps, sources), frames_entities, frames_boxes in pipeline.run(
+                    self.batch_frames(video_path, by, show_frames, sampling, start, end)):
+                results = []
+                for timestamp, source in zip(timestamps, sources):
+                    if source is not None:
+                        last = (frames_entities[source], frames_boxes[source])
+                    results.append((timestamp,) + last)
+                start += len(results)
+                if checkpoint is not None:
+                    pending.extend(results)
+                    if len(pending) >= checkpoint_interval:
+                        checkpoint.append(start, pending)
+                        pending = []
+                yield from results
+            if checkpoint is not None:
+                checkpoint.remove()
+        finally:
+            self.pipeline_statistics = pipeline.get_statistics()
+            if self.duplicate_threshold:
+                LOGGER.info(f'Skipped {self.skip_statistics["skipped"]} of {self.skip_statistics["samples"]} '
+                            f'samples as near-duplicates')
+            if tracker is not None:
+                self.tracking_statistics = tracker.get_statistics()
+                LOGGER.info(f'Tracking saved {self.tracking_statistics["saved"]} of '
+                            f'{self.tracking_statistics["faces"]} face embeddings')
+            if self.cache is not None:
+                LOGGER.info(f'Embedding cache: {self.cache.get_statistics()}')
+            if self.prefilter is not None:
+                LOGGER.info(f'Prefilter: {self.prefilter.get_statistics()}')
+            self.peak_rss = get_peak_rss()
+            if self.peak_rss is not None:
+                LOGGER.info(f'Peak memory usage: {self.peak_rss / 2 ** 20:.0f} MB')
+
+    def iter_sharded_recognitions(self, video_path: str, recognizer_model=None, processes: int = 2,
+                                  overlap: int = 0, **kwargs):
+        """ recognize faces by splitting the video into time ranges that are processed by a pool of workers
+
+        Every worker loads the models once. The index of the recognizer_model is built before the workers start, so
+        they only load it instead of building the same index at the same time. The results are yielded in the order
+        of the video and equal those of the serial processing. Tracking and the skipping of near-duplicates depend on
+        all previous samples, which a worker does not see, so they cannot be combined with sharding.
 
-        fps = video.get(cv2.CAP_PROP_FPS)
-        frame_number = 0  # for recognize by second
+        Args:
+            video_path (str): Path to the video.
+            recognizer_model (any model): Model trained with embeddings to predict entities.
+            processes (int): Number of worker processes.
+            overlap (int): Number of samples before each time range that are processed again by its worker.
+            kwargs: Further arguments for iter_recognitions.
+
+        Yields:
+            timestamp (float): The timestamp of the frame.
+            entities (list): The recognized entities in the frame.
+            boxes (list): The boxes [x, y, w, h] of the recognized faces in the same order.
+        """
+        if self.track_interval or self.duplicate_threshold:
+            raise Exception('Sharding over several processes does not support track_interval and duplicate_threshold, '
+                            'set processes to 1 or disable both')
+        sample_count = FrameSampler(video_path, kwargs.get('by', 'second')).sample_count
+        tasks = [(video_path, first, start, end, kwargs)
+                 for first, start, end in split_samples(sample_count, processes, overlap)]
+        LOGGER.info(f'Recognizing {sample_count} samples in {len(tasks)} time ranges')
+
+        if recognizer_model:
+            self.fit_recognizer(recognizer_model)
+            recognizer_model.wait()
+        context = multiprocessing.get_context('spawn')
+        with context.Pool(len(tasks), initializer=init_worker,
+                          initargs=(self.get_params(), recognizer_model)) as pool:
+            for shard in pool.imap(recognize_shard, tasks):
+                for _, timestamp, entities, boxes in merge_shards([shard]):
+                    yield timestamp, entities, boxes
+
+    def get_params(self) -> dict:
+        """ Returns the arguments to create an identical FaceRecognition, e.g. in a worker process
 
-        timestamps = []
-        frame_faces_list = []
+        Returns:
+            params (dict): The arguments of the constructor.
+        """
+        return {'thumbnail_list': self.thumbnail_list,
+                'thumbnails_path': self.thumbnails_path,
+                'img_width': self.img_width,
+                'encoder_name': self.encoder_name,
+                'labels_path': self.labels_path,
+                'embeddings_path': self.embeddings_path,
+                'batch_pixels': self.batch_pixels,
+                'face_batch_size': self.face_batch_size,
+                'detection_width': self.detection_width,
+                'track_interval': self.track_interval,
+                'cache_size': self.cache_size,
+                'cache_path': self.cache_path,
+                'duplicate_threshold': self.duplicate_threshold,
+                'match_chunk_size': self.match_chunk_size,
+                'prototypes': self.prototypes,
+                'prototype_distance': self.prototype_distance,
+                'encoder_backend': self.encoder_backend,
+                'prefilter': self.prefilter_method,
+                'prefilter_width': self.prefilter_width}
+
+    def create_tracker(self):
+        """ create a face tracker for the consecutive frames of a video
 
-        # for batch processing
-        frames = []
-        batch_size = 128
+        Returns:
+            tracker (FaceTracker): The tracker or None if track_interval is 0.
+        """
+        if not self.track_interval:
+            return None
+        return FaceTracker(reembed_interval=self.track_interval)
+
+    def batch_frames(self, video_path: str, by='second', show_frames: bool = False, sampling: str = 'auto',
+                     start: int = 0, end: int = None):
+        """ decode and scale the sampled frames of a video in batches
+
+        A batch is complete as soon as its frames reach batch_pixels pixels, so the memory used by the detection
+        does not depend on the resolution of the video. The frames are scaled to img_width, unless detection_width is
+        set and the faces are aligned from the frames at their original resolution. If duplicate_threshold is set,
+        samples that are nearly identical to the last processed frame are not part of the frames of the batch and do
+        not count towards batch_pixels.
 
-        success, frame = video.read()
+        Args:
+            video_path (str): Path to the video.
+            by (str): Sample by 'second' or 'frame'.
+            show_frames (bool): Whether each frame should be displayed to the user or not.
+            sampling (str): How frames are sampled by second. Options are 'auto', 'grab' and 'seek'.
+            start (int): Index of the first sample.
+            end (int): Index of the sample to stop at (exclusive).
+
+        Yields:
+            samples (tuple): The timestamps of the samples in the batch and, per sample, the index of its frame in
+                frames or None if the sample repeats the last processed frame.
+            frames (list): The RGB frames of the batch.
+        """
+        timestamps = []
+        sources = []
+        frames = []
+        pixels = 0
+        previous = None
+        self.skip_statistics = {'samples': 0, 'skipped': 0}
 
-        while success:
+        for timestamp, frame in FrameSampler(video_path, by, sampling, start=start, end=end):
             frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
 
-            # scale the frame
+            # scale the frame, the detection scales its own proxy if detection_width is set
             w, h = frame.shape[1], frame.shape[0]
-            if w > self.img_width:
+            if self.detection_width is None and w > self.img_width:
                 r = self.img_width / w
                 dsize = (self.img_width, int(h * r))
                 frame = cv2.resize(frame, dsize)
@@ -100,75 +392,71 @@ class FaceRecognition(object):
                 cv2.imshow('Frame', frame)
                 cv2.waitKey()
 
-            frames.append(frame)
-
-            # batch detect
-            if len(frames) == batch_size:
-                frame_faces_list.extend(self.batch_recognize_images(frames, recognizer_model, distance_threshold))
-                frames.clear()
-
-            # detected_faces = self.recognize_image(frame, recognizer_model)
-            # frame_faces_list.append(detected_faces)
-
-            if by == 'frame':
-                timestamp = (timestamps[-1] + 1000 / fps) if timestamps else 0.0
-                timestamps.append(timestamp)
+            timestamps.append(timestamp)
+            self.skip_statistics['samples'] += 1
 
-                success, frame = video.read()
+            thumbnail = None
+            if self.duplicate_threshold:
+                thumbnail = cv2.resize(cv2.cvtColor(frame, cv2.COLOR_RGB2GRAY), (32, 32),
+                                       interpolation=cv2.INTER_AREA).astype(np.int16)
+            if previous is not None and np.mean(np.abs(thumbnail - previous)) < self.duplicate_threshold:
+                sources.append(None)
+                self.skip_statistics['skipped'] += 1
             else:
-                # by second
-                timestamp = (timestamps[-1] + 1000) if timestamps else 0.0
-                timestamps.append(timestamp)
+                sources.append(len(frames))
+                frames.append(frame)
+                pixels += frame.shape[0] * frame.shape[1]
+                previous = thumbnail
 
-                frame_number += int(fps)
-                LOGGER.debug(frame_number)
-                video.set(cv2.CAP_PROP_POS_FRAMES, frame_number)
-                success, frame = video.read()
+            if pixels >= self.batch_pixels:
+                yield (timestamps, sources), frames
+                timestamps, sources, frames, pixels = [], [], [], 0
 
-        if len(frames) == 1:
-            frame_faces_list.append(self.recognize_image(frames[0], recognizer_model))
-        elif len(frames) > 1:
-            frame_faces_list.extend(self.batch_recognize_images(frames, recognizer_model))
-            frames.clear()
+        if timestamps:
+            yield (timestamps, sources), frames
 
-        detected_faces = {entity for l in frame_faces_list for entity in l}
-
-        return detected_faces, frame_faces_list, timestamps
-
-    def batch_recognize_images(self, unknown_imgs: list, recognizer_model=None, distance_threshold=0.6):
+    def batch_recognize_images(self, unknown_imgs: list, recognizer_model=None, distance_threshold=0.6,
+                               tracker: FaceTracker = None):
         """ Recognize entities in batches of embeddings
 
         Args:
             unknown_imgs (list): List of embeddings.
             recognizer_model (any model): Model trained with embeddings to predict entities.
             distance_threshold (float): The threshold below which recognitions are marked as unknown.
+            tracker (FaceTracker): Tracker of consecutive frames to reuse the embeddings of tracked faces.
 
         Returns:
             detected_faces (list): List of detected entities.
         """
-        detected_faces = []
-        embeddings = self.batch_represent(unknown_imgs)
-
-        # recognize img by frame
-        for frame_embeddings in embeddings:
-            detected_faces.append(self.recognize_image(frame_embeddings, recognizer_model, distance_threshold))
-
-        return detected_faces
+        embeddings = self.batch_represent(unknown_imgs, tracker)
+        return self.recognize_embeddings(embeddings, recognizer_model, distance_threshold)
 
-    def batch_represent(self, imgs: list):
+    def batch_represent(self, imgs: list, tracker: FaceTracker = None):
         """ create embeddings from images in batches
 
         Args:
             imgs (list): List of frames.
+            tracker (FaceTracker): Tracker of consecutive frames to reuse the embeddings of tracked faces.
 
         Returns:
             embeddings: List of face embeddings.
         """
-        embeddings = []
+        return self.batch_encode(imgs, self.batch_detect(imgs), tracker)
+
+    def batch_detect(self, imgs: list, prefilter: bool = True):
+        """ detect faces and their keypoints in batches
+
+        Args:
+            imgs (list): List of frames.
+            prefilter (bool): Whether frames rejected by the prefilter, if there is one, skip the detection.
 
-        mtcnn_imput = [Image.fromarray(img) for img in imgs]
+        Returns:
+            frames_faces_detection (list): List of detected faces per frame.
+        """
+        if not imgs:
+            return []
 
-        boxes, confidence, keypoints = self.detector.detect(mtcnn_imput, landmarks=True)
+        boxes, confidence, keypoints = self.cascade_detect(imgs) if prefilter else self.detect(imgs)
         frames_faces_detection = []
 
         for i in range(len(boxes)):
@@ -183,7 +471,8 @@ class FaceRecognition(object):
                         'nose': tuple(keypoints[2]),
                         'mouth_left': tuple(keypoints[3]),
                         'mouth_right': tuple(keypoints[4]),
-                    }}
+                    },
+                    'landmarks': keypoints}
                     for box, confidence, keypoints in zip(boxes[i], confidence[i], keypoints[i])]
 
                 frames_faces_detection.append(frame_faces)
@@ -191,92 +480,215 @@ class FaceRecognition(object):
             else:
                 frames_faces_detection.append([])
 
-        aligned_faces = []
-        for img, frame_faces in zip(imgs, frames_faces_detection):  # per frame, align face
+        return frames_faces_detection
+
+    def cascade_detect(self, imgs: list):
+        """ run the detector only on the images the prefilter does not reject
 
-            frame_aligned_faces = []
+        Args:
+            imgs (list): List of images.
+
+        Returns:
+            boxes (list): Boxes [x1, y1, x2, y2] per image in the coordinates of the images or None.
+            confidence (list): Confidences per image.
+            keypoints (list): Keypoints per image in the coordinates of the images or None.
+        """
+        if self.prefilter is None:
+            return self.detect(imgs)
 
-            for face in frame_faces:
-                # align face
-                aligned_face = face_alignment(img, self.target, face['keypoints'])
-                frame_aligned_faces.append(aligned_face)
+        boxes, confidence, keypoints = [None] * len(imgs), [None] * len(imgs), [None] * len(imgs)
+        candidates = np.flatnonzero(self.prefilter.is_candidate(imgs))
+        if len(candidates):
+            detections = self.detect([imgs[i] for i in candidates])
+            for i, box, conf, points in zip(candidates, *detections):
+                boxes[i], confidence[i], keypoints[i] = box, conf, points
+        return boxes, confidence, keypoints
 
-            aligned_faces.append(frame_aligned_faces)
+    def detect(self, imgs: list):
+        """ run the detector on images of the same size, on proxies scaled to detection_width if it is smaller
 
-        flat_aligned_faces = [face for l in aligned_faces for face in l]
-        LOGGER.debug(flat_aligned_faces)
-        # batch encoding
-        if len(flat_aligned_faces) > 0:  # otherwise, no face in the batch
-            flat_aligned_faces = np.array(flat_aligned_faces)
-            flat_embeddings = self.encoder.predict(flat_aligned_faces)
+        Args:
+            imgs (list): List of images.
+
+        Returns:
+            boxes (list): Boxes [x1, y1, x2, y2] per image in the coordinates of the images or None.
+            confidence (list): Confidences per image.
+            keypoints (list): Keypoints per image in the coordinates of the images or None.
+        """
+        height, width = imgs[0].shape[:2]
+        if self.detection_width is None or width <= self.detection_width:
+            return self.detector.detect(np.stack(imgs), landmarks=True)
 
+        dsize = (self.detection_width, max(int(height * self.detection_width / width), 1))
+        proxies = np.stack([cv2.resize(img, dsize, interpolation=cv2.INTER_AREA) for img in imgs])
+        boxes, confidence, keypoints = self.detector.detect(proxies, landmarks=True)
+
+        # back to the coordinates of the images
+        scale = np.array([width / dsize[0], height / dsize[1]])
+        boxes = [None if b is None else np.asarray(b, dtype=float) * np.tile(scale, 2) for b in boxes]
+        keypoints = [None if k is None else np.asarray(k, dtype=float) * scale for k in keypoints]
+        return boxes, confidence, keypoints
+
+    def batch_encode(self, imgs: list, frames_faces_detection: list, tracker: FaceTracker = None):
+        """ align detected faces and create their embeddings in batches of at most face_batch_size faces
+
+        Args:
+            imgs (list): List of frames.
+            frames_faces_detection (list): List of detected faces per frame.
+            tracker (FaceTracker): Tracker of consecutive frames. Only the faces it selects are encoded, the other
+                faces reuse the embedding of their track.
+
+        Returns:
+            embeddings: List of face embeddings per frame.
+        """
+        if tracker is not None:
+            assignments = [tracker.update(frame_faces) for frame_faces in frames_faces_detection]
+        else:
+            assignments = [[(None, True)] * len(frame_faces) for frame_faces in frames_faces_detection]
+
+        flat_faces = [(index, face) for index, (frame_faces, frame_assignments) in
+                      enumerate(zip(frames_faces_detection, assignments))
+                      for face, (_, embed) in zip(frame_faces, frame_assignments) if embed]
+        img_indices = np.fromiter((index for index, _ in flat_faces), dtype=int, count=len(flat_faces))
+        keypoints = np.empty((len(flat_faces), 5, 2))
+        for i, (_, face) in enumerate(flat_faces):
+            keypoints[i] = face['landmarks']
+
+        # batch encoding, the faces of every batch are warped and scaled into the same buffers
+        flat_embeddings = []
+        shape = (min(len(flat_faces), self.face_batch_size), self.target[1], self.target[0], 3)
+        crops = np.empty(shape, dtype=np.uint8)
+        buffer = np.empty(shape, dtype=np.float32)
+        for i in range(0, len(flat_faces), self.face_batch_size):
+            count = len(img_indices[i:i + self.face_batch_size])
+            aligned_faces = batch_face_alignment(imgs, img_indices[i:i + self.face_batch_size], self.target,
+                                                 keypoints[i:i + self.face_batch_size], out=buffer[:count],
+                                                 crops=crops[:count])
+            flat_embeddings.extend(self.predict(aligned_faces))
+
+        embeddings = []
         count = 0
-        for i in range(len(aligned_faces)):
+        for frame_assignments in assignments:
             frame_embeddings = []
-            for j in range(len(aligned_faces[i])):
-                frame_embeddings.append(flat_embeddings[count])
-                count += 1
+            for track, embed in frame_assignments:
+                if embed:
+                    embedding = flat_embeddings[count]
+                    count += 1
+                    if track is not None:
+                        track.embedding = embedding
+                else:  # reuse the last embedding of the track
+                    embedding = track.embedding
+                frame_embeddings.append(embedding)
             embeddings.append(frame_embeddings)
 
         return embeddings
 
-    def create_embeddings(self):
+    def predict(self, aligned_faces: np.ndarray):
+        """ create the embeddings of aligned faces, looking them up in the embedding cache first if there is one
+
+        Args:
+            aligned_faces (np.ndarray): Batch of aligned faces.
+
+        Returns:
+            embeddings: List of face embeddings.
+        """
+        if self.cache is None:
+            return self.encoder.predict(aligned_faces)
+        return self.cache.predict(self.encoder, aligned_faces)
+
+    def create_embeddings(self, threads: int = 8, processes: int = 1, batch_size: int = 32):
         """ create and save face embeddings and entity labels
 
+        Args:
+            threads (int): Number of threads decoding the thumbnails.
+            processes (int): Number of worker processes that embed parts of the thumbnails.
+            batch_size (int): Maximum number of thumbnails detected in one batch.
+
         Returns:
             embeddings (list): List of face embeddings.
             labels (list): List of entity names.
         """
-        entity_dir_list = os.listdir(self.thumbnails_path)
-        embeddings = []
-        labels = []
+        manifest = GalleryManifest(self.get_manifest_path())
+        manifest.files, manifest.rows = {}, []
+        self.labels, self.embeddings = [], []
+        self.update_embeddings(threads, processes, batch_size, manifest)
+        return self.labels, self.embeddings
 
-        if self.thumbnail_list is not None:
-            entity_dir_list = self.thumbnail_list
+    def update_embeddings(self, threads: int = 8, processes: int = 1, batch_size: int = 32,
+                          manifest: GalleryManifest = None, checkpoint_interval: int = 1000) -> bool:
+        """ embed only the new and changed thumbnails and drop the embeddings of removed thumbnails
 
-        for entity_dir in entity_dir_list:  # for every celebrity: format of dir: ID_Name entity_id, entity_name = entity_dir.split('_')
-            entity_path = os.path.join(self.thumbnails_path, entity_dir)
+        The thumbnail files are compared to the manifest of the last update by path, size, modification time and
+        hash. The new embeddings are checkpointed, so an interrupted update resumes.
 
-            if not os.path.isdir(entity_path):
-                continue
+        Args:
+            threads (int): Number of threads decoding the thumbnails.
+            processes (int): Number of worker processes that embed parts of the thumbnails.
+            batch_size (int): Maximum number of thumbnails detected in one batch.
+            manifest (GalleryManifest): The manifest to compare to. Reads the manifest next to the embeddings if None.
+            checkpoint_interval (int): Number of thumbnails between two checkpoints.
 
-            for img_path in image_files_in_folder(
-                    entity_path):  # for every img of celebrity, exactly one face in one pic
-                LOGGER.info(f'Encoding {entity_dir}, thumbnail: {img_path}')
-                entity_embedding = self.represent(img_path, one_face=True)
+        Returns:
+            changed (bool): Whether the gallery changed.
+        """
+        if manifest is None:
+            manifest = GalleryManifest(self.get_manifest_path())
+        if len(manifest.rows) != len(self.embeddings):
+            LOGGER.info('The manifest does not match the embeddings, all thumbnails are embedded again')
+            manifest.files, manifest.rows = {}, []
+
+        delta, removed, files = manifest.diff(list_thumbnails(self.thumbnails_path, self.thumbnail_list))
+        LOGGER.info(f'{len(delta)} new or changed and {len(removed)} removed or changed thumbnails')
+        if not delta and not removed and self.store.exists():
+            manifest.save(files, manifest.rows)  # keeps modification times of unchanged files
+            return False
+
+        keep = [i for i, img_path in enumerate(manifest.rows) if img_path not in removed]
+        labels = [self.labels[i] for i in keep]
+        embeddings = [self.embeddings[i] for i in keep]
+        rows = [manifest.rows[i] for i in keep]
+
+        checkpoint = Checkpoint(os.path.dirname(self.embeddings_path) or '.',
+                                f'gallery_{get_key([self.get_params(), delta])}.ckpt')
+        for label, img_path, embedding in GalleryBuilder(self, threads, batch_size, processes).build(
+                delta, checkpoint, checkpoint_interval):
+            labels.append(label)
+            embeddings.append(embedding)
+            rows.append(img_path)
 
-                if entity_embedding is None:
-                    LOGGER.warning(f'Could not create encoding for image {img_path}')
-                    continue
+        # write to disk
+        self.store.save(labels, embeddings)
+        manifest.save(files, rows)
+        checkpoint.remove()
 
-                if len(entity_embedding) > 1:
-                    LOGGER.warning(f'There are more than one faces in image {img_path}')
-                    continue
+        self.labels, self.embeddings = self.store.load()
+        return True
 
-                embeddings.append(entity_embedding[0])
-                labels.append(entity_dir.replace('_', ' '))
+    def get_manifest_path(self) -> str:
+        """ Returns the path of the manifest of the thumbnails next to the embeddings
 
-                LOGGER.debug(embeddings)
+        Returns:
+            path (str): Path to the JSON manifest.
+        """
+        return f'{os.path.splitext(self.embeddings_path)[0]}_manifest.json'
 
-        # write to disk
-        with open(self.labels_path, 'wb') as f:
-            f.write(pickle.dumps(labels))
-        with open(self.embeddings_path, 'wb') as f:
-            f.write(pickle.dumps(embeddings))
-        return labels, embeddings
+    def load_embeddings(self, create: bool = True):
+        """ Loads already existing embeddings, migrating pickled embeddings to the embedding store
 
-    def load_embeddings(self):
-        """ Loads already existing embeddings
+        Args:
+            create (bool): Whether the embeddings are created if they do not exist.
 
         Returns:
             labels (list): List of entity names.
-            embeddings (list): List of face embeddings.
+            embeddings (np.ndarray): Memory-mapped matrix of face embeddings.
         """
-        if os.path.exists(self.labels_path) and os.path.exists(self.embeddings_path):
-            labels = pickle.loads(open(self.labels_path, "rb").read())
-            embeddings = pickle.loads(open(self.embeddings_path, "rb").read())
-            return labels, embeddings
-        return self.create_embeddings()
+        if not self.store.exists() and os.path.exists(self.labels_path) and os.path.exists(self.embeddings_path):
+            self.store.migrate(self.labels_path, self.embeddings_path)
+        if self.store.exists():
+            return self.store.load()
+        if create:
+            return self.create_embeddings()
+        return [], []
 
     def recognize_image(self, unknown_img, recognizer_model=None, distance_threshold=0.6):
         """ Recognize entities in an image
@@ -289,39 +701,85 @@ class FaceRecognition(object):
         Returns:
             detected_faces (list): List of detected entities.
         """
-        detected_faces = []
-        unknown_img_embeddings = None
-
         if isinstance(unknown_img, list):  # batch
             unknown_img_embeddings = unknown_img
         else:  # encode single image
-            unknown_img_embeddings = self.represent(unknown_img)
-
-        for unknown_img_embedding in unknown_img_embeddings:  # for each face in the image
-            if not recognizer_model:  # run basic recognition
-                a = np.matmul(self.embeddings, unknown_img_embedding)
-                b = np.linalg.norm(self.embeddings, axis=1)
-                c = np.linalg.norm(unknown_img_embedding)
-                face_distances = 1 - a / (b * c)
-                min_distance = np.min(face_distances)
-
-                if min_distance < distance_threshold:
-                    entity = self.labels[np.argmin(face_distances)]
-                    detected_faces.append(entity)
-
-                else:
-                    # LOGGER.info('face detected but no match')
-                    detected_faces.append('unknown')
-
-            else:  # call ANN
-                if not recognizer_model.fitted:
-                    recognizer_model.fit(embeddings=self.embeddings, labels=self.labels)
-                entity = recognizer_model.predict(unknown_img_embedding)
-                if entity:
-                    detected_faces.append(entity)
+            unknown_img_embeddings = self.represent(unknown_img) or []
+
+        return self.recognize_embeddings([unknown_img_embeddings], recognizer_model, distance_threshold)[0]
 
+    def recognize_embeddings(self, frames_embeddings: list, recognizer_model=None, distance_threshold=0.6):
+        """ Recognize entities of the face embeddings of many frames at once
+
+        Without a recognizer model, all faces are compared to the gallery with one matrix multiplication (in chunks
+        of match_chunk_size gallery embeddings).
+
+        Args:
+            frames_embeddings (list): List of face embeddings per frame.
+            recognizer_model (any model): Model trained with embeddings to predict entities.
+            distance_threshold (float): The threshold below which recognitions are marked as unknown.
+
+        Returns:
+            detected_faces (list): List of detected entities per frame.
+        """
+        flat_embeddings = [embedding for frame_embeddings in frames_embeddings for embedding in frame_embeddings]
+
+        if not flat_embeddings:
+            entities = []
+        elif not recognizer_model:  # run basic recognition
+            labels, _ = self.get_gallery()
+            indices, distances = cosine_nearest_neighbors(flat_embeddings, self.get_normalized_gallery(), True,
+                                                          self.match_chunk_size)
+            entities = [labels[index] if distance < distance_threshold else 'unknown'
+                        for index, distance in zip(indices.tolist(), distances.tolist())]
+        else:  # call ANN
+            self.fit_recognizer(recognizer_model)
+            entities = recognizer_model.predict_batch(flat_embeddings)
+
+        detected_faces = []
+        count = 0
+        for frame_embeddings in frames_embeddings:
+            detected_faces.append([entity for entity in entities[count:count + len(frame_embeddings)] if entity])
+            count += len(frame_embeddings)
         return detected_faces
 
+    def fit_recognizer(self, recognizer_model):
+        """ Fits the recognizer_model to the gallery unless it is fitted already
+
+        Args:
+            recognizer_model (any model): Model trained with embeddings to predict entities.
+        """
+        if not recognizer_model.fitted:
+            labels, embeddings = self.get_gallery()
+            recognizer_model.fit(embeddings=embeddings, labels=labels)
+
+    def get_gallery(self):
+        """ Returns the gallery faces are matched against, the prototypes are computed once per gallery
+
+        Returns:
+            labels (list): Entity name of every embedding or prototype.
+            embeddings (np.ndarray): The embeddings or the prototypes.
+        """
+        if not self.prototypes:
+            return self.labels, self.embeddings
+        if self._compact_gallery is None or self._compact_gallery[0] is not self.embeddings:
+            labels, embeddings = compact_gallery(self.labels, self.embeddings, self.prototypes,
+                                                 self.prototype_distance)
+            LOGGER.info(f'Compacted the gallery from {len(self.labels)} embeddings to {len(labels)} prototypes')
+            self._compact_gallery = (self.embeddings, (labels, embeddings))
+        return self._compact_gallery[1]
+
+    def get_normalized_gallery(self):
+        """ Returns the gallery embeddings scaled to unit length for the cosine matching, once per gallery
+
+        Returns:
+            embeddings (np.ndarray): The embeddings or the prototypes of unit length.
+        """
+        _, embeddings = self.get_gallery()
+        if self._normalized_gallery is None or self._normalized_gallery[0] is not embeddings:
+            self._normalized_gallery = (embeddings, normalize(embeddings, self.match_chunk_size))
+        return self._normalized_gallery[1]
+
     def represent(self, img, one_face=False, return_face_number=False):
         """ create an embedding from an image
 
@@ -334,31 +792,15 @@ class FaceRecognition(object):
             embeddings (list): List of face embeddings. OR
             face_number (int): Returns number of faces if return_face_number is True and number of faces > 1.
         """
-        embeddings = []
-
         if isinstance(img, str):  # img is a path
             img = cv2.cvtColor(cv2.imread(img), cv2.COLOR_BGR2RGB)
 
-        # faces = self.detector.detect_faces(img)
-        # Compatible with the MTCNN from facenet_pytorch
-        boxes, confidence, keypoints = self.detector.detect(Image.fromarray(img), landmarks=True)
+        faces = self.batch_detect([img])[0]
 
         # If no face is found
-        if confidence[0] is None:
+        if len(faces) == 0:
             return None
 
-        faces = [{
-            'box': [box[0], box[1], box[2] - box[0], box[3] - box[1]],
-            'confidence': confidence,
-            'keypoints': {
-                'left_eye': tuple(keypoints[0]),
-                'right_eye': tuple(keypoints[1]),
-                'nose': tuple(keypoints[2]),
-                'mouth_left': tuple(keypoints[3]),
-                'mouth_right': tuple(keypoints[4]),
-            }}
-            for box, confidence, keypoints in zip(boxes, confidence, keypoints)]
-
         face_number = len(faces)
 
         if return_face_number and face_number != 1:  # for tuning distance threshold
@@ -370,13 +812,4 @@ class FaceRecognition(object):
             index = height.index(max(height))
             faces = [faces[index]]
 
-        for face in faces:
-            aligned_face = face_alignment(img, self.target, face['keypoints'])
-
-            aligned_face = np.expand_dims(aligned_face, axis=0)
-
-            embedding = self.encoder.predict(aligned_face)[0]
-
-            embeddings.append(embedding)
-
-        return embeddings
+        return self.batch_encode([img], [faces])[0]
@@ -0,0 +1,150 @@
+import logging
+import numpy as np
+
+LOGGER = logging.getLogger('face-tracking')
+
+
+def box_iou(box_a, box_b) -> float:
+    """ Computes the intersection over union of two boxes
+
+    Args:
+        box_a (list): Box [x, y, w, h].
+        box_b (list): Box [x, y, w, h].
+
+    Returns:
+        iou (float): Intersection over union between 0 and 1.
+    """
+    ax, ay, aw, ah = box_a
+    bx, by, bw, bh = box_b
+    w = min(ax + aw, bx + bw) - max(ax, bx)
+    h = min(ay + ah, by + bh) - max(ay, by)
+    if w <= 0 or h <= 0:
+        return 0.0
+    intersection = w * h
+    return intersection / (aw * ah + bw * bh - intersection)
+
+
+def keypoint_distance(face_a: dict, face_b: dict) -> float:
+    """ Computes the mean distance between the keypoints of two faces relative to the size of the first face
+
+    Args:
+        face_a (dict): Detected face with 'box' and 'keypoints'.
+        face_b (dict): Detected face with 'box' and 'keypoints'.
+
+    Returns:
+        distance (float): Mean keypoint distance divided by the diagonal of the box of face_a.
+    """
+    a = np.array(list(face_a['keypoints'].values()), dtype=float)
+    b = np.array(list(face_b['keypoints'].values()), dtype=float)
+    diagonal = np.hypot(face_a['box'][2], face_a['box'][3])
+    return float(np.mean(np.linalg.norm(a - b, axis=1)) / max(diagonal, 1e-6))
+
+
+class Track(object):
+    """ A face that was seen in consecutive frames
+
+    Args:
+        track_id (int): Identifier of the track.
+        face (dict): The detected face that started the track.
+    """
+
+    def __init__(self, track_id: int, face: dict):
+        self.track_id = track_id
+        self.face = face
+        self.missed = 0
+        self.since_embedding = 0
+        self.quality = 0.0
+        self.embedding = None
+
+
+class FaceTracker(object):
+    """ Follows detected faces over consecutive frames to reuse their embeddings
+
+    Faces are assigned to the track with the highest overlap (IoU) whose keypoints moved little. A track is embedded
+    when it starts, every reembed_interval frames and when the quality of the face (confidence times area) improved.
+
+    Args:
+        reembed_interval (int): Maximum number of frames a track reuses its embedding.
+        iou_threshold (float): Minimum overlap of a face with the last box of a track.
+        keypoint_threshold (float): Maximum mean keypoint movement relative to the face size.
+        quality_gain (float): Relative improvement of the quality that causes a new embedding.
+        max_missed (int): Number of frames a track survives without a matching face.
+    """
+
+    def __init__(self,
+                 reembed_interval: int = 10,
+                 iou_threshold: float = 0.5,
+                 keypoint_threshold: float = 0.15,
+                 quality_gain: float = 0.2,
+                 max_missed: int = 1):
+        self.reembed_interval = reembed_interval
+        self.iou_threshold = iou_threshold
+        self.keypoint_threshold = keypoint_threshold
+        self.quality_gain = quality_gain
+        self.max_missed = max_missed
+        self.tracks = []
+        self.next_id = 0
+        self.faces = 0
+        self.embedded = 0
+
+    def update(self, frame_faces: list) -> list:
+        """ Assigns the faces of the next frame to tracks
+
+        Args:
+            frame_faces (list): Detected faces of the frame with 'box', 'confidence' and 'keypoints'.
+
+        Returns:
+            assignments (list): (track, embed) per face. embed is True if the face has to be embedded.
+        """
+        candidates = sorted(((box_iou(track.face['box'], face['box']), t, f)
+                             for t, track in enumerate(self.tracks) for f, face in enumerate(frame_faces)),
+                            reverse=True)
+        matches = {}
+        used = set()
+        for iou, t, f in candidates:
+            if iou < self.iou_threshold:
+                break
+            if f in matches or t in used:
+                continue
+            if keypoint_distance(self.tracks[t].face, frame_faces[f]) > self.keypoint_threshold:
+                continue
+            matches[f] = self.tracks[t]
+            used.add(t)
+
+        # tracks without a face in this frame
+        for t, track in enumerate(self.tracks):
+            if t not in used:
+                track.missed += 1
+        self.tracks = [track for t, track in enumerate(self.tracks) if t in used or track.missed <= self.max_missed]
+
+        assignments = []
+        for f, face in enumerate(frame_faces):
+            quality = float(face['confidence']) * face['box'][2] * face['box'][3]
+            track = matches.get(f)
+            if track is None:
+                track = Track(self.next_id, face)
+                self.next_id += 1
+                self.tracks.append(track)
+                embed = True
+            else:
+                track.face = face
+                track.missed = 0
+                track.since_embedding += 1
+                embed = (track.since_embedding >= self.reembed_interval
+                         or quality > track.quality * (1 + self.quality_gain))
+
+            if embed:
+                track.since_embedding = 0
+                track.quality = quality
+                self.embedded += 1
+            self.faces += 1
+            assignments.append((track, embed))
+        return assignments
+
+    def get_statistics(self) -> dict:
+        """ Returns how many embeddings were saved
+
+        Returns:
+            statistics (dict): Number of faces, embedded faces and saved embeddings.
+        """
+        return {'faces': self.faces, 'embedded': self.embedded, 'saved': self.faces - self.embedded}
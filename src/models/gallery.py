@@ -0,0 +1,289 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import multiprocessing
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import cv2
+from src.utils.utils import image_files_in_folder
+from src.models.checkpoint import Checkpoint
+
+LOGGER = logging.getLogger('gallery')
+
+_WORKER = {}
+
+
+def list_thumbnails(thumbnails_path: str, thumbnail_list: list = None) -> list:
+    """ Lists the thumbnails of every entity
+
+    Args:
+        thumbnails_path (str): Path to the thumbnail directory with one directory per entity.
+        thumbnail_list (list): Names of the entity directories to use. Uses every directory if None.
+
+    Returns:
+        thumbnails (list): List of (label, img_path) tuples.
+    """
+    entity_dir_list = thumbnail_list if thumbnail_list is not None else os.listdir(thumbnails_path)
+    thumbnails = []
+    for entity_dir in entity_dir_list:
+        entity_path = os.path.join(thumbnails_path, entity_dir)
+        if not os.path.isdir(entity_path):
+            continue
+        thumbnails.extend((entity_dir.replace('_', ' '), img_path) for img_path in image_files_in_folder(entity_path))
+    return thumbnails
+
+
+def read_image(img_path: str):
+    """ Reads an image as RGB
+
+    Args:
+        img_path (str): Path to the image.
+
+    Returns:
+        img (np.ndarray): The RGB image or None if it could not be read.
+    """
+    img = cv2.imread(img_path)
+    if img is None:
+        return None
+    return cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+
+
+def file_hash(path: str) -> str:
+    """ Computes the SHA-1 of a file
+
+    Args:
+        path (str): Path to the file.
+
+    Returns:
+        hash (str): The hash as hex string.
+    """
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(2 ** 20), b''):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+
+class GalleryManifest(object):
+    """ Records the thumbnail files the gallery was created from and the thumbnail of every embedding
+
+    Args:
+        path (str): Path to the JSON manifest.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.files = {}
+        self.rows = []
+        if os.path.exists(path):
+            with open(path) as f:
+                manifest = json.load(f)
+            self.files = manifest['files']
+            self.rows = manifest['rows']
+
+    def diff(self, thumbnails: list):
+        """ Compares thumbnails to the manifest
+
+        The hash of a file is only computed if it is new or its size or modification time changed.
+
+        Args:
+            thumbnails (list): List of (label, img_path) tuples.
+
+        Returns:
+            delta (list): The (label, img_path) tuples of new and changed thumbnails.
+            removed (set): Paths of thumbnails in the manifest that were removed or changed.
+            files (dict): The manifest entries of the thumbnails.
+        """
+        delta = []
+        files = {}
+        for label, img_path in thumbnails:
+            stat = os.stat(img_path)
+            entry = {'label': label, 'size': stat.st_size, 'mtime': stat.st_mtime}
+            old = self.files.get(img_path)
+            if old is not None and old['size'] == entry['size'] and old['mtime'] == entry['mtime'] \
+                    and old['label'] == label:
+                entry['hash'] = old['hash']
+            else:
+                entry['hash'] = file_hash(img_path)
+                if old is None or old['hash'] != entry['hash'] or old['label'] != label:
+                    delta.append((label, img_path))
+            files[img_path] = entry
+
+        changed = {img_path for _, img_path in delta}
+        removed = {img_path for img_path in self.files if img_path not in files or img_path in changed}
+        return delta, removed, files
+
+    def save(self, files: dict, rows: list):
+        """ Replaces the manifest
+
+        Args:
+            files (dict): The manifest entries of the thumbnails.
+            rows (list): The thumbnail path of every embedding.
+        """
+        self.files, self.rows = files, rows
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'files': files, 'rows': rows}, f)
+        os.replace(tmp_path, self.path)
+
+
+class GalleryBuilder(object):
+    """ Creates the embeddings of many thumbnails in batches
+
+    Images are decoded by a thread pool ahead of the detection. The decoded images of a batch are padded to the same
+    size, so the detector runs on the whole batch, and the largest face of each image is aligned and encoded in
+    batches of face_batch_size faces. The thumbnails can be split among several processes that load the models once.
+
+    Args:
+        face_recognition (FaceRecognition): Provides the detector and the encoder.
+        threads (int): Number of threads decoding images.
+        batch_size (int): Maximum number of images detected in one batch.
+        processes (int): Number of worker processes. Builds in this process if 1.
+    """
+
+    def __init__(self, face_recognition, threads: int = 8, batch_size: int = 32, processes: int = 1):
+        self.face_recognition = face_recognition
+        self.threads = threads
+        self.batch_size = batch_size
+        self.processes = processes
+        self.statistics = {}
+
+    def build(self, thumbnails: list, checkpoint: Checkpoint = None, checkpoint_interval: int = 1000):
+        """ Creates the embeddings of thumbnails with exactly one face, or the largest face
+
+        Args:
+            thumbnails (list): List of (label, img_path) tuples.
+            checkpoint (Checkpoint): Checkpoint to resume from and to store the embeddings in while building.
+            checkpoint_interval (int): Number of thumbnails between two checkpoints.
+
+        Returns:
+            rows (list): List of (label, img_path, embedding) tuples of the thumbnails with a face.
+        """
+        start = 0
+        rows = []
+        if checkpoint is not None:
+            start, rows = checkpoint.load()
+
+        begin = time.perf_counter()
+        interval = checkpoint_interval if checkpoint is not None else max(len(thumbnails), 1)
+        for i in range(start, len(thumbnails), interval):
+            part = thumbnails[i:i + interval]
+            part_rows = self._build_parallel(part) if self.processes > 1 and len(part) > 1 else self.embed(part)
+            rows.extend(part_rows)
+            if checkpoint is not None:
+                checkpoint.append(i + len(part), part_rows)
+        seconds = time.perf_counter() - begin
+
+        images = len(thumbnails) - start
+        self.statistics = {'images': images,
+                           'embeddings': len(rows),
+                           'seconds': seconds,
+                           'images_per_second': images / seconds if seconds > 0 else 0.0}
+        LOGGER.info(f'Embedded {images} thumbnails in {seconds:.1f}s ({self.statistics["images_per_second"]:.1f} '
+                    f'images/s), {len(rows)} embeddings in total')
+        return rows
+
+    def embed(self, thumbnails: list):
+        """ Creates the embeddings of thumbnails in this process
+
+        Args:
+            thumbnails (list): List of (label, img_path) tuples.
+
+        Returns:
+            rows (list): List of (label, img_path, embedding) tuples of the thumbnails with a face.
+        """
+        rows = []
+        batch = []
+        pixels = 0
+
+        for (label, img_path), img in zip(thumbnails, self._read(thumbnails)):
+            if img is None:
+                LOGGER.warning(f'Could not read image {img_path}')
+                continue
+
+            batch.append((label, img_path, img))
+            pixels = max(pixels, img.shape[0] * img.shape[1])
+            if len(batch) >= self.batch_size or pixels * len(batch) >= self.face_recognition.batch_pixels:
+                rows.extend(self._embed_batch(batch))
+                batch, pixels = [], 0
+
+        if batch:
+            rows.extend(self._embed_batch(batch))
+        return rows
+
+    def _read(self, thumbnails: list):
+        """ Decodes the images on the thread pool, at most two batches ahead """
+        with ThreadPoolExecutor(self.threads) as executor:
+            futures = deque()
+            for _, img_path in thumbnails:
+                futures.append(executor.submit(read_image, img_path))
+                if len(futures) >= 2 * self.batch_size:
+                    yield futures.popleft().result()
+            while futures:
+                yield futures.popleft().result()
+
+    def _embed_batch(self, batch: list) -> list:
+        """ Detects the faces of a batch of images and encodes the largest face of every image """
+        height = max(img.shape[0] for _, _, img in batch)
+        width = max(img.shape[1] for _, _, img in batch)
+        imgs = np.zeros((len(batch), height, width, 3), dtype=np.uint8)
+        for i, (_, _, img) in enumerate(batch):
+            imgs[i, :img.shape[0], :img.shape[1]] = img
+
+        # thumbnails show a face, so they are never prefiltered
+        faces = []
+        detections = self.face_recognition.batch_detect(list(imgs), prefilter=False)
+        for (_, img_path, _), frame_faces in zip(batch, detections):
+            if len(frame_faces) == 0:
+                LOGGER.warning(f'Could not create encoding for image {img_path}')
+                faces.append([])
+                continue
+            # get biggest face from thumbnails
+            faces.append([max(frame_faces, key=lambda face: face['box'][3])])
+
+        return [(label, img_path, frame_embeddings[0]) for (label, img_path, _), frame_embeddings
+                in zip(batch, self.face_recognition.batch_encode(list(imgs), faces)) if frame_embeddings]
+
+    def _build_parallel(self, thumbnails: list):
+        """ Splits the thumbnails among worker processes and concatenates their results in order """
+        processes = min(self.processes, len(thumbnails))
+        bounds = [round(i * len(thumbnails) / processes) for i in range(processes + 1)]
+        parts = [thumbnails[bounds[i]:bounds[i + 1]] for i in range(processes)]
+        LOGGER.info(f'Embedding {len(thumbnails)} thumbnails in {processes} processes')
+
+        rows = []
+        context = multiprocessing.get_context('spawn')
+        with context.Pool(processes, initializer=init_worker,
+                          initargs=(self.face_recognition.get_params(), self.threads, self.batch_size)) as pool:
+            for part_rows in pool.imap(embed_part, parts):
+                rows.extend(part_rows)
+        return rows
+
+
+def init_worker(face_recognition_kwargs: dict, threads: int, batch_size: int):
+    """ Loads the models of a worker process once
+
+    Args:
+        face_recognition_kwargs (dict): Arguments to create the FaceRecognition.
+        threads (int): Number of threads decoding images.
+        batch_size (int): Maximum number of images detected in one batch.
+    """
+    from src.models.face_recognition import FaceRecognition
+
+    face_recognition = FaceRecognition(**face_recognition_kwargs, load_gallery=False)
+    _WORKER['builder'] = GalleryBuilder(face_recognition, threads, batch_size)
+
+
+def embed_part(thumbnails: list):
+    """ Creates the embeddings of a part of the thumbnails inside a worker process
+
+    Args:
+        thumbnails (list): List of (label, img_path) tuples.
+
+    Returns:
+        rows (list): List of (label, img_path, embedding) tuples of the thumbnails with a face.
+    """
+    return _WORKER['builder'].embed(thumbnails)
@@ -0,0 +1,162 @@
+import os
+import tempfile
+import logging
+import numpy as np
+from src.models.nearest_neighbors import cosine_nearest_neighbors
+from src.models.vector_search import create_backend
+
+LOGGER = logging.getLogger('gallery-compaction')
+
+
+def _normalize(embeddings) -> np.ndarray:
+    """ Scales embeddings to unit length """
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return embeddings / np.where(norms > 0, norms, 1)
+
+
+def compact_entity(embeddings, prototypes: int = 3, distance: float = 0.1, iterations: int = 10) -> np.ndarray:
+    """ Reduces the embeddings of one entity to a few prototypes
+
+    Embeddings closer than distance to an embedding that is kept are dropped as near-duplicates. If more than
+    prototypes embeddings remain, they are clustered by spherical k-means and every cluster is replaced by its mean
+    direction. The clusters are initialized with the embeddings farthest from each other, so rare looks of an entity
+    get their own prototype.
+
+    Args:
+        embeddings (np.ndarray): The embeddings of the entity.
+        prototypes (int): Maximum number of prototypes.
+        distance (float): Cosine distance below which embeddings are near-duplicates.
+        iterations (int): Number of k-means iterations.
+
+    Returns:
+        prototypes (np.ndarray): The prototypes with unit length, one per row.
+    """
+    embeddings = _normalize(embeddings)
+    similarities = embeddings @ embeddings.T
+
+    # greedily keep embeddings that are no near-duplicate of a kept embedding
+    duplicate = np.zeros(len(embeddings), dtype=bool)
+    for i in range(len(embeddings)):
+        if not duplicate[i]:
+            duplicate[i + 1:] |= 1 - similarities[i, i + 1:] < distance
+    kept = embeddings[~duplicate]
+    if len(kept) <= prototypes:
+        return kept
+
+    # farthest point initialization
+    centers = [0]
+    nearest = kept @ kept[0]
+    for _ in range(prototypes - 1):
+        centers.append(int(np.argmin(nearest)))
+        nearest = np.maximum(nearest, kept @ kept[centers[-1]])
+    centers = kept[centers]
+
+    for _ in range(iterations):
+        assignments = np.argmax(kept @ centers.T, axis=1)
+        sums = np.zeros_like(centers)
+        np.add.at(sums, assignments, kept)
+        updated = _normalize(sums)
+        empty = np.bincount(assignments, minlength=len(centers)) == 0
+        updated[empty] = centers[empty]
+        if np.allclose(updated, centers):
+            break
+        centers = updated
+    return centers
+
+
+def compact_gallery(labels: list, embeddings, prototypes: int = 3, distance: float = 0.1):
+    """ Reduces the embeddings of every entity of the gallery to a few prototypes
+
+    Args:
+        labels (list): Entity name of every embedding.
+        embeddings (np.ndarray): The embeddings of the gallery, one per row. Can be memory-mapped.
+        prototypes (int): Maximum number of prototypes per entity.
+        distance (float): Cosine distance below which embeddings of an entity are near-duplicates.
+
+    Returns:
+        labels (list): Entity name of every prototype, in the order the entities first appear.
+        embeddings (np.ndarray): The prototypes with unit length, one per row.
+    """
+    if len(labels) == 0:
+        return [], np.zeros((0, 0), dtype=np.float32)
+    if not isinstance(embeddings, np.ndarray):
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+    table, first, ids = np.unique(np.asarray(labels, dtype=object), return_index=True, return_inverse=True)
+    ids = ids.reshape(-1)
+    rows = np.argsort(ids, kind='stable')
+    bounds = np.searchsorted(ids[rows], np.arange(len(table) + 1))
+
+    compact_labels = []
+    compact_embeddings = []
+    for entity in np.argsort(first):
+        entity_rows = rows[bounds[entity]:bounds[entity + 1]]
+        entity_prototypes = compact_entity(np.asarray(embeddings[entity_rows]), prototypes, distance)
+        compact_labels.extend([table[entity]] * len(entity_prototypes))
+        compact_embeddings.append(entity_prototypes)
+    return compact_labels, np.concatenate(compact_embeddings)
+
+
+def _index_bytes(embeddings, directory: str, backend: str) -> int:
+    """ Builds an index of the embeddings and returns its size on disk """
+    index_path = os.path.join(directory, f'index_{len(embeddings)}.bin')
+    create_backend(backend).fit(embeddings).save(index_path)
+    return os.path.getsize(index_path)
+
+
+def evaluate_compaction(labels: list, embeddings, prototypes: int = 3, distance: float = 0.1,
+                        distance_threshold: float = 0.6, backend: str = 'nmslib', seed: int = 0) -> dict:
+    """ Measures how much the compaction shrinks the gallery and the index and how the accuracy changes
+
+    One embedding of every entity with several embeddings is held out as query. The queries are matched by their
+    nearest neighbor in the remaining gallery and in its compaction.
+
+    Args:
+        labels (list): Entity name of every embedding.
+        embeddings (np.ndarray): The embeddings of the gallery, one per row.
+        prototypes (int): Maximum number of prototypes per entity.
+        distance (float): Cosine distance below which embeddings of an entity are near-duplicates.
+        distance_threshold (float): Maximum distance of a match, farther queries are 'unknown'.
+        backend (str): The vector search backend whose index size is measured. No index is built if None.
+        seed (int): Seed of the random choice of the held out embeddings.
+
+    Returns:
+        report (dict): Number of rows, index bytes and accuracy of the full and the compact gallery.
+    """
+    labels = list(labels)
+    if not isinstance(embeddings, np.ndarray):
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+    rng = np.random.default_rng(seed)
+    rows_by_label = {}
+    for i, label in enumerate(labels):
+        rows_by_label.setdefault(label, []).append(i)
+    held_out = sorted(int(rng.choice(rows)) for rows in rows_by_label.values() if len(rows) > 1)
+    remaining = np.setdiff1d(np.arange(len(labels)), held_out)
+
+    gallery_labels = [labels[i] for i in remaining]
+    gallery = np.asarray(embeddings[remaining], dtype=np.float32)
+    compact_labels, compact = compact_gallery(gallery_labels, gallery, prototypes, distance)
+    queries = np.asarray(embeddings[held_out], dtype=np.float32)
+    query_labels = [labels[i] for i in held_out]
+
+    def accuracy(gallery_labels, gallery):
+        if not held_out:
+            return None
+        indices, distances = cosine_nearest_neighbors(queries, gallery)
+        return float(np.mean([gallery_labels[index] == label and found < distance_threshold
+                              for index, found, label in zip(indices.tolist(), distances.tolist(), query_labels)]))
+
+    report = {'entities': len(rows_by_label),
+              'queries': len(held_out),
+              'rows': len(gallery_labels),
+              'compact_rows': len(compact_labels),
+              'row_ratio': len(compact_labels) / len(gallery_labels) if gallery_labels else 1.0,
+              'accuracy': accuracy(gallery_labels, gallery),
+              'compact_accuracy': accuracy(compact_labels, compact)}
+    if backend is not None and gallery_labels:
+        with tempfile.TemporaryDirectory() as directory:
+            report['index_bytes'] = _index_bytes(gallery, directory, backend)
+            report['compact_index_bytes'] = _index_bytes(compact, directory, backend)
+    LOGGER.info(f'Compacted {report["rows"]} to {report["compact_rows"]} embeddings, accuracy '
+                f'{report["accuracy"]} to {report["compact_accuracy"]}')
+    return report
@@ -0,0 +1,130 @@
+import os
+import time
+import pickle
+import tempfile
+import logging
+import itertools
+import yaml
+import numpy as np
+import pandas as pd
+from src.models.embedding_store import EmbeddingStore
+from src.models.vector_search import ExactBackend, NmslibBackend, get_distances, query_latencies, recall_at_k
+
+LOGGER = logging.getLogger('hnsw-tuning')
+
+
+def load_gallery_embeddings(path: str) -> np.ndarray:
+    """ Loads the embeddings of a gallery
+
+    Args:
+        path (str): Path to pickled embeddings, e.g. data/embeddings/embeddings.pickle, or the base path of an
+            embedding store.
+
+    Returns:
+        embeddings (np.ndarray): The embeddings, one per row.
+    """
+    if path.endswith('.pickle'):
+        with open(path, 'rb') as f:
+            return np.asarray(pickle.load(f), dtype=np.float32)
+    _, embeddings = EmbeddingStore(path).load()
+    return embeddings
+
+
+def sweep_hnsw(embeddings, ms: tuple = (8, 16, 32), ef_constructions: tuple = (100, 200, 400),
+               ef_searches: tuple = (10, 20, 40, 80, 160), queries: int = 1000, space: str = 'cosinesimil',
+               num_threads: int = 4, batch_size: int = 64, seed: int = 0) -> pd.DataFrame:
+    """ Measures NMSLIB HNSW indices for every combination of M, efConstruction and efSearch
+
+    Random embeddings are held out of the gallery as queries, the distance to their exact nearest neighbor in the
+    remaining gallery is the reference of the recall.
+
+    Args:
+        embeddings (np.ndarray): The embeddings of the gallery.
+        ms (tuple): Values of M, the number of links per element.
+        ef_constructions (tuple): Values of efConstruction, the size of the candidate list while building.
+        ef_searches (tuple): Values of efSearch, the size of the candidate list of a query.
+        queries (int): Maximum number of held out queries, at most a tenth of the gallery.
+        space (str): 'cosinesimil' or 'l2'.
+        num_threads (int): Number of threads building the index and querying a batch.
+        batch_size (int): Number of queries per batch, like the faces of a batch of frames.
+        seed (int): Seed of the random choice of the queries.
+
+    Returns:
+        results (DataFrame): Build seconds, index bytes, recall@1 and p50/p99 latency per batch of every
+            combination.
+    """
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    rng = np.random.default_rng(seed)
+    held_out = rng.permutation(len(embeddings))[:max(min(queries, len(embeddings) // 10), 1)]
+    gallery = np.delete(embeddings, held_out, axis=0)
+    queries = embeddings[held_out]
+    _, exact_distances = ExactBackend(space).fit(gallery).query_batch(queries, 1)
+    LOGGER.info(f'Sweeping HNSW on {len(gallery)} embeddings with {len(queries)} held out queries')
+
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for m, ef_construction in itertools.product(ms, ef_constructions):
+            index_params = {'M': m, 'indexThreadQty': num_threads, 'efConstruction': ef_construction}
+            backend = NmslibBackend(space, num_threads, 'hnsw', index_params)
+            start = time.perf_counter()
+            backend.fit(gallery)
+            build_seconds = time.perf_counter() - start
+
+            index_path = os.path.join(directory, f'index_{m}_{ef_construction}.bin')
+            backend.save(index_path)
+            index_bytes = os.path.getsize(index_path)
+
+            for ef_search in ef_searches:
+                backend.set_query_params({'efSearch': ef_search})
+                neighbors, latencies = query_latencies(backend, queries, 1, batch_size)
+                results.append({'M': m,
+                                'efConstruction': ef_construction,
+                                'efSearch': ef_search,
+                                'build_seconds': build_seconds,
+                                'index_bytes': index_bytes,
+                                'recall@1': recall_at_k(get_distances(gallery, queries, neighbors, space),
+                                                        exact_distances, 1),
+                                'p50_ms': float(np.percentile(latencies, 50) * 1000),
+                                'p99_ms': float(np.percentile(latencies, 99) * 1000)})
+                LOGGER.info(results[-1])
+    return pd.DataFrame(results)
+
+
+def select_hnsw_config(results: pd.DataFrame, min_recall: float = 0.99) -> dict:
+    """ Selects the combination with the lowest p99 latency that reaches the recall
+
+    Ties are broken by the p50 latency, the build time and the index size. If no combination reaches the recall, the
+    combination with the highest recall is selected.
+
+    Args:
+        results (DataFrame): The results of sweep_hnsw.
+        min_recall (float): The minimum recall@1.
+
+    Returns:
+        config (dict): The selected row.
+    """
+    candidates = results[results['recall@1'] >= min_recall]
+    if candidates.empty:
+        LOGGER.warning(f'No configuration reaches a recall@1 of {min_recall}, the highest recall is selected')
+        candidates = results[results['recall@1'] == results['recall@1'].max()]
+    best = candidates.sort_values(['p99_ms', 'p50_ms', 'build_seconds', 'index_bytes']).iloc[0]
+    return best.to_dict()
+
+
+def write_hnsw_config(config: dict, path: str, num_threads: int = 4):
+    """ Writes the index and query parameters in the format of the face-recognition section of config.yaml
+
+    Args:
+        config (dict): The selected row of the results.
+        path (str): Path to the YAML file.
+        num_threads (int): Number of threads building the index.
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, 'w') as f:
+        yaml.safe_dump({'face-recognition': {'index-params': {'M': int(config['M']),
+                                                              'indexThreadQty': num_threads,
+                                                              'efConstruction': int(config['efConstruction'])},
+                                             'query-params': {'efSearch': int(config['efSearch'])}}},
+                       f, default_flow_style=False)
@@ -0,0 +1,58 @@
+import numpy as np
+
+
+def normalize(embeddings, chunk_size: int = 100000) -> np.ndarray:
+    """ Scales embeddings to unit length, embeddings of length 0 stay 0
+
+    Args:
+        embeddings (np.ndarray): Embeddings of shape (N, D). Can be memory-mapped.
+        chunk_size (int): Number of embeddings scaled at once.
+
+    Returns:
+        embeddings (np.ndarray): The scaled float32 embeddings in memory.
+    """
+    if len(embeddings) == 0:
+        return np.asarray(embeddings, dtype=np.float32)
+    normalized = np.empty(np.shape(embeddings), dtype=np.float32)
+    for start in range(0, len(embeddings), chunk_size):
+        chunk = np.asarray(embeddings[start:start + chunk_size], dtype=np.float32)
+        norms = np.linalg.norm(chunk, axis=1, keepdims=True)
+        np.divide(chunk, np.where(norms > 0, norms, 1), out=normalized[start:start + chunk_size])
+    return normalized
+
+
+def cosine_nearest_neighbors(queries, gallery, normalized: bool = False, chunk_size: int = 100000):
+    """ Finds the nearest gallery embedding of every query by the cosine distance
+
+    The similarities of all queries are computed with one matrix multiplication per chunk of the gallery, so the
+    memory used for the similarities is bounded by the number of queries times chunk_size. Embeddings of length 0
+    have a cosine distance of 1 to everything.
+
+    Args:
+        queries (np.ndarray): Embeddings to look up, shape (M, D).
+        gallery (np.ndarray): Embeddings of the gallery, shape (N, D). Can be memory-mapped.
+        normalized (bool): Whether the gallery embeddings are of unit length already, e.g. from normalize. The
+            chunks of the gallery are scaled while they are compared otherwise.
+        chunk_size (int): Number of gallery embeddings compared at once.
+
+    Returns:
+        indices (np.ndarray): Index of the nearest gallery embedding per query.
+        distances (np.ndarray): Cosine distance to the nearest gallery embedding per query.
+    """
+    queries = normalize(np.asarray(queries, dtype=np.float32))
+
+    indices = np.zeros(len(queries), dtype=np.int64)
+    similarities = np.full(len(queries), -np.inf, dtype=np.float32)
+    rows = np.arange(len(queries))
+    for start in range(0, len(gallery), chunk_size):
+        chunk = gallery[start:start + chunk_size]
+        chunk = np.asarray(chunk, dtype=np.float32) if normalized else normalize(chunk)
+        chunk_similarities = np.matmul(queries, chunk.T)
+
+        chunk_indices = np.argmax(chunk_similarities, axis=1)
+        chunk_best = chunk_similarities[rows, chunk_indices]
+        better = chunk_best > similarities
+        similarities[better] = chunk_best[better]
+        indices[better] = chunk_indices[better] + start
+
+    return indices, 1 - similarities
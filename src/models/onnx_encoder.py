@@ -0,0 +1,192 @@
+import os
+import time
+import logging
+import numpy as np
+
+try:
+    import onnxruntime
+except ImportError:
+    onnxruntime = None
+
+LOGGER = logging.getLogger('onnx-encoder')
+
+ENCODER_BACKENDS = ['tensorflow', 'onnx', 'onnx-int8']
+
+
+def export_encoder(model, path: str, quantize: bool = False, opset: int = 13) -> str:
+    """ Exports a Keras face encoder, e.g. a model of DeepFace.build_model, to ONNX
+
+    The model is traced as a tf.function and converted from its graph, which works for Keras 2 and Keras 3 models.
+
+    Args:
+        model (keras.Model): The encoder.
+        path (str): Path to the ONNX model.
+        quantize (bool): Whether the weights are quantized to int8 after the export. The activations are quantized
+            dynamically while the model runs.
+        opset (int): The ONNX operator set.
+
+    Returns:
+        path (str): The path of the ONNX model.
+    """
+    import tensorflow as tf
+    import tf2onnx
+
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    input_shape = model.inputs[0].shape
+    signature = (tf.TensorSpec((None,) + tuple(input_shape[1:]), tf.float32, name='input'),)
+    float_path = f'{path}.float.tmp' if quantize else f'{path}.tmp'
+    function = tf.function(lambda faces: model(faces, training=False), input_signature=signature)
+    tf2onnx.convert.from_function(function, input_signature=signature, opset=opset, output_path=float_path)
+
+    if quantize:
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+
+        quantize_dynamic(float_path, f'{path}.tmp', weight_type=QuantType.QInt8)
+        os.remove(float_path)
+    os.replace(f'{path}.tmp', path)
+    LOGGER.info(f'Exported the encoder to {path}')
+    return path
+
+
+class OnnxEncoder(object):
+    """ Runs an exported face encoder with ONNX Runtime on the CPU
+
+    Provides the predict method of the Keras encoders, so it can replace them.
+
+    Args:
+        path (str): Path to the ONNX model.
+        num_threads (int): Number of threads of an inference. Uses all cores if 0.
+    """
+
+    def __init__(self, path: str, num_threads: int = 0):
+        if onnxruntime is None:
+            raise Exception('The ONNX encoder requires onnxruntime, install it with "pip install onnxruntime"')
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = num_threads
+        self.path = path
+        self.session = onnxruntime.InferenceSession(path, options, providers=['CPUExecutionProvider'])
+        self.input_name = self.session.get_inputs()[0].name
+        self.target = tuple(self.session.get_inputs()[0].shape[1:3])
+
+    def predict(self, faces, verbose: int = 0) -> np.ndarray:
+        """ Creates the embeddings of aligned faces
+
+        Args:
+            faces (np.ndarray): Batch of aligned faces with values in [0, 1].
+            verbose (int): Unused, for compatibility with Keras.
+
+        Returns:
+            embeddings (np.ndarray): One embedding per face.
+        """
+        return self.session.run(None, {self.input_name: np.asarray(faces, dtype=np.float32)})[0]
+
+
+def get_onnx_path(directory: str, encoder_name: str, backend: str) -> str:
+    """ Returns the path the encoder is exported to
+
+    Args:
+        directory (str): Directory of the ONNX models.
+        encoder_name (str): Name of the DeepFace model.
+        backend (str): 'onnx' or 'onnx-int8'.
+
+    Returns:
+        path (str): Path to the ONNX model.
+    """
+    return os.path.join(directory, f'{encoder_name}_{backend.replace("-", "_")}.onnx')
+
+
+def load_encoder(encoder_name: str, backend: str = 'tensorflow', directory: str = 'models/onnx'):
+    """ Loads a DeepFace encoder, exporting it to ONNX the first time an ONNX backend is used
+
+    Args:
+        encoder_name (str): Name of the DeepFace model, e.g. 'ArcFace' or 'Facenet'.
+        backend (str): 'tensorflow' runs the Keras model, 'onnx' the exported model and 'onnx-int8' the exported
+            model with int8 weights.
+        directory (str): Directory of the ONNX models.
+
+    Returns:
+        encoder: The encoder with a predict method.
+        target (tuple): The input shape of the encoder.
+    """
+    if backend not in ENCODER_BACKENDS:
+        raise Exception(f'Unknown encoder backend {backend}, options are {ENCODER_BACKENDS}')
+    if backend != 'tensorflow':
+        path = get_onnx_path(directory, encoder_name, backend)
+        if not os.path.exists(path):
+            from deepface import DeepFace
+
+            export_encoder(DeepFace.build_model(encoder_name), path, quantize=backend == 'onnx-int8')
+        encoder = OnnxEncoder(path)
+        return encoder, encoder.target
+
+    from deepface import DeepFace
+    from deepface.commons import functions
+
+    encoder = DeepFace.build_model(encoder_name)
+    return encoder, functions.find_input_shape(encoder)
+
+
+def cosine_agreement(embeddings, reference) -> np.ndarray:
+    """ Computes the cosine similarity of corresponding embeddings
+
+    Args:
+        embeddings (np.ndarray): Embeddings of one backend.
+        reference (np.ndarray): Embeddings of the same faces of the reference backend.
+
+    Returns:
+        similarities (np.ndarray): The cosine similarity per face.
+    """
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    reference = np.asarray(reference, dtype=np.float32)
+    return (embeddings * reference).sum(axis=1) / (np.linalg.norm(embeddings, axis=1) *
+                                                   np.linalg.norm(reference, axis=1))
+
+
+def benchmark_encoders(path: str = None, encoder_name: str = 'ArcFace', faces: int = 256, batch_size: int = 64,
+                       directory: str = 'models/onnx') -> dict:
+    """ Compares the throughput of the encoder backends and the agreement of their embeddings
+
+    Args:
+        path (str): Optional directory of face images, e.g. the thumbnails of an entity. Random faces are used if
+            None.
+        encoder_name (str): Name of the DeepFace model.
+        faces (int): Number of faces to encode.
+        batch_size (int): Number of faces per predict call.
+        directory (str): Directory of the ONNX models.
+
+    Returns:
+        results (dict): Faces per second and the mean and minimum cosine similarity to the TensorFlow embeddings per
+            backend.
+    """
+    encoders = {backend: load_encoder(encoder_name, backend, directory)[0] for backend in ENCODER_BACKENDS}
+    target = encoders['onnx'].target
+
+    if path is not None:
+        import cv2
+        from src.utils.utils import image_files_in_folder
+
+        images = [cv2.imread(img_path) for img_path in image_files_in_folder(path)[:faces]]
+        batch = np.stack([cv2.resize(cv2.cvtColor(img, cv2.COLOR_BGR2RGB), (target[1], target[0]))
+                          for img in images if img is not None]).astype(np.float32) / 255
+    else:
+        batch = np.random.default_rng(0).random((faces,) + tuple(target) + (3,), dtype=np.float32)
+
+    results = {}
+    reference = None
+    for backend, encoder in encoders.items():
+        encoder.predict(batch[:batch_size])  # warm up
+        start = time.perf_counter()
+        embeddings = np.concatenate([encoder.predict(batch[i:i + batch_size])
+                                     for i in range(0, len(batch), batch_size)])
+        seconds = time.perf_counter() - start
+        if reference is None:
+            reference = embeddings
+        similarities = cosine_agreement(embeddings, reference)
+        results[backend] = {'faces_per_second': len(batch) / seconds,
+                            'mean_cosine': float(similarities.mean()),
+                            'min_cosine': float(similarities.min())}
+        LOGGER.info(f'{backend}: {results[backend]}')
+    return results
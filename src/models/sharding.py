@@ -0,0 +1,74 @@
+import logging
+
+LOGGER = logging.getLogger('sharding')
+
+_WORKER = {}
+
+
+def split_samples(sample_count: int, shards: int, overlap: int = 0) -> list:
+    """ Splits the samples of a video into consecutive time ranges
+
+    Args:
+        sample_count (int): Number of samples in the video.
+        shards (int): Number of ranges to create.
+        overlap (int): Number of samples before each range that are processed again to warm up stateful steps.
+
+    Returns:
+        ranges (list): List of (first, start, end) tuples. Samples from first to start are only processed for the
+            warm-up, the range owns the samples from start to end (exclusive). The end of the last range is None,
+            so samples beyond the reported length of the video are not lost.
+    """
+    shards = max(min(shards, sample_count), 1)
+    bounds = [round(i * sample_count / shards) for i in range(shards + 1)]
+    ranges = []
+    for i in range(shards):
+        start = bounds[i]
+        end = bounds[i + 1] if i < shards - 1 else None
+        ranges.append((max(start - overlap, 0), start, end))
+    return ranges
+
+
+def merge_shards(shard_results: list) -> list:
+    """ Merges the results of time ranges to the results of the whole video
+
+    Args:
+        shard_results (list): List of (start, end, results) tuples. results is a list of (index, ...) tuples where
+            index is the sample index.
+
+    Returns:
+        results (list): The results owned by their ranges in the order of the sample index.
+    """
+    merged = []
+    for start, end, results in shard_results:
+        merged.extend(result for result in results if result[0] >= start and (end is None or result[0] < end))
+    merged.sort(key=lambda result: result[0])
+    return merged
+
+
+def init_worker(face_recognition_kwargs: dict, recognizer_model=None):
+    """ Loads the models of a worker process once
+
+    Args:
+        face_recognition_kwargs (dict): Arguments to create the FaceRecognition.
+        recognizer_model (any model): Model trained with embeddings to predict entities.
+    """
+    from src.models.face_recognition import FaceRecognition
+
+    _WORKER['face_recognition'] = FaceRecognition(**face_recognition_kwargs)
+    _WORKER['recognizer_model'] = recognizer_model
+
+
+def recognize_shard(task: tuple) -> tuple:
+    """ Recognizes the entities in a time range of a video inside a worker process
+
+    Args:
+        task (tuple): (video_path, first, start, end, kwargs) where kwargs are passed to iter_recognitions.
+
+    Returns:
+        result (tuple): (start, end, results) where results is a list of (index, timestamp, entities, boxes).
+    """
+    video_path, first, start, end, kwargs = task
+    LOGGER.info(f'Recognizing samples {start} to {end} of {video_path}')
+    recognitions = _WORKER['face_recognition'].iter_recognitions(video_path, _WORKER['recognizer_model'],
+                                                                start=first, end=end, **kwargs)
+    return start, end, [(first + i,) + recognition for i, recognition in enumerate(recognitions)]
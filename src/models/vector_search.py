@@ -0,0 +1,749 @@
+import os
+import time
+import importlib.util
+import tempfile
+import logging
+import numpy as np
+
+try:
+    import hnswlib
+except ImportError:
+    hnswlib = None
+
+LOGGER = logging.getLogger('vector-search')
+
+SPACES = ['cosinesimil', 'l2']
+
+
+def _prepare(embeddings, space: str) -> np.ndarray:
+    """ Converts embeddings to a contiguous float32 matrix, normalized to unit length for the cosine space """
+    embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+    if space == 'cosinesimil' and len(embeddings):
+        embeddings = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return embeddings
+
+
+def _pad(results: list, k: int):
+    """ Converts lists of (neighbors, distances) with up to k entries to (n, k) arrays padded with -1 and inf """
+    neighbors = np.full((len(results), k), -1, dtype=np.int64)
+    distances = np.full((len(results), k), np.inf, dtype=np.float32)
+    for i, (result_neighbors, result_distances) in enumerate(results):
+        neighbors[i, :len(result_neighbors)] = result_neighbors
+        distances[i, :len(result_distances)] = result_distances
+    return neighbors, distances
+
+
+def _top_k(chunks, count: int, k: int):
+    """ Selects the k nearest neighbors from chunks of distances
+
+    Args:
+        chunks: Iterable of (start, distances) with the id of the first embedding of the chunk and the distances of
+            every query to the chunk.
+        count (int): Number of queries.
+        k (int): The number of nearest neighbors.
+
+    Returns:
+        neighbors (np.ndarray): Ids of the neighbors per query, shape (n, k), nearest first, padded with -1.
+        distances (np.ndarray): Distances to the neighbors per query, shape (n, k), padded with inf.
+    """
+    neighbors = np.full((count, 0), -1, dtype=np.int64)
+    distances = np.full((count, 0), np.inf, dtype=np.float32)
+    for start, chunk_distances in chunks:
+        # merge the k nearest of the chunk with the k nearest so far
+        distances = np.concatenate([distances, chunk_distances], axis=1)
+        neighbors = np.concatenate([neighbors, np.broadcast_to(np.arange(start, start + chunk_distances.shape[1]),
+                                                               chunk_distances.shape)], axis=1)
+        if distances.shape[1] > k:
+            nearest = np.argpartition(distances, k - 1, axis=1)[:, :k]
+            distances = np.take_along_axis(distances, nearest, axis=1)
+            neighbors = np.take_along_axis(neighbors, nearest, axis=1)
+
+    order = np.argsort(distances, axis=1, kind='stable')
+    return _pad(list(zip(np.take_along_axis(neighbors, order, axis=1), np.take_along_axis(distances, order, axis=1))),
+                k)
+
+
+class VectorSearchBackend(object):
+    """ Interface of the libraries that search the nearest gallery embeddings
+
+    The distances of every backend have the same meaning: the cosine distance (1 - cosine similarity) in the
+    'cosinesimil' space and the euclidean distance in the 'l2' space.
+
+    Args:
+        space (str): 'cosinesimil' or 'l2'.
+        num_threads (int): Number of threads used to query a batch of embeddings.
+    """
+
+    name = None
+
+    def __init__(self, space: str = 'cosinesimil', num_threads: int = 4):
+        if space not in SPACES:
+            raise Exception(f'Unknown space {space}, options are {SPACES}')
+        self.space = space
+        self.num_threads = num_threads
+        self.size = 0
+
+    def fit(self, embeddings):
+        """ Builds the index of the embeddings
+
+        Args:
+            embeddings (np.ndarray): The ordered embeddings of the gallery.
+
+        Returns:
+            self
+        """
+        raise NotImplementedError
+
+    def add(self, embeddings):
+        """ Adds embeddings to the index, their ids continue the ids of the index
+
+        Args:
+            embeddings (np.ndarray): The embeddings to add.
+
+        Returns:
+            self
+        """
+        raise NotImplementedError
+
+    def query_batch(self, queries, k: int = 1):
+        """ Searches the k nearest neighbors of many embeddings
+
+        Args:
+            queries (np.ndarray): The embeddings to look up.
+            k (int): The number of nearest neighbors.
+
+        Returns:
+            neighbors (np.ndarray): Ids of the neighbors per query, shape (n, k), nearest first, padded with -1.
+            distances (np.ndarray): Distances to the neighbors per query, shape (n, k), padded with inf.
+        """
+        raise NotImplementedError
+
+    def save(self, path: str):
+        """ Saves the index to a single file
+
+        Args:
+            path (str): Path to the index.
+        """
+        raise NotImplementedError
+
+    def load(self, path: str, embeddings):
+        """ Loads a saved index
+
+        Args:
+            path (str): Path to the index.
+            embeddings (np.ndarray): The embeddings the index was built from, for backends that do not save them.
+
+        Returns:
+            self
+        """
+        raise NotImplementedError
+
+
+class ExactBackend(VectorSearchBackend):
+    """ Exact search that compares every query to every embedding with NumPy
+
+    Args:
+        space (str): 'cosinesimil' or 'l2'.
+        num_threads (int): Unused, NumPy decides on the threads of the matrix multiplication.
+        chunk_size (int): Number of gallery embeddings compared at once.
+    """
+
+    name = 'exact'
+
+    def __init__(self, space: str = 'cosinesimil', num_threads: int = 4, chunk_size: int = 100000):
+        super().__init__(space, num_threads)
+        self.chunk_size = chunk_size
+        self.embeddings = np.zeros((0, 0), dtype=np.float32)
+
+    def fit(self, embeddings):
+        self.embeddings = _prepare(embeddings, self.space)
+        self.size = len(self.embeddings)
+        return self
+
+    def add(self, embeddings):
+        embeddings = _prepare(embeddings, self.space)
+        self.embeddings = np.concatenate([self.embeddings, embeddings]) if self.size else embeddings
+        self.size = len(self.embeddings)
+        return self
+
+    def query_batch(self, queries, k: int = 1):
+        queries = _prepare(queries, self.space)
+        return _top_k(((start, self._distances(queries, self.embeddings[start:start + self.chunk_size]))
+                       for start in range(0, self.size, self.chunk_size)), len(queries), k)
+
+    def _distances(self, queries, chunk):
+        """ Computes the distances of the queries to a chunk of embeddings """
+        if self.space == 'cosinesimil':
+            return 1 - np.matmul(queries, chunk.T)
+        return np.sqrt(np.maximum((queries ** 2).sum(axis=1, keepdims=True) - 2 * queries @ chunk.T
+                                  + (chunk ** 2).sum(axis=1), 0))
+
+    def save(self, path: str):
+        with open(path, 'wb') as f:
+            np.save(f, self.embeddings)
+
+    def load(self, path: str, embeddings):
+        return self.fit(embeddings)
+
+
+class NmslibBackend(VectorSearchBackend):
+    """ Approximate search with NMSLIB
+
+    Args:
+        space (str): 'cosinesimil' or 'l2'.
+        num_threads (int): Number of threads used to query a batch of embeddings.
+        method (str): The NMSLIB method, e.g. 'hnsw' or 'brute_force'.
+        index_params (dict): Parameters to create the index.
+        query_params (dict): Parameters of the queries, e.g. efSearch.
+    """
+
+    name = 'nmslib'
+
+    def __init__(self, space: str = 'cosinesimil', num_threads: int = 4, method: str = 'hnsw',
+                 index_params: dict = None, query_params: dict = None):
+        super().__init__(space, num_threads)
+        self.method = method
+        self.index_params = index_params if index_params is not None else {'M': 15, 'indexThreadQty': 4,
+                                                                           'efConstruction': 100}
+        self.query_params = query_params
+        self.index = None
+
+    def _init_index(self, embeddings):
+        import nmslib
+
+        self.index = nmslib.init(method=self.method, space=self.space, data_type=nmslib.DataType.DENSE_VECTOR)
+        self.index.addDataPointBatch(np.ascontiguousarray(embeddings, dtype=np.float32))
+        self.size = len(embeddings)
+
+    def fit(self, embeddings):
+        self._init_index(embeddings)
+        self.index.createIndex(self.index_params if self.method != 'brute_force' else {})
+        if self.query_params:
+            self.index.setQueryTimeParams(self.query_params)
+        return self
+
+    def set_query_params(self, query_params: dict):
+        """ Changes the parameters of the queries of a fitted index
+
+        Args:
+            query_params (dict): Parameters of the queries, e.g. efSearch.
+        """
+        self.query_params = query_params
+        self.index.setQueryTimeParams(query_params)
+
+    def add(self, embeddings):
+        raise Exception('NMSLIB can not add embeddings to a created index, the index has to be fitted again')
+
+    def query_batch(self, queries, k: int = 1):
+        results = self.index.knnQueryBatch(np.ascontiguousarray(queries, dtype=np.float32), k=k,
+                                           num_threads=self.num_threads)
+        return _pad(results, k)
+
+    def save(self, path: str):
+        self.index.saveIndex(path, save_data=False)
+
+    def load(self, path: str, embeddings):
+        self._init_index(embeddings)
+        self.index.loadIndex(path)
+        if self.query_params:
+            self.index.setQueryTimeParams(self.query_params)
+        return self
+
+
+class HnswlibBackend(VectorSearchBackend):
+    """ Approximate search with hnswlib
+
+    Args:
+        space (str): 'cosinesimil' or 'l2'.
+        num_threads (int): Number of threads used to build the index and to query a batch of embeddings.
+        M (int): Number of links per element.
+        ef_construction (int): Size of the candidate list while building the index.
+        ef_search (int): Size of the candidate list of a query.
+    """
+
+    name = 'hnswlib'
+
+    def __init__(self, space: str = 'cosinesimil', num_threads: int = 4, M: int = 16, ef_construction: int = 100,
+                 ef_search: int = 50):
+        super().__init__(space, num_threads)
+        if hnswlib is None:
+            raise Exception('The hnswlib backend requires hnswlib, install it with "pip install hnswlib"')
+        self.M = M
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+        self.index = None
+
+    def _init_index(self, dim: int, max_elements: int):
+        self.index = hnswlib.Index(space='cosine' if self.space == 'cosinesimil' else 'l2', dim=dim)
+        self.index.init_index(max_elements=max(max_elements, 1), ef_construction=self.ef_construction, M=self.M)
+        self.index.set_num_threads(self.num_threads)
+
+    def fit(self, embeddings):
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+        self._init_index(embeddings.shape[1], len(embeddings))
+        self.size = 0
+        return self.add(embeddings)
+
+    def add(self, embeddings):
+        embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+        if self.size + len(embeddings) > self.index.get_max_elements():
+            self.index.resize_index(self.size + len(embeddings))
+        self.index.add_items(embeddings, np.arange(self.size, self.size + len(embeddings)))
+        self.size += len(embeddings)
+        self.index.set_ef(max(self.ef_search, 1))
+        return self
+
+    def query_batch(self, queries, k: int = 1):
+        queries = np.ascontiguousarray(queries, dtype=np.float32)
+        count = min(k, self.size)
+        self.index.set_ef(max(self.ef_search, count))
+        neighbors, distances = self.index.knn_query(queries, k=count, num_threads=self.num_threads)
+        if self.space == 'l2':  # hnswlib returns squared distances
+            distances = np.sqrt(distances)
+        return _pad(list(zip(neighbors, distances)), k)
+
+    def save(self, path: str):
+        self.index.save_index(path)
+
+    def load(self, path: str, embeddings):
+        embeddings = np.asarray(embeddings)
+        self.index = hnswlib.Index(space='cosine' if self.space == 'cosinesimil' else 'l2', dim=embeddings.shape[1])
+        self.index.load_index(path, max_elements=len(embeddings))
+        self.index.set_num_threads(self.num_threads)
+        self.index.set_ef(self.ef_search)
+        self.size = len(embeddings)
+        return self
+
+
+class FaissBackend(VectorSearchBackend):
+    """ Approximate search with the HNSW index of faiss
+
+    Args:
+        space (str): 'cosinesimil' or 'l2'.
+        num_threads (int): Number of OpenMP threads of faiss.
+        M (int): Number of links per element.
+        ef_construction (int): Size of the candidate list while building the index.
+        ef_search (int): Size of the candidate list of a query.
+    """
+
+    name = 'faiss'
+
+    def __init__(self, space: str = 'cosinesimil', num_threads: int = 4, M: int = 16, ef_construction: int = 100,
+                 ef_search: int = 50):
+        super().__init__(space, num_threads)
+        # faiss is imported by the methods, it is slow to import
+        if importlib.util.find_spec('faiss') is None:
+            raise Exception('The faiss backend requires faiss, install it with "pip install faiss-cpu"')
+        self.M = M
+        self.ef_construction = ef_construction
+        self.ef_search = ef_search
+        self.index = None
+
+    def fit(self, embeddings):
+        import faiss
+
+        embeddings = _prepare(embeddings, self.space)
+        metric = faiss.METRIC_INNER_PRODUCT if self.space == 'cosinesimil' else faiss.METRIC_L2
+        self.index = faiss.IndexHNSWFlat(embeddings.shape[1], self.M, metric)
+        self.index.hnsw.efConstruction = self.ef_construction
+        self.size = 0
+        return self.add(embeddings)
+
+    def add(self, embeddings):
+        import faiss
+
+        faiss.omp_set_num_threads(self.num_threads)
+        self.index.add(_prepare(embeddings, self.space))
+        self.size = self.index.ntotal
+        return self
+
+    def query_batch(self, queries, k: int = 1):
+        import faiss
+
+        faiss.omp_set_num_threads(self.num_threads)
+        self.index.hnsw.efSearch = max(self.ef_search, k)
+        distances, neighbors = self.index.search(_prepare(queries, self.space), k)
+        # faiss returns the inner product or the squared distance
+        distances = 1 - distances if self.space == 'cosinesimil' else np.sqrt(np.maximum(distances, 0))
+        distances[neighbors < 0] = np.inf
+        return neighbors.astype(np.int64), distances.astype(np.float32)
+
+    def save(self, path: str):
+        import faiss
+
+        faiss.write_index(self.index, path)
+
+    def load(self, path: str, embeddings):
+        import faiss
+
+        self.index = faiss.read_index(path)
+        self.size = self.index.ntotal
+        return self
+
+
+class QuantizedBackend(VectorSearchBackend):
+    """ Exact search on embeddings compressed to 8 bit per dimension, with exact re-ranking of the candidates
+
+    Every dimension is mapped linearly from its range in the gallery to 0..255, so the codes take a quarter of the
+    memory of float32 embeddings. The rerank * k nearest neighbors of the codes are re-ranked with the full precision
+    embeddings, which are only read for these candidates and can stay memory-mapped on disk.
+
+    Args:
+        space (str): 'cosinesimil' or 'l2'.
+        num_threads (int): Unused, NumPy decides on the threads of the matrix multiplication.
+        chunk_size (int): Number of codes compared at once.
+        rerank (int): Number of candidates per nearest neighbor that are re-ranked. No re-ranking if 0.
+    """
+
+    name = 'int8'
+
+    def __init__(self, space: str = 'cosinesimil', num_threads: int = 4, chunk_size: int = 100000, rerank: int = 10):
+        super().__init__(space, num_threads)
+        self.chunk_size = chunk_size
+        self.rerank = rerank
+        self.embeddings = np.zeros((0, 0), dtype=np.float32)
+        self.codes = np.zeros((0, 0), dtype=np.uint8)
+        self.norms = np.zeros(0, dtype=np.float32)
+        self.low = None
+        self.step = None
+
+    def fit(self, embeddings):
+        self.embeddings = embeddings if isinstance(embeddings, np.ndarray) else np.asarray(embeddings, np.float32)
+        self.size = len(self.embeddings)
+        self.norms = np.concatenate([np.linalg.norm(self._chunk(start), axis=1)
+                                     for start in range(0, self.size, self.chunk_size)] or [self.norms])
+
+        # the range of every dimension of the normalized embeddings
+        low, high = np.inf, -np.inf
+        for start in range(0, self.size, self.chunk_size):
+            chunk = self._normalize(self._chunk(start), start)
+            low, high = np.minimum(low, chunk.min(axis=0)), np.maximum(high, chunk.max(axis=0))
+        self.low = np.asarray(low, dtype=np.float32)
+        self.step = np.asarray(np.where(high > low, (high - low) / 255, 1), dtype=np.float32)
+
+        self.codes = np.concatenate([self._encode(self._normalize(self._chunk(start), start))
+                                     for start in range(0, self.size, self.chunk_size)] or [self.codes])
+        return self
+
+    def add(self, embeddings):
+        if self.low is None:
+            return self.fit(embeddings)
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        norms = np.linalg.norm(embeddings, axis=1)
+        self.embeddings = np.concatenate([self.embeddings, embeddings])
+        self.codes = np.concatenate([self.codes, self._encode(embeddings / norms[:, None] if self.space ==
+                                                              'cosinesimil' else embeddings)])
+        self.norms = np.concatenate([self.norms, norms])
+        self.size = len(self.embeddings)
+        return self
+
+    def _chunk(self, start: int):
+        """ Reads a chunk of the full precision embeddings """
+        return np.asarray(self.embeddings[start:start + self.chunk_size], dtype=np.float32)
+
+    def _normalize(self, chunk, start: int):
+        """ Normalizes a chunk of embeddings to unit length for the cosine space """
+        if self.space == 'cosinesimil':
+            return chunk / self.norms[start:start + len(chunk), None]
+        return chunk
+
+    def _encode(self, chunk):
+        """ Maps embeddings to 8 bit codes, values outside of the range are clipped """
+        return np.clip(np.rint((chunk - self.low) / self.step), 0, 255).astype(np.uint8)
+
+    def query_batch(self, queries, k: int = 1):
+        queries = _prepare(queries, self.space)
+        if self.size == 0:
+            return _pad([([], [])] * len(queries), k)
+        candidates = k * self.rerank if self.rerank else k
+
+        # the decoded codes are low + step * code, so the dot product of a query is q.low + (q * step).code
+        offsets = queries @ self.low
+        scaled = queries * self.step
+        squared_norms = (queries ** 2).sum(axis=1, keepdims=True)
+
+        def distances():
+            for start in range(0, self.size, self.chunk_size):
+                products = offsets[:, None] + scaled @ self.codes[start:start + self.chunk_size].T.astype(np.float32)
+                if self.space == 'cosinesimil':
+                    yield start, 1 - products
+                else:
+                    yield start, squared_norms - 2 * products + self.norms[start:start + products.shape[1]] ** 2
+
+        neighbors, approximate = _top_k(distances(), len(queries), candidates)
+        if not self.rerank:
+            if self.space == 'l2':
+                approximate = np.sqrt(np.maximum(approximate, 0))
+            return neighbors, approximate
+        return self._rerank(queries, neighbors, k)
+
+    def _rerank(self, queries, neighbors, k: int):
+        """ Sorts the candidates by their distance to the full precision embeddings """
+        valid = neighbors >= 0
+        ids, inverse = np.unique(neighbors[valid], return_inverse=True)
+        rows = np.asarray(self.embeddings[ids], dtype=np.float32)
+
+        candidates = np.zeros(neighbors.shape + (queries.shape[1],), dtype=np.float32)
+        candidates[valid] = rows[inverse]
+        products = np.einsum('md,mcd->mc', queries, candidates)
+        norms = self.norms[np.maximum(neighbors, 0)]
+        if self.space == 'cosinesimil':
+            distances = 1 - products / np.where(norms > 0, norms, 1)
+        else:
+            distances = np.sqrt(np.maximum((queries ** 2).sum(axis=1, keepdims=True) - 2 * products + norms ** 2, 0))
+        distances = np.where(valid, distances, np.inf).astype(np.float32)
+
+        order = np.argsort(distances, axis=1, kind='stable')[:, :k]
+        neighbors, distances = np.take_along_axis(neighbors, order, axis=1), np.take_along_axis(distances, order, axis=1)
+        return _pad(list(zip(neighbors, distances)), k)
+
+    def save(self, path: str):
+        with open(path, 'wb') as f:
+            np.savez(f, codes=self.codes, norms=self.norms, low=self.low, step=self.step)
+
+    def load(self, path: str, embeddings):
+        with np.load(path) as index:
+            self.codes, self.norms, self.low, self.step = index['codes'], index['norms'], index['low'], index['step']
+        self.embeddings = embeddings if isinstance(embeddings, np.ndarray) else np.asarray(embeddings, np.float32)
+        self.size = len(self.codes)
+        return self
+
+    def get_memory(self) -> int:
+        """ Returns the bytes the search keeps in memory, without the memory-mapped full precision embeddings
+
+        Returns:
+            bytes (int): Size of the codes, the norms and the quantization ranges.
+        """
+        return self.codes.nbytes + self.norms.nbytes + self.low.nbytes + self.step.nbytes
+
+
+BACKENDS = {backend.name: backend for backend in [ExactBackend, NmslibBackend, HnswlibBackend, FaissBackend,
+                                                   QuantizedBackend]}
+
+
+def create_backend(name: str, space: str = 'cosinesimil', num_threads: int = 4, **params) -> VectorSearchBackend:
+    """ Creates a vector search backend by name
+
+    Args:
+        name (str): One of 'exact', 'nmslib', 'hnswlib', 'faiss' and 'int8'.
+        space (str): 'cosinesimil' or 'l2'.
+        num_threads (int): Number of threads used to query a batch of embeddings.
+        params: Further parameters of the backend.
+
+    Returns:
+        backend (VectorSearchBackend): The backend.
+    """
+    if name not in BACKENDS:
+        raise Exception(f'Unknown vector search backend {name}, options are {list(BACKENDS)}')
+    return BACKENDS[name](space, num_threads, **params)
+
+
+def create_synthetic_gallery(size: int = 100000, dim: int = 128, entities: int = 10000, queries: int = 1000,
+                             seed: int = 0, path: str = None, chunk_size: int = 100000):
+    """ Creates clustered embeddings similar to a gallery with several thumbnails per entity
+
+    Args:
+        size (int): Number of gallery embeddings.
+        dim (int): Dimension of the embeddings.
+        entities (int): Number of clusters.
+        queries (int): Number of query embeddings drawn around the same clusters.
+        seed (int): Seed of the random generator.
+        path (str): Path of a .npy file the gallery is written to and memory-mapped from. Kept in memory if None.
+        chunk_size (int): Number of embeddings generated at once.
+
+    Returns:
+        gallery (np.ndarray): The gallery embeddings.
+        queries (np.ndarray): The query embeddings.
+    """
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(entities, dim)).astype(np.float32)
+    if path is not None:
+        gallery = np.lib.format.open_memmap(path, mode='w+', dtype=np.float32, shape=(size, dim))
+    else:
+        gallery = np.empty((size, dim), dtype=np.float32)
+    for start in range(0, size, chunk_size):
+        count = min(chunk_size, size - start)
+        gallery[start:start + count] = centers[rng.integers(0, entities, count)] \
+            + rng.normal(0, 0.5, (count, dim)).astype(np.float32)
+    if path is not None:
+        gallery.flush()
+        gallery = np.load(path, mmap_mode='r')
+    queries = centers[rng.integers(0, entities, queries)] + rng.normal(0, 0.5, (queries, dim)).astype(np.float32)
+    return gallery, queries
+
+
+def _read_gallery(path: str):
+    """ Reads an embedding store and draws queries close to its embeddings """
+    from src.models.embedding_store import EmbeddingStore
+
+    _, gallery = EmbeddingStore(path).load()
+    rng = np.random.default_rng(0)
+    queries = np.asarray(gallery[np.sort(rng.integers(0, len(gallery), min(1000, len(gallery))))])
+    return gallery, queries + rng.normal(0, 0.01, queries.shape).astype(np.float32)
+
+
+def query_latencies(backend: VectorSearchBackend, queries, k: int = 1, batch_size: int = 64):
+    """ Queries a backend in batches and measures the latency of every batch
+
+    Args:
+        backend (VectorSearchBackend): The fitted backend.
+        queries (np.ndarray): The embeddings to look up.
+        k (int): The number of nearest neighbors.
+        batch_size (int): Number of queries per query_batch call.
+
+    Returns:
+        neighbors (np.ndarray): Ids of the neighbors per query, shape (n, k).
+        latencies (list): Seconds of every query_batch call.
+    """
+    latencies = []
+    neighbors = []
+    for i in range(0, len(queries), batch_size):
+        start = time.perf_counter()
+        neighbors.append(backend.query_batch(queries[i:i + batch_size], k)[0])
+        latencies.append(time.perf_counter() - start)
+    return np.concatenate(neighbors), latencies
+
+
+def get_distances(gallery, queries, neighbors, space: str = 'cosinesimil') -> np.ndarray:
+    """ Computes the exact distances of queries to neighbors in the gallery
+
+    Args:
+        gallery (np.ndarray): The embeddings of the gallery. Can be memory-mapped.
+        queries (np.ndarray): The query embeddings.
+        neighbors (np.ndarray): Ids of the neighbors per query, padded with -1.
+        space (str): 'cosinesimil' or 'l2'.
+
+    Returns:
+        distances (np.ndarray): Distance to every neighbor, inf for padding.
+    """
+    queries = _prepare(queries, space)
+    ids, inverse = np.unique(np.maximum(neighbors, 0), return_inverse=True)
+    rows = _prepare(np.asarray(gallery[ids], dtype=np.float32), space)[inverse.reshape(neighbors.shape)]
+    if space == 'cosinesimil':
+        distances = 1 - np.einsum('md,mkd->mk', queries, rows)
+    else:
+        distances = np.linalg.norm(rows - queries[:, None], axis=2)
+    return np.where(neighbors >= 0, distances, np.inf)
+
+
+def recall_at_k(distances, exact_distances, k: int, tolerance: float = 1e-5) -> float:
+    """ Computes the share of the k exact nearest neighbors that were found
+
+    A neighbor counts if it is as near as the k-th exact nearest neighbor, so a duplicate embedding in the gallery is
+    as good as the embedding the exact search returned.
+
+    Args:
+        distances (np.ndarray): Exact distances of the neighbors found per query, see get_distances.
+        exact_distances (np.ndarray): Distances of the exact nearest neighbors per query.
+        k (int): The number of nearest neighbors compared.
+        tolerance (float): Distances of the found neighbors may exceed the k-th exact distance by this.
+
+    Returns:
+        recall (float): The mean recall@k of the queries.
+    """
+    return float(np.mean((distances[:, :k] <= exact_distances[:, k - 1:k] + tolerance).sum(axis=1) / k))
+
+
+def benchmark_backends(path: str = None, k: int = 10, backends: list = None, space: str = 'cosinesimil',
+                       batch_size: int = 64, size: int = 100000) -> dict:
+    """ Compares the vector search backends to the exact search
+
+    Args:
+        path (str): Base path of an embedding store to use as gallery, e.g. data/embeddings/embeddings. A synthetic
+            gallery is used if None.
+        k (int): The number of nearest neighbors.
+        backends (list): Names of the backends. Uses all available backends if None.
+        space (str): 'cosinesimil' or 'l2'.
+        batch_size (int): Number of queries per query_batch call.
+        size (int): Number of embeddings of the synthetic gallery.
+
+    Returns:
+        results (dict): Build seconds, index bytes, recall@k and p50/p99 query latency per batch for each backend.
+    """
+    if path is not None:
+        gallery, queries = _read_gallery(path)
+    else:
+        gallery, queries = create_synthetic_gallery(size, entities=max(size // 10, 1))
+    gallery = np.asarray(gallery)
+
+    if backends is None:
+        backends = [name for name, backend in BACKENDS.items()
+                    if not (name == 'hnswlib' and hnswlib is None)
+                    and not (name == 'faiss' and importlib.util.find_spec('faiss') is None)]
+
+    _, exact_distances = ExactBackend(space).fit(gallery).query_batch(queries, k)
+    results = {}
+    for name in backends:
+        backend = create_backend(name, space)
+        start = time.perf_counter()
+        backend.fit(gallery)
+        build_seconds = time.perf_counter() - start
+        neighbors, latencies = query_latencies(backend, queries, k, batch_size)
+
+        with tempfile.TemporaryDirectory() as directory:
+            index_path = os.path.join(directory, 'index')
+            backend.save(index_path)
+            index_bytes = os.path.getsize(index_path)
+
+        results[name] = {'build_seconds': build_seconds,
+                         'index_bytes': index_bytes,
+                         f'recall@{k}': recall_at_k(get_distances(gallery, queries, neighbors, space), exact_distances,
+                                                    k),
+                         'p50_ms': float(np.percentile(latencies, 50) * 1000),
+                         'p99_ms': float(np.percentile(latencies, 99) * 1000)}
+        LOGGER.info(f'{name}: {results[name]}')
+    return results
+
+
+def benchmark_quantization(path: str = None, size: int = 1000000, k: int = 10, reranks: tuple = (0, 1, 4, 10),
+                           space: str = 'cosinesimil', batch_size: int = 64) -> dict:
+    """ Compares the int8 gallery with different numbers of re-ranked candidates to the exact search
+
+    The full precision gallery is memory-mapped like the embedding store, so only the exact search and the codes of
+    the int8 gallery are held in memory.
+
+    Args:
+        path (str): Base path of an embedding store to use as gallery, e.g. data/embeddings/embeddings. A synthetic
+            gallery is used if None.
+        size (int): Number of embeddings of the synthetic gallery.
+        k (int): The number of nearest neighbors.
+        reranks (tuple): Numbers of re-ranked candidates per nearest neighbor to compare.
+        space (str): 'cosinesimil' or 'l2'.
+        batch_size (int): Number of queries per query_batch call.
+
+    Returns:
+        results (dict): Memory, recall@1, recall@k and p50/p99 query latency per batch for the exact search and for
+            every number of re-ranked candidates.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        if path is not None:
+            gallery, queries = _read_gallery(path)
+        else:
+            gallery, queries = create_synthetic_gallery(size, entities=size // 10,
+                                                        path=os.path.join(directory, 'gallery.npy'))
+
+        backend = ExactBackend(space).fit(gallery)
+        exact, latencies = query_latencies(backend, queries, k, batch_size)
+        exact_distances = get_distances(gallery, queries, exact, space)
+        results = {'exact': {'memory_bytes': backend.embeddings.nbytes,
+                             'recall@1': 1.0,
+                             f'recall@{k}': 1.0,
+                             'p50_ms': float(np.percentile(latencies, 50) * 1000),
+                             'p99_ms': float(np.percentile(latencies, 99) * 1000)}}
+        LOGGER.info(f'exact: {results["exact"]}')
+        del backend
+
+        backend = QuantizedBackend(space).fit(gallery)
+        for rerank in reranks:
+            backend.rerank = rerank
+            neighbors, latencies = query_latencies(backend, queries, k, batch_size)
+            distances = get_distances(gallery, queries, neighbors, space)
+            name = f'int8 rerank {rerank}'
+            results[name] = {'memory_bytes': backend.get_memory(),
+                             'recall@1': recall_at_k(distances, exact_distances, 1),
+                             f'recall@{k}': recall_at_k(distances, exact_distances, k),
+                             'p50_ms': float(np.percentile(latencies, 50) * 1000),
+                             'p99_ms': float(np.percentile(latencies, 99) * 1000)}
+            LOGGER.info(f'{name}: {results[name]}')
+        del backend, gallery
+    return results
@@ -1,4 +1,5 @@
 import logging
+from collections import deque
 from datetime import timedelta
 import numpy as np
 
@@ -18,47 +19,88 @@ def extract_scenes(recognitions: list, timestamps: list, frame_threshold: int =
     """
     assert len(recognitions) == len(timestamps), 'recognitions do not fit timestamps'
 
+    extractor = SceneExtractor(frame_threshold)
     scenes = []
-    current_scene = None
-
-    # Preprocess recognitions
-    cleaned_recognitions = []
-    for index, rec in enumerate(recognitions):
-        recognition = []
-        for entity in rec:
-            if entity != 'unknown':
-                recognition.append(entity)
-        if len(recognition) == 0:
-            recognition.append(str(index))
-        cleaned_recognitions.append(recognition)
-
-    # Start scene extraction
-    for frame, entities in enumerate(cleaned_recognitions):
-        if frame - (frame_threshold - 1) < 0:
-            continue
-
-        if current_scene is not None and not np.any(
-                [len(pred) == len(current_scene.names[0]) or np.all(np.sort(pred) == current_scene.names[0])
-                 for pred in cleaned_recognitions[frame - (frame_threshold - 1):frame + 1]]):
-            scenes.append(current_scene.set_end(timestamps[frame - frame_threshold + 1]))
-            current_scene = None
-
-        if current_scene is not None and frame == (len(recognitions) - 1):
-            scenes.append(current_scene.set_end(timestamps[frame]))
-
-        if np.any([((pred) == 0 or len(pred) != len(entities)) for pred in
-                   cleaned_recognitions[frame - (frame_threshold - 1):frame]]):
-            continue
-        print([np.sort(pred) for pred in cleaned_recognitions[frame - (frame_threshold - 1):frame]])
-        print(np.sort(entities))
-
-        if current_scene is None and np.all([np.all(np.sort(pred) == np.sort(entities))
-                                             for pred in cleaned_recognitions[frame - (frame_threshold - 1):frame]]):
-            current_scene = Scene(entities).set_start(timestamps[frame - frame_threshold + 1])
-
+    for recognition, timestamp in zip(recognitions, timestamps):
+        scenes.extend(extractor.update(recognition, timestamp))
+    scenes.extend(extractor.finish())
     return scenes
 
 
+class SceneExtractor(object):
+    """ Extracts scenes out of frame-wise predictions while they are being produced.
+
+    Scenes are returned as soon as they are closed, so they can be written to the knowledge graph while the video is
+    still being processed. The results equal those of extract_scenes.
+    """
+
+    def __init__(self, frame_threshold: int = 3):
+        """
+        Args:
+            frame_threshold (int): Number of similar/not similar consecutive frames to start/end a scene.
+        """
+        self.frame_threshold = frame_threshold
+        self.window = deque(maxlen=frame_threshold)
+        self.frame = -1
+        self.current_scene = None
+        self.started_last = False
+        self.last_timestamp = None
+
+    def update(self, recognition: list, timestamp) -> list:
+        """ Adds the predictions of the next frame.
+
+        Args:
+            recognition (list): The predicted entities of the frame.
+            timestamp (float): The timestamp of the frame.
+
+        Returns:
+            scenes (list): The scenes that were closed by the frame.
+        """
+        self.frame += 1
+        self.last_timestamp = timestamp
+        self.started_last = False
+
+        entities = [entity for entity in recognition if entity != 'unknown']
+        if len(entities) == 0:
+            entities.append(str(self.frame))
+        self.window.append((entities, timestamp))
+
+        if self.frame - (self.frame_threshold - 1) < 0:
+            return []
+
+        scenes = []
+        predictions = [pred for pred, _ in self.window]
+        window_start = self.window[0][1]
+
+        if self.current_scene is not None and not np.any(
+                [len(pred) == len(self.current_scene.names[0]) or np.all(np.sort(pred) == self.current_scene.names[0])
+                 for pred in predictions]):
+            scenes.append(self.current_scene.set_end(window_start))
+            self.current_scene = None
+
+        if np.any([((pred) == 0 or len(pred) != len(entities)) for pred in predictions[:-1]]):
+            return scenes
+
+        if self.current_scene is None and np.all([np.all(np.sort(pred) == np.sort(entities))
+                                                  for pred in predictions[:-1]]):
+            self.current_scene = Scene(entities).set_start(window_start)
+            self.started_last = True
+
+        return scenes
+
+    def finish(self) -> list:
+        """ Closes the scene that is still open at the end of the video.
+
+        Returns:
+            scenes (list): The remaining scene, if any.
+        """
+        if self.current_scene is None or self.started_last:
+            return []
+        scene = self.current_scene.set_end(self.last_timestamp)
+        self.current_scene = None
+        return [scene]
+
+
 class Scene(object):
     """ Class that represents a scene with its occurring entities, a start and an ending timestamp. """
 
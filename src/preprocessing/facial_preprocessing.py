@@ -1,7 +1,5 @@
 import numpy as np
 import cv2
-from tensorflow.keras.preprocessing.image import img_to_array
-import matplotlib.pyplot as plt
 
 
 def face_alignment(img, shape, keypoints, blank=0.3, show=False):
@@ -48,6 +46,8 @@ def face_alignment(img, shape, keypoints, blank=0.3, show=False):
     aligned_face = cv2.warpAffine(img, M, shape, flags=cv2.INTER_CUBIC)
 
     if show:
+        import matplotlib.pyplot as plt
+
         plt.imshow(aligned_face)
         plt.show()
 
@@ -58,3 +58,55 @@ def face_alignment(img, shape, keypoints, blank=0.3, show=False):
     img_pixels = aligned_face / 255
 
     return img_pixels
+
+
+def batch_face_alignment(imgs, img_indices, shape, keypoints, blank=0.3, out=None, crops=None):
+    """ Aligns many faces at once, the same way as face_alignment.
+
+    The affine matrices of all faces are computed together and the faces are warped into one preallocated array.
+    Callers that align many batches pass the same crops and out buffers every time, so no arrays are allocated.
+
+    Args:
+        imgs (list): The original images.
+        img_indices (np.ndarray): Index of the image of every face, shape (N,).
+        shape (tuple): Tuple of two ints that show the target image shape.
+        keypoints (np.ndarray): Keypoints (left_eye, right_eye, nose, mouth_left, mouth_right) per face,
+            shape (N, 5, 2).
+        blank (float): Scaling Parameter.
+        out (np.ndarray): Optional float array of shape (N, shape[1], shape[0], 3) to write the aligned faces to.
+        crops (np.ndarray): Optional uint8 array of shape (N, shape[1], shape[0], 3) the faces are warped into.
+
+    Returns:
+        img_pixels (np.ndarray): Aligned faces scaled to [0, 1], shape (N, shape[1], shape[0], 3).
+    """
+    keypoints = np.asarray(keypoints, dtype=float)
+    count = len(keypoints)
+
+    eye_center = np.floor_divide(keypoints[:, 0] + keypoints[:, 1], 2)
+    mouth_center = np.floor_divide(keypoints[:, 3] + keypoints[:, 4], 2)
+
+    # rotation angle and scale by the distance from eye center to mouth center
+    eye_delta = keypoints[:, 1] - keypoints[:, 0]
+    angle = np.arctan2(eye_delta[:, 1], eye_delta[:, 0])
+    scale = (1 - 2 * blank) * shape[1] / np.linalg.norm(mouth_center - eye_center, axis=1)
+
+    # rotation around the eye center as in cv2.getRotationMatrix2D, then translation
+    alpha = scale * np.cos(angle)
+    beta = scale * np.sin(angle)
+    M = np.empty((count, 2, 3))
+    M[:, 0, 0] = alpha
+    M[:, 0, 1] = beta
+    M[:, 0, 2] = (1 - alpha) * eye_center[:, 0] - beta * eye_center[:, 1] + shape[0] * 0.5 - eye_center[:, 0]
+    M[:, 1, 0] = -beta
+    M[:, 1, 1] = alpha
+    M[:, 1, 2] = beta * eye_center[:, 0] + (1 - alpha) * eye_center[:, 1] + shape[1] * blank - eye_center[:, 1]
+
+    if crops is None:
+        crops = np.empty((count, shape[1], shape[0], 3), dtype=np.uint8)
+    for i in range(count):
+        cv2.warpAffine(imgs[img_indices[i]], M[i], shape, dst=crops[i], flags=cv2.INTER_CUBIC)
+
+    if out is None:
+        out = np.empty(crops.shape, dtype=np.float32)
+    np.divide(crops, 255, out=out)
+    return out
@@ -0,0 +1,202 @@
+import os
+import math
+import time
+import logging
+import tempfile
+import numpy as np
+import cv2
+
+LOGGER = logging.getLogger('frame-sampling')
+
+
+class FrameSampler(object):
+    """ Reads the frames of a video that should be processed by the face recognition
+
+    Sampling by 'second' can either seek to every sampled frame ('seek') or walk the stream sequentially and only
+    grab the frames in between ('grab'). Seeking forces the decoder to jump back to the previous keyframe and decode
+    from there, while grabbing skips the color conversion of unused frames. 'auto' measures both on the video.
+
+    Args:
+        video_path (str): Path to the video.
+        by (str): Sample by 'second' or 'frame'.
+        strategy (str): Options are 'auto', 'grab' and 'seek'.
+        keyframe_interval (int): Maximum number of frames to grab before seeking is used instead.
+        start (int): Index of the first sample to read.
+        end (int): Index of the sample to stop at (exclusive). Reads until the end of the video if None.
+    """
+
+    def __init__(self, video_path: str, by: str = 'second', strategy: str = 'auto', keyframe_interval: int = 250,
+                 start: int = 0, end: int = None):
+        if strategy not in ('auto', 'grab', 'seek'):
+            raise Exception(f'Unknown sampling strategy {strategy}')
+
+        self.video_path = video_path
+        self.by = by
+        self.strategy = strategy
+        self.keyframe_interval = keyframe_interval
+        self.start = start
+        self.end = end
+
+        video = cv2.VideoCapture(video_path)
+        self.fps = video.get(cv2.CAP_PROP_FPS) or 25.0
+        self.frame_count = int(video.get(cv2.CAP_PROP_FRAME_COUNT))
+        video.release()
+
+        if by == 'frame':
+            self.step = 1
+            self.timestep = 1000 / self.fps
+        else:
+            self.step = max(int(self.fps), 1)
+            self.timestep = 1000.0
+
+    @property
+    def sample_count(self) -> int:
+        """ Number of samples in the whole video according to its metadata """
+        return math.ceil(self.frame_count / self.step)
+
+    def __iter__(self):
+        return self.sample()
+
+    def sample(self):
+        """ Iterates over the sampled frames of the video
+
+        Yields:
+            timestamp (float): Milliseconds since the beginning of the video.
+            frame (np.array): The BGR frame as returned by OpenCV.
+        """
+        strategy = self.strategy
+        if strategy == 'auto':
+            strategy = self.choose_strategy()
+        LOGGER.debug(f'Sampling {self.video_path} by {self.by} using {strategy}')
+
+        video = cv2.VideoCapture(self.video_path)
+        position = 0  # index of the next frame the decoder returns
+        index = self.start
+
+        try:
+            while self.end is None or index < self.end:
+                target = index * self.step
+                gap = target - position
+
+                if gap > 0:
+                    if strategy == 'grab' and gap <= self.keyframe_interval:
+                        for _ in range(gap):
+                            if not video.grab():
+                                return
+                    else:
+                        video.set(cv2.CAP_PROP_POS_FRAMES, target)
+
+                success, frame = video.read()
+                if not success:
+                    return
+                position = target + 1
+
+                yield index * self.timestep, frame
+                index += 1
+        finally:
+            video.release()
+
+    def choose_strategy(self, trials: int = 3) -> str:
+        """ Chooses the cheaper strategy by measuring the cost of grabbing and seeking on the video
+
+        Args:
+            trials (int): Number of seeks to measure.
+
+        Returns:
+            strategy (str): 'grab' or 'seek'.
+        """
+        if self.step == 1:
+            return 'grab'
+
+        grab_cost, seek_cost = self.measure_costs(trials)
+        strategy = 'grab' if self.step * grab_cost <= seek_cost else 'seek'
+        LOGGER.info(f'Measured {grab_cost * 1000:.2f}ms per grab and {seek_cost * 1000:.2f}ms per seek, '
+                    f'using {strategy}')
+        return strategy
+
+    def measure_costs(self, trials: int = 3):
+        """ Measures the time to grab one frame and to seek to a frame
+
+        Args:
+            trials (int): Number of seeks to measure.
+
+        Returns:
+            grab_cost (float): Seconds per grabbed frame.
+            seek_cost (float): Seconds per seek, without the read of the target frame.
+        """
+        video = cv2.VideoCapture(self.video_path)
+        try:
+            grabs = max(min(self.step * trials, self.frame_count // 2), 1)
+            start = time.perf_counter()
+            grabbed = 0
+            while grabbed < grabs and video.grab():
+                grabbed += 1
+            grab_cost = (time.perf_counter() - start) / max(grabbed, 1)
+
+            start = time.perf_counter()
+            read = 0
+            for _ in range(trials):
+                if video.read()[0]:
+                    read += 1
+            read_cost = (time.perf_counter() - start) / max(read, 1)
+
+            targets = np.linspace(grabbed + self.step, max(self.frame_count - 1, 1), trials + 1).astype(int)[:trials]
+            start = time.perf_counter()
+            for target in targets:
+                video.set(cv2.CAP_PROP_POS_FRAMES, int(target))
+                video.read()
+            seek_cost = (time.perf_counter() - start) / trials - read_cost
+        finally:
+            video.release()
+
+        return grab_cost, max(seek_cost, 0.0)
+
+
+def create_synthetic_video(path: str, seconds: int = 60, fps: int = 25, width: int = 640, height: int = 360) -> str:
+    """ Writes a video with moving shapes for tests and benchmarks
+
+    Args:
+        path (str): Location of the new video.
+        seconds (int): Length of the video.
+        fps (int): Frames per second.
+        width (int): Width of the frames.
+        height (int): Height of the frames.
+
+    Returns:
+        path (str): Location of the new video.
+    """
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (width, height))
+    rng = np.random.default_rng(42)
+    background = rng.integers(0, 255, (height, width, 3), dtype=np.uint8)
+    for i in range(seconds * fps):
+        frame = background.copy()
+        x = (i * 7) % width
+        cv2.circle(frame, (x, height // 2), height // 6, (255, 255, 255), -1)
+        cv2.putText(frame, str(i), (10, height - 10), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2)
+        writer.write(frame)
+    writer.release()
+    return path
+
+
+def benchmark_sampling(video_path: str = None, by: str = 'second') -> dict:
+    """ Compares the runtime of the grab and seek strategies
+
+    Args:
+        video_path (str): Video to benchmark on. A synthetic video is created if no path is given.
+        by (str): Sample by 'second' or 'frame'.
+
+    Returns:
+        results (dict): Seconds and number of sampled frames per strategy.
+    """
+    with tempfile.TemporaryDirectory() as tmp:
+        if video_path is None:
+            video_path = create_synthetic_video(os.path.join(tmp, 'synthetic.mp4'))
+
+        results = {}
+        for strategy in ['seek', 'grab', 'auto']:
+            sampler = FrameSampler(video_path, by, strategy)
+            start = time.perf_counter()
+            frames = sum(1 for _ in sampler)
+            results[strategy] = {'seconds': time.perf_counter() - start, 'frames': frames}
+            LOGGER.info(f'{strategy}: sampled {frames} frames in {results[strategy]["seconds"]:.3f}s')
+    return results
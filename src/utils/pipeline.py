@@ -0,0 +1,188 @@
+import time
+import queue
+import logging
+import threading
+
+LOGGER = logging.getLogger('pipeline')
+
+_END = object()
+
+
+class _Failure(object):
+    """ Carries an exception of a stage to the consumer of the pipeline """
+
+    def __init__(self, stage: str, error: BaseException):
+        self.stage = stage
+        self.error = error
+
+
+class StageStatistics(object):
+    """ Runtime statistics of a single pipeline stage
+
+    Args:
+        name (str): Name of the stage.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.items = 0
+        self.units = 0
+        self.busy = 0.0
+        self.depth_sum = 0
+        self.depth_max = 0
+
+    def record(self, seconds: float, units: int, depth: int):
+        """ Adds a processed item to the statistics
+
+        Args:
+            seconds (float): Time spent processing the item.
+            units (int): Size of the item, e.g. the number of frames in a batch.
+            depth (int): Number of items that were waiting in the input queue.
+        """
+        self.items += 1
+        self.units += units
+        self.busy += seconds
+        self.depth_sum += depth
+        self.depth_max = max(self.depth_max, depth)
+
+    def as_dict(self) -> dict:
+        """ Returns the statistics as a dictionary
+
+        Returns:
+            statistics (dict): items, units, busy seconds, throughput in units per busy second, mean and max queue depth.
+        """
+        return {'items': self.items,
+                'units': self.units,
+                'busy': self.busy,
+                'throughput': self.units / self.busy if self.busy > 0 else 0.0,
+                'mean_queue_depth': self.depth_sum / self.items if self.items else 0.0,
+                'max_queue_depth': self.depth_max}
+
+
+class Pipeline(object):
+    """ Runs processing stages in separate threads that are connected by bounded queues
+
+    The source is consumed by its own thread, every stage reads the output of the previous stage and the last stage
+    is consumed by the caller. Stages overlap as long as their work releases the GIL (decoding, inference).
+
+    Args:
+        stages (list): Ordered list of (name, function) tuples. Each function maps one item to the next.
+        queue_size (int): Maximum number of items waiting between two stages.
+        item_size (function): Optional function returning the number of units in a source item.
+    """
+
+    def __init__(self, stages: list, queue_size: int = 2, item_size=None):
+        self.stages = stages
+        self.queue_size = queue_size
+        self.item_size = item_size if item_size is not None else (lambda item: 1)
+        self.statistics = {}
+        self._stop = threading.Event()
+
+    def run(self, source):
+        """ Processes every item of the source through all stages
+
+        Args:
+            source (iterable): Produces the input items. It is iterated in a separate thread.
+
+        Yields:
+            item: The outputs of the last stage in the order of the source.
+        """
+        self._stop.clear()
+        self.statistics = {'source': StageStatistics('source')}
+        self.statistics.update({name: StageStatistics(name) for name, _ in self.stages})
+
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in range(len(self.stages) + 1)]
+        threads = [threading.Thread(target=self._produce, args=(source, queues[0]), daemon=True)]
+        for (name, function), in_queue, out_queue in zip(self.stages, queues[:-1], queues[1:]):
+            threads.append(threading.Thread(target=self._work, args=(name, function, in_queue, out_queue), daemon=True))
+
+        for thread in threads:
+            thread.start()
+
+        try:
+            while True:
+                item = queues[-1].get()
+                if item is _END:
+                    break
+                if isinstance(item, _Failure):
+                    raise item.error
+                yield item[1]
+        finally:
+            self._stop.set()
+            for thread in threads:
+                thread.join()
+            self.log_statistics()
+
+    def _put(self, out_queue: queue.Queue, item) -> bool:
+        """ Blocks until the item is queued or the pipeline is stopped """
+        while not self._stop.is_set():
+            try:
+                out_queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, in_queue: queue.Queue):
+        """ Blocks until an item is available or the pipeline is stopped """
+        while not self._stop.is_set():
+            try:
+                return in_queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _END
+
+    def _produce(self, source, out_queue: queue.Queue):
+        statistics = self.statistics['source']
+        try:
+            iterator = iter(source)
+            while True:
+                start = time.perf_counter()
+                item = next(iterator, _END)
+                if item is _END:
+                    break
+                statistics.record(time.perf_counter() - start, self.item_size(item), 0)
+                if not self._put(out_queue, (self.item_size(item), item)):
+                    return
+        except BaseException as e:
+            self._put(out_queue, _Failure('source', e))
+            return
+        self._put(out_queue, _END)
+
+    def _work(self, name: str, function, in_queue: queue.Queue, out_queue: queue.Queue):
+        statistics = self.statistics[name]
+        while True:
+            depth = in_queue.qsize()
+            item = self._get(in_queue)
+            if item is _END or isinstance(item, _Failure):
+                self._put(out_queue, item)
+                return
+            units, item = item
+            start = time.perf_counter()
+            try:
+                result = function(item)
+            except BaseException as e:
+                self._put(out_queue, _Failure(name, e))
+                return
+            statistics.record(time.perf_counter() - start, units, depth)
+            if not self._put(out_queue, (units, result)):
+                return
+
+    def get_statistics(self) -> dict:
+        """ Returns the statistics of the last run
+
+        Returns:
+            statistics (dict): Statistics per stage, including the source.
+        """
+        return {name: statistics.as_dict() for name, statistics in self.statistics.items()}
+
+    def log_statistics(self):
+        """ Logs the throughput and queue depth of each stage and names the bottleneck """
+        statistics = self.get_statistics()
+        for name, values in statistics.items():
+            LOGGER.info(f'{name}: {values["units"]} units in {values["busy"]:.2f}s '
+                        f'({values["throughput"]:.2f}/s), queue depth mean {values["mean_queue_depth"]:.2f} '
+                        f'max {values["max_queue_depth"]}')
+        busy = {name: values['busy'] for name, values in statistics.items() if values['items']}
+        if busy:
+            LOGGER.info(f'Bottleneck stage: {max(busy, key=busy.get)}')
@@ -1,15 +1,19 @@
 import logging
 import os
+import sys
+import time
+import shlex
+import subprocess
 from typing import Tuple
 import yaml
 import re
-from google.api_core.exceptions import GoogleAPICallError
-from google.cloud import storage
-from google.cloud.exceptions import NotFound
-from google.cloud.storage import Client
-from mtcnn import MTCNN
+import numpy as np
 import cv2
 import glob
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
 
 LOGGER = logging.getLogger('utils')
 
@@ -39,7 +43,7 @@ def get_config(path: str = '/root/FACE-HUNTER/src/utils/config.yaml'):
     return config
 
 
-def face_number(img, detector=MTCNN()):
+def face_number(img, detector=None):
     """ Computes the number of faces in an image.
 
         if you have to detect many images, you can create a detector then pass to this function:
@@ -49,10 +53,15 @@ def face_number(img, detector=MTCNN()):
 
     Args:
         img (img object or img path): The image or path to it.
+        detector (MTCNN): The detector of the mtcnn package. A new one is created if None.
 
     Returns:
         count (int): Number of faces in the image.
     """
+    if detector is None:
+        from mtcnn import MTCNN
+
+        detector = MTCNN()
     if isinstance(img, str):
         img = cv2.cvtColor(cv2.imread(img), cv2.COLOR_BGR2RGB)
 
@@ -60,6 +69,77 @@ def face_number(img, detector=MTCNN()):
     return len(faces)
 
 
+def get_peak_rss():
+    """ Returns the peak resident set size of the current process
+
+    Returns:
+        peak_rss (int): Peak memory usage in bytes or None if it can not be determined.
+    """
+    if resource is None:
+        return None
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak_rss if sys.platform == 'darwin' else peak_rss * 1024  # kilobytes on linux
+
+
+HEAVY_IMPORTS = ['tensorflow', 'torch', 'deepface', 'facenet_pytorch', 'mtcnn', 'google.cloud', 'nmslib', 'faiss',
+                 'matplotlib']
+
+
+def parse_importtime(output: str) -> list:
+    """ Parses the output of python -X importtime
+
+    Args:
+        output (str): The standard error of the process.
+
+    Returns:
+        imports (list): Tuples of the module, its nesting depth and its cumulative import time in seconds.
+    """
+    imports = []
+    for line in output.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        if not cumulative.strip().isdigit():  # header
+            continue
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        imports.append((name.strip(), depth, int(cumulative) / 1e6))
+    return imports
+
+
+def benchmark_startup(command: str = None, runs: int = 3, top: int = 10) -> dict:
+    """ Measures the startup of a command of the CLI with python -X importtime
+
+    Args:
+        command (str): The arguments of python, e.g. 'cli.py search --help'.
+        runs (int): Number of times the command is started.
+        top (int): Number of top-level imports with the highest cumulative import time that are reported.
+
+    Returns:
+        results (dict): The median wall time and import time in seconds, the slowest top-level imports and the
+            heavy libraries that were imported.
+    """
+    arguments = shlex.split(command) if command is not None else ['cli.py', 'search', '--help']
+    wall_seconds = []
+    import_seconds = []
+    imports = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = subprocess.run([sys.executable, '-X', 'importtime'] + arguments, capture_output=True, text=True)
+        wall_seconds.append(time.perf_counter() - start)
+        imports = parse_importtime(result.stderr)
+        import_seconds.append(sum(seconds for _, depth, seconds in imports if depth == 0))
+
+    modules = {name for name, _, _ in imports}
+    results = {'wall_seconds': float(np.median(wall_seconds)),
+               'import_seconds': float(np.median(import_seconds)),
+               'slowest_imports': sorted(((name, seconds) for name, depth, seconds in imports if depth == 0),
+                                         key=lambda item: -item[1])[:top],
+               'heavy_imports': [name for name in HEAVY_IMPORTS if name in modules]}
+    LOGGER.info(f'Starting {" ".join(arguments)} took {results["wall_seconds"]:.2f}s, '
+                f'{results["import_seconds"]:.2f}s of them importing')
+    return results
+
+
 def image_files_in_folder(folder):
     """ Searches for images in a folder
 
@@ -101,7 +181,11 @@ def upload_file(input_file: str, cloud_config: str, cloud_bucket: str, name: str
     if cloud_config is None or cloud_bucket is None:
         return input_file, input_file
 
-    client: Client = storage.Client.from_service_account_json(cloud_config)
+    from google.api_core.exceptions import GoogleAPICallError
+    from google.cloud import storage
+    from google.cloud.exceptions import NotFound
+
+    client = storage.Client.from_service_account_json(cloud_config)
 
     try:
         client.get_bucket(cloud_bucket)
@@ -141,8 +225,11 @@ def download_file(path: str, cloud_config: str = None, cloud_bucket: str = None,
             raise FileNotFoundError(f'{path} does not exist')
         else:
             LOGGER.info(f'Downloading {name} to {path}')
+            from google.api_core.exceptions import GoogleAPICallError
+            from google.cloud import storage
+
             try:
-                client: Client = storage.Client.from_service_account_json(cloud_config)
+                client = storage.Client.from_service_account_json(cloud_config)
                 bucket = client.get_bucket(cloud_bucket)
                 blob = bucket.get_blob(name)
                 if blob is None:
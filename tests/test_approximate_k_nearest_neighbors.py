@@ -0,0 +1,105 @@
+import os
+import tempfile
+import threading
+import unittest
+import importlib.util
+import numpy as np
+from tests import base_test
+from src.models.approximate_k_nearest_neighbors import ApproximateKNearestNeighbors
+
+
+class TestApproximateKNearestNeighbors(base_test.BaseComponentTest):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        rng = np.random.default_rng(0)
+        self.centers = rng.normal(size=(5, 16)).astype(np.float32)
+        self.embeddings = np.repeat(self.centers, 4, axis=0) + rng.normal(0, 0.1, (20, 16)).astype(np.float32)
+        self.labels = [f'entity {i}' for i in range(5) for _ in range(4)]
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _model(self, k):
+        return ApproximateKNearestNeighbors(distance_threshold=0.3, index_path=os.path.join(self.tmp.name, f'{k}.bin'),
+                                            k=k).fit(self.embeddings, self.labels)
+
+    def test_predict_batch_votes(self):
+        model = self._model(k=3)
+        queries = np.concatenate([self.centers, -self.centers])
+
+        entities = model.predict_batch(queries)
+
+        assert entities == [f'entity {i}' for i in range(5)] + ['unknown'] * 5
+        assert [model.predict(query) for query in queries] == entities
+
+    def test_majority_and_ties(self):
+        class _Index(object):
+            def query_batch(self, embeddings, k):
+                return (np.array([[0, 4, 5],  # 0 against 1, 1
+                                  [4, 0, 8],  # tie of 1 and 0, 2 too far
+                                  [8, -1, -1]]),  # fewer neighbors than k
+                        np.array([[0.1, 0.2, 0.2], [0.1, 0.2, 0.9], [0.5, np.inf, np.inf]]))
+
+        model = ApproximateKNearestNeighbors(distance_threshold=0.3, k=3)
+        model.recognizer, model.labels, model.fitted = _Index(), self.labels, True
+
+        assert model.predict_batch(np.zeros((3, 16))) == ['entity 1', 'entity 1', 'unknown']
+
+    def test_rebuild_on_changed_gallery(self):
+        self._model(k=1)
+        labels = self.labels[::-1]
+
+        # same files, different labels: the saved index must not be used with the new labels
+        model = ApproximateKNearestNeighbors(distance_threshold=0.3, index_path=os.path.join(self.tmp.name, '1.bin'),
+                                            k=1).fit(self.embeddings[::-1], labels)
+
+        assert model.predict_batch(self.centers) == [f'entity {i}' for i in range(5)]
+        assert model.read_fingerprint() == model.get_fingerprint(np.ascontiguousarray(self.embeddings[::-1]), labels)
+
+    def test_background_build(self):
+        model = ApproximateKNearestNeighbors(distance_threshold=0.3, index_path=os.path.join(self.tmp.name, 'bg.bin'),
+                                            k=3, background_build=True).fit(self.embeddings, self.labels)
+
+        # answered by the brute force search or the new index
+        assert model.predict_batch(self.centers) == [f'entity {i}' for i in range(5)]
+        model.wait()
+        assert os.path.exists(model.index_path) and model.read_fingerprint() is not None
+        assert model.predict_batch(self.centers) == [f'entity {i}' for i in range(5)]
+
+    def test_concurrent_builds(self):
+        index_path = os.path.join(self.tmp.name, 'shared.bin')
+        models = [ApproximateKNearestNeighbors(distance_threshold=0.3, index_path=index_path, k=3, backend='int8')
+                  for _ in range(4)]
+        threads = [threading.Thread(target=model.fit, args=(self.embeddings, self.labels)) for model in models]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # every build wrote its own temporary files and replaced the index with a complete one
+        assert sorted(os.listdir(self.tmp.name)) == ['shared.bin', 'shared.bin.json']
+        assert all(model.fitted for model in models)
+        model = ApproximateKNearestNeighbors(distance_threshold=0.3, index_path=index_path, k=3, backend='int8')
+        assert model.fit(self.embeddings, self.labels).predict_batch(self.centers) == [f'entity {i}' for i in range(5)]
+
+    def _check_backend(self, backend):
+        model = ApproximateKNearestNeighbors(distance_threshold=0.3, k=3, backend=backend,
+                                            index_path=os.path.join(self.tmp.name, f'{backend}.bin'))
+        assert model.fit(self.embeddings, self.labels).predict_batch(self.centers) == \
+            [f'entity {i}' for i in range(5)]
+
+    def test_backends(self):
+        for backend in ['exact', 'int8']:
+            self._check_backend(backend)
+
+    @unittest.skipIf(importlib.util.find_spec('hnswlib') is None, 'requires hnswlib')
+    def test_hnswlib_backend(self):
+        self._check_backend('hnswlib')
+
+    @unittest.skipIf(importlib.util.find_spec('faiss') is None, 'requires faiss')
+    def test_faiss_backend(self):
+        self._check_backend('faiss')
+
+    def test_predict_batch_empty(self):
+        assert self._model(k=1).predict_batch([]) == []
@@ -0,0 +1,55 @@
+import os
+import tempfile
+from tests import base_test
+from src.models.checkpoint import RecognitionCheckpoint
+
+RESULTS = [(0.0, ['Ali'], [[1, 2, 3, 4]]), (1000.0, [], []), (2000.0, ['Bo'], [[5, 6, 7, 8]])]
+
+
+class TestCheckpoint(base_test.BaseComponentTest):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.video_path = os.path.join(self.tmp.name, 'video.mp4')
+        with open(self.video_path, 'wb') as f:
+            f.write(b'video')
+        self.directory = os.path.join(self.tmp.name, 'checkpoints')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_resume(self):
+        checkpoint = RecognitionCheckpoint(self.directory, self.video_path, {'by': 'second'})
+        checkpoint.append(2, RESULTS[:2])
+        checkpoint.append(3, RESULTS[2:])
+
+        start, results = RecognitionCheckpoint(self.directory, self.video_path, {'by': 'second'}).load()
+
+        assert start == 3
+        assert results == RESULTS
+
+    def test_partial_record_is_ignored(self):
+        checkpoint = RecognitionCheckpoint(self.directory, self.video_path, {'by': 'second'})
+        checkpoint.append(2, RESULTS[:2])
+        checkpoint.append(3, RESULTS[2:])
+        with open(checkpoint.path, 'r+b') as f:
+            f.truncate(os.path.getsize(checkpoint.path) - 5)
+
+        start, results = checkpoint.load()
+        checkpoint.append(3, RESULTS[2:])
+
+        assert start == 2
+        assert results == RESULTS[:2]
+        assert checkpoint.load() == (3, RESULTS)
+
+    def test_configuration_changes_checkpoint(self):
+        RecognitionCheckpoint(self.directory, self.video_path, {'by': 'second'}).append(2, RESULTS[:2])
+
+        assert RecognitionCheckpoint(self.directory, self.video_path, {'by': 'frame'}).load(0) == (0, [])
+
+    def test_remove(self):
+        checkpoint = RecognitionCheckpoint(self.directory, self.video_path, {})
+        checkpoint.append(1, RESULTS[:1])
+        checkpoint.remove()
+
+        assert checkpoint.load(5) == (5, [])
@@ -0,0 +1,95 @@
+import os
+import tempfile
+import threading
+import numpy as np
+from tests import base_test
+from src.models.embedding_cache import EmbeddingCache, perceptual_hash
+
+
+class _Encoder(object):
+    """ Encodes a face by its mean color and counts the encoded faces """
+
+    def __init__(self):
+        self.faces = 0
+
+    def predict(self, faces):
+        self.faces += len(faces)
+        return faces.reshape(len(faces), -1, 3).mean(axis=1).astype(np.float32)
+
+
+def _faces(count, seed=0):
+    return np.random.default_rng(seed).integers(0, 256, (count, 32, 32, 3), dtype=np.uint8)
+
+
+class TestEmbeddingCache(base_test.BaseComponentTest):
+
+    def test_hash_ignores_small_changes(self):
+        face = _faces(1)[0]
+        brighter = np.clip(face.astype(int) + 3, 0, 255).astype(np.uint8)
+
+        assert perceptual_hash(face) == perceptual_hash(brighter)
+        assert perceptual_hash(face) != perceptual_hash(_faces(1, seed=1)[0])
+
+    def test_predict_encodes_misses_only(self):
+        encoder = _Encoder()
+        cache = EmbeddingCache(max_size=10)
+        faces = _faces(4)
+
+        first = cache.predict(encoder, faces)
+        second = cache.predict(encoder, faces[::-1])
+
+        assert encoder.faces == 4
+        assert all(np.array_equal(a, b) for a, b in zip(first, second[::-1]))
+        assert cache.get_statistics()['hits'] == 4
+        assert cache.get_statistics()['misses'] == 4
+
+    def test_lru_eviction_and_persistent_tier(self):
+        faces = _faces(3)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'cache.sqlite')
+            cache = EmbeddingCache(max_size=2, path=path)
+            cache.predict(_Encoder(), faces)
+            assert cache.get_statistics()['size'] == 2
+            cache.close()
+
+            encoder = _Encoder()
+            reopened = EmbeddingCache(max_size=2, path=path)
+            reopened.predict(encoder, faces)
+            reopened.close()
+
+            assert encoder.faces == 0
+
+    def test_one_transaction_per_batch(self):
+        with tempfile.TemporaryDirectory() as directory:
+            cache = EmbeddingCache(path=os.path.join(directory, 'cache.sqlite'))
+            statements = []
+            cache.connection.set_trace_callback(statements.append)
+            cache.predict(_Encoder(), _faces(8))
+            cache.close()
+
+            assert sum(statement.startswith('COMMIT') for statement in statements) == 1
+
+    def test_shared_persistent_tier(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'cache.sqlite')
+            # every cache has its own connection, like the caches of several worker processes
+            caches = [EmbeddingCache(path=path) for _ in range(4)]
+
+            def encode(cache, seed):
+                for i in range(20):
+                    cache.predict(_Encoder(), _faces(4, seed * 100 + i))
+
+            threads = [threading.Thread(target=encode, args=(cache, seed)) for seed, cache in enumerate(caches)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            for cache in caches:
+                cache.close()
+
+            encoder = _Encoder()
+            reopened = EmbeddingCache(max_size=1, path=path)
+            for seed in range(4):
+                reopened.predict(encoder, _faces(4, seed * 100 + 19))
+            reopened.close()
+            assert encoder.faces == 0
@@ -0,0 +1,53 @@
+import os
+import pickle
+import tempfile
+import numpy as np
+from tests import base_test
+from src.models.embedding_store import EmbeddingStore
+
+LABELS = ['Ada Lovelace', 'Alan Turing', 'Ada Lovelace']
+
+
+class TestEmbeddingStore(base_test.BaseComponentTest):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.embeddings = [np.random.default_rng(i).normal(size=8) for i in range(3)]
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_save_and_load(self):
+        store = EmbeddingStore(os.path.join(self.tmp.name, 'embeddings'))
+        store.save(LABELS, self.embeddings)
+
+        labels, embeddings = EmbeddingStore(store.path).load()
+
+        assert labels == LABELS
+        assert isinstance(embeddings, np.memmap)
+        assert embeddings.dtype == np.float32 and embeddings.shape == (3, 8)
+        assert np.allclose(embeddings, self.embeddings, atol=1e-6)
+        assert np.load(store.label_ids_path).dtype == np.int32
+
+    def test_migrate_pickles(self):
+        labels_path = os.path.join(self.tmp.name, 'labels.pickle')
+        embeddings_path = os.path.join(self.tmp.name, 'embeddings.pickle')
+        with open(labels_path, 'wb') as f:
+            pickle.dump(LABELS, f)
+        with open(embeddings_path, 'wb') as f:
+            pickle.dump(self.embeddings, f)
+
+        store = EmbeddingStore(os.path.join(self.tmp.name, 'embeddings'))
+        assert not store.exists()
+        store.migrate(labels_path, embeddings_path)
+
+        assert store.exists()
+        assert store.load()[0] == LABELS
+
+    def test_empty_store(self):
+        store = EmbeddingStore(os.path.join(self.tmp.name, 'embeddings'))
+        store.save([], [])
+
+        labels, embeddings = store.load()
+
+        assert labels == [] and len(embeddings) == 0
@@ -0,0 +1,63 @@
+import numpy as np
+from tests import base_test
+from src.models.face_prefilter import FacePrefilter
+from src.models.face_recognition import FaceRecognition
+from src.models.evaluation import evaluate_prefilter
+
+
+class _Prefilter(object):
+    """ Passes the frames whose first pixel is bright """
+    method = 'fake'
+
+    def is_candidate(self, imgs):
+        return np.array([img[0, 0, 0] > 0 for img in imgs], dtype=bool)
+
+
+class _Detector(object):
+    """ Finds a face on frames whose center pixel is bright """
+
+    def detect(self, imgs, landmarks=True):
+        faces = [img[img.shape[0] // 2, img.shape[1] // 2, 0] > 0 for img in imgs]
+        boxes = [np.array([[0, 0, 10, 10]]) if face else None for face in faces]
+        confidence = [np.array([0.99]) if face else [None] for face in faces]
+        keypoints = [np.zeros((1, 5, 2)) if face else None for face in faces]
+        return boxes, confidence, keypoints
+
+
+def _frame(corner: bool, center: bool):
+    frame = np.zeros((64, 64, 3), dtype=np.uint8)
+    frame[0, 0] = 255 * corner
+    frame[32, 32] = 255 * center
+    return frame
+
+
+class TestFacePrefilter(base_test.BaseComponentTest):
+
+    def test_haar(self):
+        prefilter = FacePrefilter('haar', width=160)
+        frames = [np.zeros((360, 640, 3), dtype=np.uint8),
+                  np.full((360, 640, 3), 128, dtype=np.uint8)]
+
+        assert not prefilter.is_candidate(frames).any()
+        assert prefilter.get_statistics() == {'frames': 2, 'rejected': 2, 'rejection_rate': 1.0}
+
+    def test_cascade_detect(self):
+        face_recognition = FaceRecognition.__new__(FaceRecognition)
+        face_recognition.detection_width = None
+        face_recognition.detector = _Detector()
+        face_recognition.prefilter = _Prefilter()
+        frames = [_frame(True, True), _frame(False, True), _frame(True, False)]
+
+        faces = face_recognition.batch_detect(frames)
+        assert [len(frame_faces) for frame_faces in faces] == [1, 0, 0]
+        faces = face_recognition.batch_detect(frames, prefilter=False)
+        assert [len(frame_faces) for frame_faces in faces] == [1, 1, 0]
+
+    def test_evaluate_prefilter(self):
+        frames = [_frame(True, True), _frame(False, True), _frame(True, False), _frame(False, False)]
+
+        report = evaluate_prefilter(frames, _Prefilter(), _Detector(), batch_size=3)
+
+        assert report['frames'] == 4 and report['face_frames'] == 2
+        assert report['rejected'] == 2 and report['missed_face_frames'] == 1
+        assert report['rejection_rate'] == 0.5 and report['face_frame_recall'] == 0.5
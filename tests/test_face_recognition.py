@@ -0,0 +1,154 @@
+import os
+import pickle
+import tempfile
+import numpy as np
+from tests import base_test
+from src.models import sharding
+from src.models.approximate_k_nearest_neighbors import ApproximateKNearestNeighbors
+from src.models.face_recognition import FaceRecognition
+from src.preprocessing.frame_sampling import create_synthetic_video
+
+
+class _Detector(object):
+    """ Finds the white circle of the synthetic video as the only face """
+
+    def detect(self, imgs, landmarks=True):
+        boxes, confidence, keypoints = [], [], []
+        for img in imgs:
+            mask = img.min(axis=2) > 230
+            columns = np.flatnonzero(mask.sum(axis=0) > mask.shape[0] // 20)
+            rows = np.flatnonzero(mask.sum(axis=1) > mask.shape[1] // 20)
+            if len(columns) == 0 or len(rows) == 0:
+                boxes.append(None)
+                confidence.append([None])
+                keypoints.append(None)
+                continue
+            x1, y1, x2, y2 = columns[0], rows[0], columns[-1] + 1, rows[-1] + 1
+            w, h = x2 - x1, y2 - y1
+            boxes.append(np.array([[x1, y1, x2, y2]], dtype=float))
+            confidence.append(np.array([0.99]))
+            keypoints.append(np.array([[[x1 + 0.3 * w, y1 + 0.4 * h], [x1 + 0.7 * w, y1 + 0.4 * h],
+                                        [x1 + 0.5 * w, y1 + 0.6 * h], [x1 + 0.35 * w, y1 + 0.8 * h],
+                                        [x1 + 0.65 * w, y1 + 0.8 * h]]]))
+        return boxes, confidence, keypoints
+
+
+class _Encoder(object):
+    """ Uses a sample of the pixels of the aligned faces as embedding """
+
+    def __init__(self):
+        self.batch_sizes = []
+
+    def predict(self, faces, verbose=0):
+        self.batch_sizes.append(len(faces))
+        return np.asarray(faces).reshape(len(faces), -1)[:, ::48].astype(np.float32) + 0.01
+
+
+def _create_face_recognition(**params) -> FaceRecognition:
+    """ Creates a FaceRecognition with the stub detector and encoder and a random gallery """
+    rng = np.random.default_rng(0)
+    face_recognition = FaceRecognition.__new__(FaceRecognition)
+    face_recognition.__dict__.update({
+        'thumbnail_list': None, 'thumbnails_path': None, 'img_width': 320, 'encoder_name': 'Stub',
+        'labels_path': None, 'embeddings_path': None, 'batch_pixels': 18000000, 'face_batch_size': 64,
+        'detection_width': None, 'track_interval': 0, 'cache_size': 0, 'cache_path': None,
+        'duplicate_threshold': 0, 'match_chunk_size': 100000, 'prototypes': 0, 'prototype_distance': 0.1,
+        'encoder_backend': 'tensorflow', 'prefilter_method': None, 'prefilter_width': 160, 'prefilter': None,
+        'detector': _Detector(), 'encoder': _Encoder(), 'target': (32, 32), 'cache': None,
+        'labels': [f'entity {i}' for i in range(10)], 'embeddings': rng.random((10, 64), dtype=np.float32),
+        '_normalized_gallery': None, '_compact_gallery': None, 'pipeline_statistics': {}, 'tracking_statistics': {},
+        'skip_statistics': {'samples': 0, 'skipped': 0}, 'peak_rss': None})
+    face_recognition.__dict__.update(params)
+    return face_recognition
+
+
+class TestFaceRecognition(base_test.BaseComponentTest):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.TemporaryDirectory()
+        cls.video_path = create_synthetic_video(os.path.join(cls.directory.name, 'video.mp4'), seconds=2, fps=25)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.directory.cleanup()
+
+    def test_pixel_budget(self):
+        frame_pixels = 320 * 180
+        face_recognition = _create_face_recognition(batch_pixels=3 * frame_pixels)
+
+        batches = list(face_recognition.batch_frames(self.video_path, 'frame', sampling='grab'))
+
+        assert [len(frames) for _, frames in batches] == [3] * 16 + [2]
+
+    def test_pixel_budget_ignores_skipped_samples(self):
+        frame_pixels = 320 * 180
+        face_recognition = _create_face_recognition(batch_pixels=3 * frame_pixels, duplicate_threshold=255)
+
+        batches = list(face_recognition.batch_frames(self.video_path, 'frame', sampling='grab'))
+
+        # every sample repeats the first one, so the only frame never fills a batch
+        assert len(batches) == 1 and len(batches[0][1]) == 1 and len(batches[0][0][0]) == 50
+
+    def test_face_budget(self):
+        face_recognition = _create_face_recognition(face_batch_size=2)
+        frames = [frame for _, frames in face_recognition.batch_frames(self.video_path, 'frame', sampling='grab')
+                  for frame in frames][10:16]
+
+        embeddings = face_recognition.batch_encode(frames, face_recognition.batch_detect(frames))
+
+        assert face_recognition.encoder.batch_sizes == [2, 2, 2]
+        assert [len(frame_embeddings) for frame_embeddings in embeddings] == [1] * 6
+
+    def test_detection_width(self):
+        face_recognition = _create_face_recognition(detection_width=160)
+        frames = next(face_recognition.batch_frames(self.video_path, 'frame', sampling='grab'))[1][10:12]
+
+        boxes, _, keypoints = face_recognition.detect(frames)
+        full_boxes, _, full_keypoints = _Detector().detect(np.stack(frames))
+
+        # the frames keep their resolution, the proxy is 4 times smaller
+        assert frames[0].shape == (360, 640, 3)
+        for box, keypoint, full_box, full_keypoint in zip(boxes, keypoints, full_boxes, full_keypoints):
+            np.testing.assert_allclose(box, full_box, atol=8)
+            np.testing.assert_allclose(keypoint, full_keypoint, atol=8)
+
+    def test_sharded_recognitions(self):
+        face_recognition = _create_face_recognition()
+        kwargs = {'by': 'frame', 'sampling': 'grab'}
+        serial = list(face_recognition.iter_recognitions(self.video_path, **kwargs))
+
+        # the shards run in this process, as they would in the initialized workers
+        sharding._WORKER.update({'face_recognition': face_recognition, 'recognizer_model': None})
+        try:
+            shards = [sharding.recognize_shard((self.video_path, first, start, end, kwargs))
+                      for first, start, end in sharding.split_samples(len(serial), 3, overlap=2)]
+        finally:
+            sharding._WORKER.clear()
+        sharded = [recognition for _, *recognition in sharding.merge_shards(shards)]
+
+        assert len(sharded) == len(serial) == 50
+        for (timestamp, entities, boxes), (serial_timestamp, serial_entities, serial_boxes) in zip(sharded, serial):
+            assert timestamp == serial_timestamp and entities == serial_entities
+            np.testing.assert_array_equal(boxes, serial_boxes)
+
+    def test_sharding_refuses_stateful_options(self):
+        for params in [{'track_interval': 5}, {'duplicate_threshold': 2.0}]:
+            face_recognition = _create_face_recognition(**params)
+            with self.assertRaisesRegex(Exception, 'Sharding'):
+                next(face_recognition.iter_recognitions(self.video_path, by='frame', processes=2))
+
+    def test_workers_load_the_index_of_the_parent(self):
+        face_recognition = _create_face_recognition()
+        index_path = os.path.join(self.directory.name, 'index.bin')
+        recognizer_model = ApproximateKNearestNeighbors(distance_threshold=2.0, index_path=index_path, k=1,
+                                                        backend='int8')
+        face_recognition.fit_recognizer(recognizer_model)
+        built = os.stat(index_path).st_mtime_ns
+
+        # a spawned worker receives the pickled model and fits it again
+        worker_model = pickle.loads(pickle.dumps(recognizer_model))
+        face_recognition.fit_recognizer(worker_model)
+
+        assert os.stat(index_path).st_mtime_ns == built
+        assert worker_model.predict_batch(face_recognition.embeddings) == face_recognition.labels
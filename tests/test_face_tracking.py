@@ -0,0 +1,47 @@
+from tests import base_test
+from src.models.face_tracking import FaceTracker, box_iou
+
+
+def _face(x, y, size=100, confidence=0.99):
+    """ Creates a detected face with the keypoints placed relative to the box """
+    return {'box': [x, y, size, size],
+            'confidence': confidence,
+            'keypoints': {'left_eye': (x + 30, y + 40),
+                          'right_eye': (x + 70, y + 40),
+                          'nose': (x + 50, y + 60),
+                          'mouth_left': (x + 35, y + 80),
+                          'mouth_right': (x + 65, y + 80)}}
+
+
+class TestFaceTracking(base_test.BaseComponentTest):
+
+    def test_box_iou(self):
+        assert box_iou([0, 0, 10, 10], [0, 0, 10, 10]) == 1.0
+        assert box_iou([0, 0, 10, 10], [5, 0, 10, 10]) == 50 / 150
+        assert box_iou([0, 0, 10, 10], [20, 20, 10, 10]) == 0.0
+
+    def test_reembed_interval(self):
+        tracker = FaceTracker(reembed_interval=3)
+
+        embeds = [tracker.update([_face(2 * i, 0)])[0][1] for i in range(7)]
+
+        assert embeds == [True, False, False, True, False, False, True]
+        assert tracker.get_statistics() == {'faces': 7, 'embedded': 3, 'saved': 4}
+
+    def test_tracks_keep_identity(self):
+        tracker = FaceTracker()
+
+        first = tracker.update([_face(0, 0), _face(300, 0)])
+        second = tracker.update([_face(305, 0), _face(5, 0)])
+
+        assert second[0][0] is first[1][0]
+        assert second[1][0] is first[0][0]
+        assert [embed for _, embed in second] == [False, False]
+
+    def test_new_face_and_quality(self):
+        tracker = FaceTracker()
+        tracker.update([_face(0, 0, confidence=0.5)])
+
+        # a jump starts a new track, a better face of the same track is embedded again
+        assert tracker.update([_face(400, 0)])[0][1]
+        assert tracker.update([_face(400, 0, size=98, confidence=0.5), _face(0, 0, confidence=0.9)])[1][1]
@@ -0,0 +1,35 @@
+import numpy as np
+from tests import base_test
+from src.preprocessing.facial_preprocessing import face_alignment, batch_face_alignment
+
+KEYPOINTS = ['left_eye', 'right_eye', 'nose', 'mouth_left', 'mouth_right']
+
+
+class TestFacialPreprocessing(base_test.BaseComponentTest):
+
+    def test_batch_alignment_equals_single_alignment(self):
+        rng = np.random.default_rng(0)
+        imgs = [rng.integers(0, 256, (240, 320, 3), dtype=np.uint8) for _ in range(3)]
+        img_indices = rng.integers(0, 3, 10)
+        offsets = np.array([[-20, -10], [20, -8], [0, 10], [-15, 30], [15, 32]])
+        keypoints = rng.uniform(60, 180, (10, 1, 2)) + offsets + rng.normal(0, 2, (10, 5, 2))
+
+        aligned = batch_face_alignment(imgs, img_indices, (112, 96), keypoints)
+
+        assert aligned.shape == (10, 96, 112, 3)
+        for face, index, face_keypoints in zip(aligned, img_indices, keypoints):
+            expected = face_alignment(imgs[index], (112, 96), dict(zip(KEYPOINTS, map(tuple, face_keypoints))))
+            assert np.allclose(face, expected, atol=1e-6)
+
+    def test_batch_alignment_reuses_buffers(self):
+        rng = np.random.default_rng(0)
+        imgs = [rng.integers(0, 256, (240, 320, 3), dtype=np.uint8)]
+        keypoints = np.array([[[140, 110], [180, 112], [160, 130], [145, 150], [175, 152]]] * 4, dtype=float)
+        out = np.empty((4, 96, 112, 3), dtype=np.float32)
+        crops = np.empty((4, 96, 112, 3), dtype=np.uint8)
+
+        aligned = batch_face_alignment(imgs, np.zeros(4, dtype=int), (112, 96), keypoints, out=out, crops=crops)
+
+        assert aligned is out
+        assert np.array_equal(out, crops / np.float32(255))
+        assert np.allclose(out, batch_face_alignment(imgs, np.zeros(4, dtype=int), (112, 96), keypoints))
@@ -0,0 +1,47 @@
+import os
+import tempfile
+import numpy as np
+from tests import base_test
+from src.preprocessing.frame_sampling import FrameSampler, create_synthetic_video
+
+
+class TestFrameSampling(base_test.BaseComponentTest):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.video_path = create_synthetic_video(os.path.join(self.tmp.name, 'video.mp4'), seconds=4, fps=10,
+                                                 width=64, height=48)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_strategies_sample_identical_frames(self):
+        seek = list(FrameSampler(self.video_path, 'second', 'seek'))
+        grab = list(FrameSampler(self.video_path, 'second', 'grab'))
+
+        assert [t for t, _ in seek] == [0.0, 1000.0, 2000.0, 3000.0]
+        assert [t for t, _ in seek] == [t for t, _ in grab]
+        assert all(np.array_equal(a, b) for (_, a), (_, b) in zip(seek, grab))
+
+    def test_grab_seeks_beyond_keyframe_interval(self):
+        grab = list(FrameSampler(self.video_path, 'second', 'grab', keyframe_interval=2))
+        seek = list(FrameSampler(self.video_path, 'second', 'seek'))
+
+        assert all(np.array_equal(a, b) for (_, a), (_, b) in zip(seek, grab))
+
+    def test_by_frame(self):
+        sampler = FrameSampler(self.video_path, 'frame')
+        timestamps = [t for t, _ in sampler]
+
+        assert len(timestamps) == 40
+        assert np.isclose(timestamps[1], 100.0)
+
+    def test_auto_chooses_strategy(self):
+        assert FrameSampler(self.video_path, 'second').choose_strategy() in ('grab', 'seek')
+
+    def test_sample_range(self):
+        full = list(FrameSampler(self.video_path, 'second', 'grab'))
+        part = list(FrameSampler(self.video_path, 'second', 'grab', start=1, end=3))
+
+        assert [t for t, _ in part] == [1000.0, 2000.0]
+        assert all(np.array_equal(a, b) for (_, a), (_, b) in zip(full[1:3], part))
@@ -0,0 +1,41 @@
+import os
+import tempfile
+from tests import base_test
+from src.models.gallery import list_thumbnails, GalleryManifest
+
+
+class TestGallery(base_test.BaseComponentTest):
+
+    def test_list_thumbnails(self):
+        with tempfile.TemporaryDirectory() as directory:
+            for entity, files in [('Q1_Ada_Lovelace', ['a.jpg', 'b.png', 'notes.txt']), ('Q2_Alan_Turing', ['c.jpg'])]:
+                os.makedirs(os.path.join(directory, entity))
+                for file in files:
+                    open(os.path.join(directory, entity, file), 'w').close()
+            open(os.path.join(directory, 'README.md'), 'w').close()
+
+            thumbnails = list_thumbnails(directory, ['Q1_Ada_Lovelace', 'Q2_Alan_Turing', 'README.md'])
+
+            assert sorted((label, os.path.basename(path)) for label, path in thumbnails) == [
+                ('Q1 Ada Lovelace', 'a.jpg'), ('Q1 Ada Lovelace', 'b.png'), ('Q2 Alan Turing', 'c.jpg')]
+            assert len(list_thumbnails(directory)) == 3
+
+    def test_manifest_diff(self):
+        with tempfile.TemporaryDirectory() as directory:
+            paths = [os.path.join(directory, f'{name}.jpg') for name in ['a', 'b', 'c']]
+            for path in paths:
+                with open(path, 'w') as f:
+                    f.write(path)
+            manifest = GalleryManifest(os.path.join(directory, 'manifest.json'))
+            delta, removed, files = manifest.diff([('A', paths[0]), ('B', paths[1]), ('C', paths[2])])
+            assert len(delta) == 3 and removed == set()
+            manifest.save(files, paths[:2])
+
+            with open(paths[1], 'w') as f:
+                f.write('changed')
+            os.utime(paths[2], (1, 1))
+            os.remove(paths[0])
+            delta, removed, _ = GalleryManifest(manifest.path).diff([('B', paths[1]), ('C', paths[2])])
+
+            assert delta == [('B', paths[1])]
+            assert removed == {paths[0], paths[1]}
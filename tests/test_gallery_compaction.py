@@ -0,0 +1,44 @@
+import numpy as np
+from tests import base_test
+from src.models.gallery_compaction import compact_entity, compact_gallery, evaluate_compaction
+
+
+class TestGalleryCompaction(base_test.BaseComponentTest):
+
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        self.looks = rng.normal(size=(2, 32)).astype(np.float32)
+        # two looks of one entity, each with near-duplicate thumbnails
+        self.embeddings = np.repeat(self.looks, 5, axis=0) + rng.normal(0, 0.01, (10, 32)).astype(np.float32)
+
+    def test_compact_entity(self):
+        prototypes = compact_entity(self.embeddings, prototypes=3, distance=0.05)
+
+        assert len(prototypes) == 2
+        assert np.allclose(np.linalg.norm(prototypes, axis=1), 1, atol=1e-5)
+        looks = self.looks / np.linalg.norm(self.looks, axis=1, keepdims=True)
+        assert np.sort((prototypes @ looks.T).max(axis=0)).min() > 0.99
+
+        assert len(compact_entity(self.embeddings, prototypes=1, distance=0.05)) == 1
+        assert len(compact_entity(self.embeddings, prototypes=20, distance=0)) == 10
+
+    def test_compact_gallery(self):
+        labels = ['b'] * 10 + ['a'] * 10
+        embeddings = np.concatenate([self.embeddings, -self.embeddings])
+
+        compact_labels, compact = compact_gallery(labels, embeddings, prototypes=3, distance=0.05)
+
+        assert compact_labels == ['b', 'b', 'a', 'a']
+        assert compact.shape == (4, 32)
+        assert compact_gallery([], np.zeros((0, 32)))[0] == []
+
+    def test_evaluate_compaction(self):
+        rng = np.random.default_rng(1)
+        centers = rng.normal(size=(20, 32)).astype(np.float32)
+        labels = [f'entity {i}' for i in range(20) for _ in range(8)]
+        embeddings = np.repeat(centers, 8, axis=0) + rng.normal(0, 0.1, (160, 32)).astype(np.float32)
+
+        report = evaluate_compaction(labels, embeddings, prototypes=2, distance=0.1, backend='exact')
+
+        assert report['queries'] == 20 and report['rows'] == 140 and report['compact_rows'] <= 40
+        assert report['accuracy'] == report['compact_accuracy'] == 1.0
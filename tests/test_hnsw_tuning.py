@@ -0,0 +1,30 @@
+import os
+import tempfile
+import yaml
+from tests import base_test
+from src.models.hnsw_tuning import sweep_hnsw, select_hnsw_config, write_hnsw_config
+from src.models.vector_search import create_synthetic_gallery
+
+
+class TestHnswTuning(base_test.BaseComponentTest):
+
+    def test_sweep_hnsw(self):
+        gallery, _ = create_synthetic_gallery(size=2000, dim=32, entities=200)
+
+        results = sweep_hnsw(gallery, ms=(4, 16), ef_constructions=(50,), ef_searches=(1, 100), queries=100)
+
+        assert len(results) == 4
+        assert (results['index_bytes'] > 0).all() and results['recall@1'].between(0, 1).all()
+        assert results[results['M'] == 16]['recall@1'].max() >= results[results['M'] == 4]['recall@1'].min()
+
+        best = select_hnsw_config(results, min_recall=0)
+        assert best['p99_ms'] == results['p99_ms'].min()
+        best = select_hnsw_config(results, min_recall=1.1)
+        assert best['recall@1'] == results['recall@1'].max()
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'hnsw.yaml')
+            write_hnsw_config(best, path)
+            with open(path) as f:
+                config = yaml.safe_load(f)['face-recognition']
+        assert config['index-params']['M'] == best['M'] and config['query-params']['efSearch'] == best['efSearch']
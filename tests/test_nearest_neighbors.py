@@ -0,0 +1,36 @@
+import numpy as np
+from tests import base_test
+from src.models.nearest_neighbors import cosine_nearest_neighbors, normalize
+
+
+class TestNearestNeighbors(base_test.BaseComponentTest):
+
+    def test_equals_brute_force_with_chunks(self):
+        rng = np.random.default_rng(0)
+        gallery = rng.normal(size=(500, 16)).astype(np.float32)
+        queries = rng.normal(size=(20, 16)).astype(np.float32)
+        distances = 1 - (queries @ gallery.T) / np.outer(np.linalg.norm(queries, axis=1),
+                                                         np.linalg.norm(gallery, axis=1))
+
+        for chunk_size in [500, 64, 7]:
+            for normalized, embeddings in [(False, gallery), (True, normalize(gallery, chunk_size))]:
+                indices, nearest = cosine_nearest_neighbors(queries, embeddings, normalized, chunk_size)
+
+                assert np.array_equal(indices, np.argmin(distances, axis=1))
+                assert np.allclose(nearest, distances.min(axis=1), atol=1e-5)
+
+    def test_empty_gallery(self):
+        indices, distances = cosine_nearest_neighbors(np.ones((2, 4)), np.zeros((0, 4)))
+
+        assert len(indices) == 2
+        assert np.all(np.isinf(distances))
+
+    def test_zero_embeddings(self):
+        gallery = np.array([[0, 0, 0], [1, 0, 0], [0, 1, 0]], dtype=np.float32)
+        queries = np.array([[0, 0, 0], [0, 2, 0]], dtype=np.float32)
+
+        indices, distances = cosine_nearest_neighbors(queries, gallery)
+
+        # a zero query matches nothing, a zero gallery embedding is never the nearest one
+        assert not np.any(np.isnan(distances))
+        assert distances[0] == 1 and indices[1] == 2 and np.isclose(distances[1], 0)
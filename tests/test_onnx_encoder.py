@@ -0,0 +1,35 @@
+import os
+import tempfile
+import unittest
+import numpy as np
+from tests import base_test
+from src.models.onnx_encoder import OnnxEncoder, export_encoder, cosine_agreement, get_onnx_path
+
+try:
+    import tf2onnx
+    import onnxruntime
+except ImportError:
+    tf2onnx = onnxruntime = None
+
+
+@unittest.skipIf(tf2onnx is None or onnxruntime is None, 'requires tf2onnx and onnxruntime')
+class TestOnnxEncoder(base_test.BaseComponentTest):
+
+    def test_parity(self):
+        from tensorflow import keras
+
+        model = keras.Sequential([keras.layers.Input((32, 32, 3)),
+                                  keras.layers.Conv2D(16, 3, activation='relu'),
+                                  keras.layers.GlobalAveragePooling2D(),
+                                  keras.layers.Dense(64)])
+        faces = np.random.default_rng(0).random((8, 32, 32, 3), dtype=np.float32)
+        reference = model.predict(faces, verbose=0)
+
+        with tempfile.TemporaryDirectory() as directory:
+            for backend, min_cosine in [('onnx', 0.9999), ('onnx-int8', 0.99)]:
+                path = export_encoder(model, get_onnx_path(directory, 'Test', backend), quantize=backend == 'onnx-int8')
+                encoder = OnnxEncoder(path)
+
+                assert encoder.target == (32, 32)
+                assert cosine_agreement(encoder.predict(faces), reference).min() > min_cosine
+            assert sorted(os.listdir(directory)) == ['Test_onnx.onnx', 'Test_onnx_int8.onnx']
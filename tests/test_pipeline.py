@@ -0,0 +1,36 @@
+from tests import base_test
+from src.utils.pipeline import Pipeline
+
+
+class TestPipeline(base_test.BaseComponentTest):
+
+    def test_order_and_statistics(self):
+        pipeline = Pipeline([('double', lambda x: x * 2), ('increment', lambda x: x + 1)], queue_size=1)
+
+        results = list(pipeline.run(range(20)))
+        statistics = pipeline.get_statistics()
+
+        assert results == [x * 2 + 1 for x in range(20)]
+        assert statistics['double']['items'] == 20
+        assert statistics['increment']['units'] == 20
+        assert statistics['source']['max_queue_depth'] == 0
+
+    def test_stage_errors_are_raised(self):
+        def fail(x):
+            if x == 3:
+                raise ValueError('stage failed')
+            return x
+
+        pipeline = Pipeline([('fail', fail)])
+
+        with self.assertRaises(ValueError):
+            list(pipeline.run(range(10)))
+
+    def test_early_stop(self):
+        pipeline = Pipeline([('identity', lambda x: x)])
+
+        for x in pipeline.run(range(1000)):
+            if x == 5:
+                break
+
+        assert pipeline.get_statistics()['identity']['items'] < 1000
@@ -1,5 +1,5 @@
 from tests import base_test
-from src.postprocessing.graph_postprocessing import extract_scenes, Scene
+from src.postprocessing.graph_postprocessing import extract_scenes, Scene, SceneExtractor
 
 PREDICTIONS = [['Ali', 'Bo'], ['Ali', 'Bo'], ['Bo', 'Ali'], ['Bo', 'Ali'],
                ['Bo', 'Ali'], ['Bo'], ['Bo'], ['Bo'], ['Bo']]
@@ -38,3 +38,12 @@ class TestSceneExtraction(base_test.BaseComponentTest):
         scenes = extract_scenes(PREDICTIONS_2, TIMESTAMPS, frame_threshold=3)
 
         assert repr(expected_scenes) == repr(scenes)
+
+    def test_streaming_extraction(self):
+        extractor = SceneExtractor(frame_threshold=3)
+
+        closed = [repr(extractor.update(prediction, timestamp)) for prediction, timestamp in zip(PREDICTIONS, TIMESTAMPS)]
+        remaining = extractor.finish()
+
+        assert closed[7] == repr([Scene(['Ali', 'Bo']).set_start(1).set_end(6)])
+        assert repr(remaining) == repr([Scene(['Bo']).set_start(6).set_end(9)])
@@ -0,0 +1,44 @@
+from tests import base_test
+from src.models.sharding import split_samples, merge_shards
+
+
+def _recognize(first, end, sample_count):
+    """ Simulates the results of a worker for the samples from first to end """
+    end = sample_count if end is None else end
+    return [(index, index * 1000.0, [f'entity {index}'], []) for index in range(first, end)]
+
+
+class TestSharding(base_test.BaseComponentTest):
+
+    def test_ranges_cover_every_sample_once(self):
+        ranges = split_samples(10, 3)
+
+        assert ranges == [(0, 0, 3), (3, 3, 7), (7, 7, None)]
+
+    def test_overlap_warm_up(self):
+        ranges = split_samples(10, 3, overlap=2)
+
+        assert ranges == [(0, 0, 3), (1, 3, 7), (5, 7, None)]
+
+    def test_more_shards_than_samples(self):
+        assert split_samples(2, 8) == [(0, 0, 1), (1, 1, None)]
+        assert split_samples(0, 4) == [(0, 0, None)]
+
+    def test_merge_equals_serial_results(self):
+        serial = _recognize(0, None, 23)
+
+        for overlap in [0, 1, 5]:
+            shards = [(start, end, _recognize(first, end, 23)) for first, start, end in split_samples(23, 4, overlap)]
+
+            assert merge_shards(reversed(shards)) == serial
+
+    def test_merge_drops_warm_up_samples(self):
+        shards = [(0, 2, [(0, 0.0, ['a'], []), (1, 1000.0, ['b'], [])]),
+                  (2, None, [(1, 1000.0, ['wrong'], []), (2, 2000.0, ['c'], [])])]
+
+        assert [result[2] for result in merge_shards(shards)] == [['a'], ['b'], ['c']]
+
+    def test_samples_beyond_reported_length(self):
+        shards = [(start, end, _recognize(first, end, 12)) for first, start, end in split_samples(10, 2, 1)]
+
+        assert len(merge_shards(shards)) == 12
@@ -0,0 +1,18 @@
+from tests import base_test
+from src.utils.utils import benchmark_startup, parse_importtime
+
+
+class TestStartup(base_test.BaseComponentTest):
+
+    def test_parse_importtime(self):
+        output = ('import time: self [us] | cumulative | imported package\n'
+                  'import time:       100 |        100 |   json.decoder\n'
+                  'import time:       200 |        300 | json\n')
+
+        assert parse_importtime(output) == [('json.decoder', 1, 0.0001), ('json', 0, 0.0003)]
+
+    def test_search_startup(self):
+        results = benchmark_startup('cli.py search --help', runs=1)
+
+        assert results['heavy_imports'] == []
+        assert results['slowest_imports'][0][0] == 'src.hunter'
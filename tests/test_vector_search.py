@@ -0,0 +1,77 @@
+import os
+import tempfile
+import unittest
+import importlib.util
+import numpy as np
+from tests import base_test
+from src.models.vector_search import BACKENDS, ExactBackend, QuantizedBackend, benchmark_backends, create_backend, \
+    create_synthetic_gallery, get_distances, recall_at_k
+
+
+class TestVectorSearch(base_test.BaseComponentTest):
+
+    def setUp(self):
+        self.gallery, self.queries = create_synthetic_gallery(size=2000, dim=32, entities=100, queries=50)
+
+    def test_exact_backend(self):
+        neighbors, distances = ExactBackend(chunk_size=300).fit(self.gallery).query_batch(self.queries, k=5)
+
+        gallery = self.gallery / np.linalg.norm(self.gallery, axis=1, keepdims=True)
+        queries = self.queries / np.linalg.norm(self.queries, axis=1, keepdims=True)
+        expected = np.argsort(1 - queries @ gallery.T, axis=1)[:, :5]
+        assert np.array_equal(neighbors, expected)
+        assert np.all(np.diff(distances, axis=1) >= 0)
+
+        neighbors, distances = ExactBackend().fit(self.gallery[:3]).query_batch(self.queries, k=5)
+        assert np.all(neighbors[:, 3:] == -1) and np.all(np.isinf(distances[:, 3:]))
+
+    def _check_backend_agrees(self, name):
+        exact_neighbors, exact_distances = ExactBackend().fit(self.gallery).query_batch(self.queries, k=1)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, name)
+            create_backend(name).fit(self.gallery).save(path)
+            neighbors, distances = create_backend(name).load(path, self.gallery).query_batch(self.queries, k=1)
+
+        assert np.mean(neighbors == exact_neighbors) > 0.9
+        assert np.allclose(distances[neighbors == exact_neighbors],
+                           exact_distances[neighbors == exact_neighbors], atol=1e-4)
+
+    def test_backends_agree(self):
+        self._check_backend_agrees('nmslib')
+
+    @unittest.skipIf(importlib.util.find_spec('hnswlib') is None, 'requires hnswlib')
+    def test_hnswlib_agrees(self):
+        self._check_backend_agrees('hnswlib')
+
+    @unittest.skipIf(importlib.util.find_spec('faiss') is None, 'requires faiss')
+    def test_faiss_agrees(self):
+        self._check_backend_agrees('faiss')
+
+    def test_quantized_backend(self):
+        for space in ['cosinesimil', 'l2']:
+            exact_neighbors, exact_distances = ExactBackend(space).fit(self.gallery).query_batch(self.queries, k=5)
+            backend = QuantizedBackend(space, chunk_size=300, rerank=4).fit(self.gallery)
+
+            neighbors, distances = backend.query_batch(self.queries, k=5)
+            assert np.mean(neighbors == exact_neighbors) > 0.95
+            assert np.allclose(distances[neighbors == exact_neighbors], exact_distances[neighbors == exact_neighbors],
+                               atol=1e-4)
+            assert backend.get_memory() < self.gallery.nbytes / 3
+
+    def test_recall_counts_duplicates(self):
+        gallery = np.concatenate([self.gallery, self.gallery[:1]])
+        exact_neighbors, exact_distances = ExactBackend().fit(gallery).query_batch(gallery[:1], k=1)
+
+        duplicate = np.array([[len(gallery) - 1 if exact_neighbors[0, 0] == 0 else 0]])
+        assert recall_at_k(get_distances(gallery, gallery[:1], duplicate), exact_distances, 1) == 1.0
+        assert recall_at_k(get_distances(gallery, gallery[:1], np.array([[5]])), exact_distances, 1) == 0.0
+
+    def test_benchmark_backends(self):
+        results = benchmark_backends(k=5, size=2000)
+
+        # the optional backends are only benchmarked if their modules are installed
+        missing = {name for name in ['hnswlib', 'faiss'] if importlib.util.find_spec(name) is None}
+        assert set(results) == set(BACKENDS) - missing
+        for name, result in results.items():
+            assert result['index_bytes'] > 0 and result['p50_ms'] <= result['p99_ms']
+            assert result['recall@5'] > 0.8, name